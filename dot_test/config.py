@@ -0,0 +1,113 @@
+# Mnemosyne configuration file.
+
+# This file contains settings which we deem to be too specialised to be
+# accesible from the GUI. However, if you use some of these settings, feel
+# free to inform the developers so that it can be re-evaluated if these
+# settings need to be exposed in the GUI.
+
+# Science server. Only change when prompted by the developers.
+science_server = "mnemosyne-proj.dyndns.org:80"
+
+# Set to True to prevent you from accidentally revealing the answer when
+# clicking the edit button.
+only_editable_when_answer_shown = False
+
+# Set to False if you don't want the tag names to be shown in the review
+# window.
+show_tags_during_review = True
+
+# The number of daily backups to keep. Set to -1 for no limit.
+max_backups = 10
+
+# Store backups incrementally: the database is split in chunks, and only the
+# chunks which changed since a previous backup are compressed and written to
+# disk. Such a backup consists of a '.manifest' file together with the
+# 'chunks' directory next to it.
+incremental_backups = False
+
+# Keep the log of all reviews and edits in a separate file next to the
+# database (e.g. 'default.db-log'), such that backups, syncing the entire
+# database and defragmenting no longer need to handle all of this history
+# each time. The database gets converted the next time it is loaded.
+separate_log_database = False
+
+# Let the log refer to cards, facts, ... through integers instead of through
+# their ids, with a separate table to look up the ids. This makes the log
+# and its indices smaller and speeds up the queries which join it to the
+# cards, which matters once the log has millions of entries. The database
+# gets converted the next time it is loaded.
+intern_log_object_ids = False
+
+# Don't render the plain text question and answer stored for each card
+# (e.g. for the card browser) when adding or editing it, but catch up on
+# this in the background, or whenever they are needed. This speeds up
+# editing facts with many cards, changing card types and syncing.
+defer_pregenerated_data = False
+
+# Keep the scheduling data of the active cards in memory, such that
+# building the queue of cards to review does not need to query the
+# database. This uses NumPy if it is installed.
+in_memory_due_index = False
+
+# Read the data for the next batch of cards to review in a background
+# thread, while the current ones are being reviewed, such that there is no
+# pause when the scheduler needs to rebuild its queue. This requires
+# 'write_ahead_log' and does not apply when the cards are randomised.
+background_queue_rebuild = False
+
+# The number of cards, facts and tags each which are kept in memory to
+# speed up database access. Set to 0 to disable.
+object_cache_size = 1000
+
+# The Python module used to talk to SQLite, either "sqlite3" (from the
+# standard library) or "apsw", which is somewhat faster. Falls back on
+# "sqlite3" if "apsw" is not installed.
+database_driver = "sqlite3"
+
+# Open the database with a write-ahead log, such that other threads (web
+# server, sync server, statistics) can read it while reviewing continues,
+# instead of waiting for the main connection. Does not apply to the "apsw"
+# driver.
+write_ahead_log = False
+
+# Keep track of how long each database statement takes, and log the ones
+# slower than 'slow_statement_threshold' seconds together with their query
+# plan. The results are written to 'statement_statistics.json' in the data
+# directory when the database is closed. Only works with the "sqlite3"
+# driver.
+profile_database_statements = False
+slow_statement_threshold = 0.1
+
+# Start the card browser with the last used colum sort. Could have a
+# performance penalty for large databases.
+start_card_browser_sorted = True
+
+# The moment the new day starts. Defaults to 3 am. Could be useful to change
+# if you are a night bird. You can only set the hours, not minutes, and
+# midnight corresponds to 0.
+day_starts_at = 3
+
+# On mobile clients with slow SD cards copying a large database for the backup
+# before sync can take longer than the sync itself, so we offer reckless users
+# the possibility to skip this.
+backup_before_sync = True
+
+# Latex preamble. Note that for the pre- and postamble you need to use double
+# slashes instead of single slashes here, to have them escaped when Python
+# reads them in.
+latex_preamble = "\\documentclass[12pt]{article}\n\\pagestyle{empty}\n\\begin{document}"
+
+# Latex postamble.
+latex_postamble = "\\end{document}"
+
+# Latex command.
+latex = "latex -interaction=nonstopmode"
+
+# Latex dvipng command.
+dvipng = "dvipng -D 200 -T tight tmp.dvi"
+
+# Put an upper limit on the scheduled interval. Does not work retroactively, only for new reviews.
+# Should be set on each device, including mobile clients. Be careful with this setting: if you
+# accidentally set it e.g. to 1 day, you will mess up your schedule completely.
+max_scheduled_interval_days = None
+
@@ -0,0 +1,23 @@
+#
+# search_cards.py <Peter.Bienstman@gmail.com>
+#
+
+# Usage: search_cards.py <search string>
+#        search_cards.py --rebuild-index
+
+import sys
+from mnemosyne.script import Mnemosyne
+
+# 'data_dir = None' will use the default system location, edit as appropriate.
+data_dir = None
+mnemosyne = Mnemosyne(data_dir)
+db = mnemosyne.database()
+
+if sys.argv[1] == "--rebuild-index":
+    db.rebuild_search_index()
+    db.save()
+else:
+    for _card_id in db.search_cards(sys.argv[1], limit=100):
+        card = db.card(_card_id, is_id_internal=True)
+        print((card.question("plain_text"), card.answer("plain_text")))
+mnemosyne.finalise()
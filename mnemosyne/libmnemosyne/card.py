@@ -48,11 +48,14 @@ class Card(CompareOnId):
 
     """
 
-    def __init__(self, card_type, fact, fact_view, creation_time=None):
+    def __init__(self, card_type, fact, fact_view, creation_time=None,
+                 id=None):
         self.card_type = card_type
         self.fact = fact
         self.fact_view = fact_view
-        self.id = rand_uuid()
+        if id is None:
+            id = rand_uuid()
+        self.id = id
         self._id = None
         if creation_time is None:
             creation_time = int(time.time())
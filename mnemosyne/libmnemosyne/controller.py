@@ -41,6 +41,12 @@ class Controller(Component):
             tag_names, check_for_duplicates=True, save=True):
         raise NotImplementedError
 
+    def create_new_cards_bulk(self, new_cards, grade, save=True):
+        raise NotImplementedError
+
+    def new_cards_bulk(self, new_cards, tags_for_tag_names=None):
+        raise NotImplementedError
+
     def show_edit_card_dialog(self):
         raise NotImplementedError
 
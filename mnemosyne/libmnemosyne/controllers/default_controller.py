@@ -63,7 +63,8 @@ class DefaultController(Controller):
                     # Make sure we don't continue if e.g. the GUI or another
                     # thread holds the database.
                     return
-                self.database().backup()
+                # Don't keep the user waiting for the copy.
+                self.database().backup(background=True)
                 self.log().saved_database()
                 self.log().loaded_database()
                 self.log().future_schedule()
@@ -78,6 +79,13 @@ class DefaultController(Controller):
             if abs(next_rollover - previous_rollover) < HOUR:
                 next_rollover += DAY
             self.next_rollover = next_rollover
+        # Finish a backup which was made in the background.
+        elif self.database() and self.database().is_loaded():
+            self.database().wait_for_backup(block=False)
+            # Catch up on the question and answer of cards which were added
+            # or edited with 'defer_pregenerated_data' set, a few at a time
+            # to keep the GUI responsive.
+            self.database().regenerate_pregenerated_data(limit=100)
         if db_maintenance and \
            (time.time() > self.config()["last_db_maintenance"] + 90 * DAY):
             self.component_manager.current("database_maintenance").run()
@@ -247,6 +255,57 @@ class DefaultController(Controller):
             db.save()
         return cards
 
+    def create_new_cards_bulk(self, new_cards, grade, save=True):
+
+        """Bulk version of 'create_new_cards' for importers, without checking
+        for duplicates. 'new_cards' is a list of (fact_data, card_type,
+        tag_names) tuples. Returns a list with the sister cards for each of
+        these.
+
+        """
+
+        assert grade in [-1, 2, 3, 4, 5] # Use -1 for yet to learn cards.
+        db = self.database()
+        facts, sister_cards = self.new_cards_bulk(new_cards)
+        db.add_facts_and_cards_bulk(facts,
+            [card for _cards in sister_cards for card in _cards])
+        if grade >= 2:
+            for _cards in sister_cards:
+                self.scheduler().set_initial_grade(_cards, grade)
+                for card in _cards:
+                    db.update_card(card, repetition_only=True)
+        if save:
+            db.save()
+        return sister_cards
+
+    def new_cards_bulk(self, new_cards, tags_for_tag_names=None):
+
+        """Construct the facts and sister cards for 'new_cards' like
+        'create_new_cards_bulk', but without storing them, such that e.g. an
+        importer can still set their ids and learning data before passing
+        them to 'add_facts_and_cards_bulk'. Returns the list of facts and a
+        list with the sister cards for each of these. 'tags_for_tag_names'
+        can be used to share the tags between several calls.
+
+        """
+
+        db = self.database()
+        if tags_for_tag_names is None:
+            tags_for_tag_names = {}
+        facts, sister_cards = [], []
+        for fact_data, card_type, tag_names in new_cards:
+            assert card_type.is_fact_data_valid(fact_data)
+            key = tuple(tag_names)
+            if key not in tags_for_tag_names:
+                tags_for_tag_names[key] = db.get_or_create_tags_with_names(\
+                    self._retain_only_child_tags(tag_names))
+            fact = Fact(fact_data)
+            facts.append(fact)
+            sister_cards.append(card_type.create_sister_cards(fact))
+            for card in sister_cards[-1]:
+                card.tags = set(tags_for_tag_names[key])
+        return facts, sister_cards
+
     def show_edit_card_dialog(self):
         self.stopwatch().pause()
         self.flush_sync_server()
@@ -530,24 +589,12 @@ _("This will add a tag 'Starred' to the current card, so that you can find it ba
         w = self.main_widget()
         if progress_bar:
             w.set_progress_text(_("Deleting cards..."))
-            w.set_progress_range(len(facts))
-            w.set_progress_update_interval(50)
-        for fact in facts:
-            for card in db.cards_from_fact(fact):
-                self.scheduler().remove_from_queue_if_present(card)
-                db.delete_card(card, check_for_unused_tags=False)
-            db.delete_fact(fact)
-            if progress_bar:
-                w.increase_progress(1)
-        tags = db.tags()
+            # The facts are deleted in one go, so there is only one step.
+            w.set_progress_range(1)
+        for card in db.delete_facts_bulk(facts):
+            self.scheduler().remove_from_queue_if_present(card)
         if progress_bar:
-            w.set_progress_text(_("Checking for unused tags..."))
-            w.set_progress_range(len(tags))
-        tags = db.tags()
-        for tag in tags:
-            db.delete_tag_if_unused(tag)
-            if progress_bar:
-                w.increase_progress(1)
+            w.increase_progress(1)
         db.save()
         if progress_bar:
             w.close_progress()
@@ -698,7 +745,8 @@ _("It is recommended to put all your cards in a single database. Using tags to d
         data_dir = self.config().data_dir
         old_path = expand_path(self.config()["last_database"], data_dir)
         filename = self.main_widget().get_filename_to_open(path=old_path,
-            filter=_("Mnemosyne databases") + " (*%s)" % db.suffix)
+            filter=_("Mnemosyne databases") + " (*%s *%s)" % \
+            (db.suffix, db.backup_manifest_suffix))
         if not filename:
             self.stopwatch().unpause()
             return
@@ -713,7 +761,8 @@ _("'*.cards' files are not separate databases, but need to be imported in your c
                 _("The configuration database is not used to store cards."))
             return
         if os.path.normpath(filename).startswith(\
-            os.path.normpath(os.path.join(data_dir, "backups"))):
+            os.path.normpath(os.path.join(data_dir, "backups"))) or \
+            filename.endswith(db.backup_manifest_suffix):
             result = self.main_widget().show_question(\
                 _("Do you want to replace your current database with one restored from this backup?\nNote that this will result in conflicts during the next sync, which need to be resolved by a full sync."),
                 _("Yes"), _("No"), "")
@@ -721,7 +770,12 @@ _("'*.cards' files are not separate databases, but need to be imported in your c
                 # Note that we don't save the current database first in this
                 # case, as the user wants to throw it away. This mainly
                 # prohibits dumping to the science log.
-                db.restore(filename)
+                try:
+                    db.restore(filename)
+                except RuntimeError as error:
+                    self.main_widget().show_error(str(error))
+                    self.stopwatch().unpause()
+                    return
                 self.reset_study_mode()
                 self.update_title()
             self.stopwatch().unpause()
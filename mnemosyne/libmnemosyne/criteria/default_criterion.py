@@ -3,6 +3,7 @@
 #
 
 from mnemosyne.libmnemosyne.criterion import Criterion
+from mnemosyne.libmnemosyne.utils import encode_data, decode_data
 
 
 class DefaultCriterion(Criterion):
@@ -88,12 +89,12 @@ class DefaultCriterion(Criterion):
                 (card_type.id, fact_view.id))
 
     def data_to_string(self):
-        return repr((self.deactivated_card_type_fact_view_ids,
-                     self._tag_ids_active,
-                     self._tag_ids_forbidden))
+        return encode_data((self.deactivated_card_type_fact_view_ids,
+                            self._tag_ids_active,
+                            self._tag_ids_forbidden))
 
     def set_data_from_string(self, data_string):
-        data = eval(data_string)
+        data = decode_data(data_string)
         self.deactivated_card_type_fact_view_ids = data[0]
         self._tag_ids_active = data[1]
         self._tag_ids_forbidden = data[2]
@@ -113,7 +114,7 @@ class DefaultCriterion(Criterion):
                      active_tag_ids, forbidden_tag_ids))
 
     def set_data_from_sync_string(self, data_string):
-        data = eval(data_string)
+        data = decode_data(data_string)
         self.deactivated_card_type_fact_view_ids = data[0]
         active_tag_ids = data[1]
         forbidden_tag_ids = data[2]
@@ -121,3 +121,13 @@ class CriterionApplier(Component):
     def apply_to_database(self, criterion):
         raise NotImplementedError
 
+    def apply_to_cards_with_internal_ids(self, criterion, _card_ids):
+
+        """Only update the cards with internal ids '_card_ids', e.g. after
+        they got tagged. By default, we just apply the criterion to the entire
+        database.
+
+        """
+
+        self.apply_to_database(criterion)
+
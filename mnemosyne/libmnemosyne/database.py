@@ -140,12 +140,25 @@ class Database(Component):
     def fact(self, id, is_id_internal):
         raise NotImplementedError
 
+    def facts_with_internal_ids(self, _fact_ids):
+        raise NotImplementedError
+
     def update_fact(self, fact):
         raise NotImplementedError
 
     def delete_fact(self, fact):
         raise NotImplementedError
 
+    def delete_facts_bulk(self, facts):
+
+        """Delete 'facts' together with their cards, and the tags which are
+        no longer used afterwards, using a fixed number of queries. Returns
+        the deleted cards.
+
+        """
+
+        raise NotImplementedError
+
     def has_fact_with_id(self, id):
         return NotImplementedError
 
@@ -154,12 +167,38 @@ class Database(Component):
     def add_card(self, card):
         raise NotImplementedError
 
+    def add_facts_and_cards_bulk(self, facts, cards):
+
+        """Add new 'facts' and 'cards' using a fixed number of queries, e.g.
+        when importing. The cards can also belong to facts which are already
+        in the database.
+
+        """
+
+        raise NotImplementedError
+
     def card(self, id, is_id_internal):
         raise NotImplementedError
 
+    def cards_with_internal_ids(self, _card_ids):
+
+        """Return a list of cards in the same order as '_card_ids', using a
+        fixed number of queries instead of several queries per card. Ids
+        which are not in the database are skipped.
+
+        """
+
+        raise NotImplementedError
+
+    def cards_with_ids(self, ids):
+        raise NotImplementedError
+
     def update_card(self, card, repetition_only=False):
         raise NotImplementedError
 
+    def update_cards(self, cards, repetition_only=False):
+        raise NotImplementedError
+
     def delete_card(self, card):
         raise NotImplementedError
 
@@ -6,6 +6,7 @@ import os
 import sys
 import time
 import string
+import hashlib
 import datetime
 import copy as objcopy
 
@@ -21,6 +22,8 @@ from mnemosyne.libmnemosyne.fact_view import FactView
 from mnemosyne.libmnemosyne.utils import traceback_string, copy
 from mnemosyne.libmnemosyne.utils import expand_path, contract_path
 from mnemosyne.libmnemosyne.utils import numeric_string_cmp_key, mangle
+from mnemosyne.libmnemosyne.utils import encode_data, decode_data_with_version
+from mnemosyne.libmnemosyne.utils import DATA_CODEC_VERSION
 
 # All ids beginning with an underscore refer to primary keys in the SQL
 # database. All other id's correspond to the id's used in libmnemosyne.
@@ -50,6 +53,17 @@ SCHEMA = string.Template("""
 
     create index i_data_for_fact on data_for_fact (_fact_id);
 
+    /* Hashes of the key and value of the fact data, such that looking for
+    duplicates does not require scanning data_for_fact. */
+
+    create table data_hashes_for_fact(
+        _fact_id integer,
+        key text,
+        hash integer
+    );
+    create index i_data_hashes_for_fact on data_hashes_for_fact (hash);
+    create index i_data_hashes_for_fact_2 on data_hashes_for_fact (_fact_id);
+
     create table cards(
         _id integer primary key,
         id text,
@@ -75,6 +89,10 @@ $pregenerated_data
     create index i_cards on cards (id);
     create index i_cards_2 on cards (fact_view_id); /* for card type tree */
     create index i_cards_3 on cards (_fact_id); /* for cards_from_fact */
+    /* The next two are for the scheduler, see 'test_query_plans'. */
+    create index i_cards_4 on cards (grade, lapses) where active=1;
+    create index i_cards_5 on cards (next_rep, ret_reps_since_lapse, _fact_id)
+        where active=1 and grade>=2;
 
     create table tags(
         _id integer primary key,
@@ -202,11 +220,22 @@ pregenerated_data = """
 from mnemosyne.libmnemosyne.databases.SQLite_sync import SQLiteSync
 from mnemosyne.libmnemosyne.databases.SQLite_media import SQLiteMedia
 from mnemosyne.libmnemosyne.databases.SQLite_logging import SQLiteLogging
+from mnemosyne.libmnemosyne.databases.SQLite_backup import SQLiteBackup
+from mnemosyne.libmnemosyne.databases.SQLite_search import SQLiteSearch
+from mnemosyne.libmnemosyne.databases.SQLite_log_database import \
+     SQLiteLogDatabase, LOG_DATABASE_SUFFIX
 from mnemosyne.libmnemosyne.databases.SQLite_statistics import SQLiteStatistics
+from mnemosyne.libmnemosyne.databases.SQLite_object_cache import \
+     SQLiteObjectCache
+from mnemosyne.libmnemosyne.databases.SQLite_pregenerated_data import \
+     SQLitePregeneratedData
+from mnemosyne.libmnemosyne.databases.SQLite_due_index import SQLiteDueIndex
 
 
 class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
-             SQLiteStatistics):
+             SQLiteStatistics, SQLiteObjectCache, SQLiteSearch,
+             SQLiteBackup, SQLiteLogDatabase, SQLitePregeneratedData,
+             SQLiteDueIndex):
 
     """Note that most of the time, commiting is done elsewhere, e.g. by
     calling save in the main controller, in order to have a better control
@@ -220,12 +249,16 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
 
     """
 
-    version = "4"
+    version = "6"
     suffix = ".db"
     store_pregenerated_data = True
+    # Number of free pages given back to the file system in each step of
+    # 'defragment'.
+    vacuum_pages_per_step = 1024
 
     def __init__(self, component_manager):
         Database.__init__(self, component_manager)
+        SQLiteObjectCache.__init__(self)
         self._connection = None
         self._path = None # Needed for lazy creation of connection.
         self._current_criterion = None # Cached for performance reasons.
@@ -240,6 +273,17 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
         # effects to be disabled/enabled.
         self.importing = False
         self.importing_with_learning_data = False
+        # Cards fetched in bulk while streaming log entries, see
+        # SQLiteSync._log_entries.
+        self._prefetched_cards = None
+        # Rows still in an older format of the data codec, which get
+        # rewritten at the next save, see '_decode_data'.
+        self._data_to_migrate = {}
+        # See 'statement_statistics'.
+        self._statement_statistics = None
+        # Whether the log refers to objects through integers, see
+        # 'SQLiteLogDatabase'.
+        self._interned_log = False
 
     #
     # File operations.
@@ -251,12 +295,52 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
         """Connection to the database, lazily created."""
 
         if not self._connection:
-            from mnemosyne.libmnemosyne.databases._sqlite3 import _Sqlite3
-            self._connection = _Sqlite3(self.component_manager, self._path)
-            #from mnemosyne.libmnemosyne.databases._apsw import _APSW
-            #self._connection = _APSW(self.component_manager, self._path)
+            if self.config()["database_driver"] == "apsw":
+                try:
+                    from mnemosyne.libmnemosyne.databases._apsw import _APSW
+                    self._connection = _APSW(self.component_manager,
+                        self._path)
+                    self._attach_log_database()
+                    return self._connection
+                except ImportError:
+                    pass  # Fall back on sqlite3.
+            if self.config()["write_ahead_log"]:
+                from mnemosyne.libmnemosyne.databases._sqlite3_wal \
+                     import _Sqlite3WAL
+                self._connection = _Sqlite3WAL(\
+                    self.component_manager, self._path)
+            else:
+                from mnemosyne.libmnemosyne.databases._sqlite3 \
+                     import _Sqlite3
+                self._connection = _Sqlite3(self.component_manager,
+                    self._path)
+            if self.config()["profile_database_statements"]:
+                # Keep collecting across reconnections.
+                if self._statement_statistics is None:
+                    from mnemosyne.libmnemosyne.databases.\
+                        _statement_statistics import StatementStatistics
+                    self._statement_statistics = StatementStatistics(\
+                        self.config()["slow_statement_threshold"])
+                self._connection.statement_statistics = \
+                    self._statement_statistics
+            self._attach_log_database()
         return self._connection
 
+    @property
+    def read_con(self):
+
+        """Connection for read-only queries. When using a write-ahead log,
+        threads other than the one which owns 'con' get their own read-only
+        connection, so that they can run concurrently with e.g. reviews,
+        without needing to release the main connection first.
+
+        """
+
+        return self.con.read_connection()
+
+    def allows_concurrent_reads(self):
+        return self.con.concurrent_reads
+
     def release_connection(self):
 
         """Release the connection, so that it may be recreated in a separate
@@ -264,11 +348,45 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
 
         """
 
+        self.wait_for_queue_snapshot()
         if self._connection:
             self._connection.commit()
             self._connection.close()
             self._connection = None
 
+    def statement_statistics(self):
+
+        """Returns a dictionary with the number of times each statement was
+        executed, together with the total, mean and maximum time and a
+        latency histogram, and a list of the slowest recent statements with
+        their query plans. Returns None if 'profile_database_statements' is
+        not set.
+
+        """
+
+        if self._statement_statistics is None:
+            return None
+        return self._statement_statistics.report()
+
+    def dump_statement_statistics(self, filename=None):
+
+        """Write the statement statistics in JSON format and return the name
+        of the file, or None if there is nothing to write.
+
+        """
+
+        if self._statement_statistics is None:
+            return None
+        if filename is None:
+            filename = os.path.join(self.config().data_dir,
+                "statement_statistics.json")
+        self._statement_statistics.dump(filename)
+        return filename
+
+    def reset_statement_statistics(self):
+        if self._statement_statistics is not None:
+            self._statement_statistics.reset()
+
     def path(self):
         return self._path
 
@@ -285,31 +403,71 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
             return os.path.basename(self._path).\
                 split(self.database().suffix)[0]
 
-    def defragment(self):
+    def defragment(self, progress=None, full=False):
+
+        """Clean up inconsistencies and give unused space back to the file
+        system.
+
+        Databases in incremental auto-vacuum mode do the latter in small
+        steps, each in a transaction of its own, so that other connections
+        (e.g. the web server) are not locked out for long. Otherwise, or if
+        'full' is set, a full vacuum is done, which also rebuilds the
+        database in a more compact form, and which switches older databases
+        to incremental auto-vacuum for the next time.
+
+        'progress' gets called with the number of steps done and the total
+        number of steps.
+
+        """
+
         self.main_widget().set_progress_text(_("Defragmenting database..."))
-        self.con.execute("vacuum")
         # Make sure the "Untagged" tag does not show up together with
         # different tags (not sure if bug causing this has been fixed).
         untagged = self.tag("__UNTAGGED__", is_id_internal=False)
-        for cursor in self.con.execute("select _id from cards"):
-            _card_id = cursor[0]
-            _tag_ids = [cursor2[0] for cursor2 in self.con.execute(\
-                "select _tag_id from tags_for_card where _card_id=?",
-                (_card_id, ))]
-            if len(_tag_ids) > 1 and untagged._id in _tag_ids:
-                self.con.execute(\
-                    "delete from tags_for_card where _card_id=? and _tag_id=?",
-                    (_card_id, untagged._id))
+        _card_ids = [cursor[0] for cursor in self.con.execute(\
+            """select _card_id from tags_for_card where _tag_id=? and _card_id
+            in (select _card_id from tags_for_card where _tag_id!=?)""",
+            (untagged._id, untagged._id))]
+        if _card_ids:
+            self.con.execute("""delete from tags_for_card where _tag_id=? and
+                _card_id in (%s)""" % self._internal_id_list(_card_ids),
+                (untagged._id, ))
+            self._apply_criterion(self.current_criterion(), _card_ids)
         # Make sure no orphaned card tags exist (not sure if bug causing
         # this has been fixed).
         self.con.execute("delete from tags_for_card where _card_id is null")
+        self.con.commit()
+        if full or self.con.execute("pragma auto_vacuum").fetchone()[0] != 2:
+            if progress:
+                progress(0, 1)
+            self.con.execute("pragma auto_vacuum = incremental")
+            self.con.execute("vacuum")
+            if progress:
+                progress(1, 1)
+        else:
+            free_pages = \
+                self.con.execute("pragma freelist_count").fetchone()[0]
+            steps = -(-free_pages // self.vacuum_pages_per_step)
+            self.main_widget().set_progress_range(steps)
+            for step in range(steps):
+                # Through 'execute', the pragma would only free a single
+                # page, as its statement does not get run to completion.
+                self.con.executescript("pragma incremental_vacuum(%d);" \
+                    % self.vacuum_pages_per_step)
+                self.main_widget().set_progress_value(step + 1)
+                if progress:
+                    progress(step + 1, steps)
         self.main_widget().close_progress()
 
     def new(self, path):
         self.unload()
+        self.reset_object_caches()
+        self._invalidate_due_index()
+        self._data_to_migrate = {}
         self._path = expand_path(path, self.config().data_dir)
         if os.path.exists(self._path):
             os.remove(self._path)
+        self._remove_log_database()
         self.create_media_dir_if_needed()
         # Create tables.
         if self.store_pregenerated_data:
@@ -318,6 +476,13 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
         else:
             self.con.executescript(\
                 SCHEMA.substitute(pregenerated_data=""))
+        # Allows 'defragment' to free unused pages in small steps. The table
+        # creation above already fixed the mode, so we need to vacuum, which
+        # is cheap for an empty database.
+        self.con.execute("pragma auto_vacuum = incremental")
+        self.con.execute("vacuum")
+        self._create_search_index()
+        self._create_stale_pregenerated_data_table()
         self.con.execute(\
             "insert into global_variables(key, value) values(?,?)",
             ("version", self.version))
@@ -338,6 +503,7 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
         self._current_criterion._tag_ids_active.add(tag._id)
         self.add_criterion(self._current_criterion)
         self.save()
+        self._update_log_database_layout()
 
     def load(self, path):
         if self.is_loaded():
@@ -345,6 +511,9 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
         self._path = expand_path(path, self.config().data_dir)
         if not os.path.exists(self._path):
             return self.new(path)
+        self.reset_object_caches()
+        self._invalidate_due_index()
+        self._data_to_migrate = {}
         # Check database version.
         try:
             sql_res = self.con.execute("""select value from global_variables
@@ -363,12 +532,24 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
                     from mnemosyne.libmnemosyne.upgrades.upgrade2 \
                         import Upgrade2
                     Upgrade2(self.component_manager).run()
+                if previous_version <= 4:
+                    from mnemosyne.libmnemosyne.upgrades.upgrade3 \
+                        import Upgrade3
+                    Upgrade3(self.component_manager).run()
+                if previous_version <= 5:
+                    from mnemosyne.libmnemosyne.upgrades.upgrade4 \
+                        import Upgrade4
+                    Upgrade4(self.component_manager).run()
             except:
                 raise RuntimeError(_("Database upgrade failed."))
+            self.clear_object_caches()
+        self._update_log_database_layout()
         self.create_media_dir_if_needed()
         # Upgrade.
         self.con.execute("""create index if not exists
             i_cards_3 on cards (_fact_id);""")
+        self._create_search_index()
+        self._create_stale_pregenerated_data_table()
         # Activate all the plugins needed for all the card types.
         # Sometimes corruption keeps the global_variables table intact,
         # but not the cards table...
@@ -398,13 +579,16 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
         # as we prefer to log the start of the program first.
 
     def save(self, path=None):
+        self._migrate_data()
         # Update format.
         self.con.execute("update global_variables set value=? where key=?",
             (self.version, "version"))
         # Save database and copy it to different location if needed.
         self.con.commit()
+        self._track_uncommitted_changes()
         if not path:
             return
+        self.con.checkpoint("TRUNCATE")
         dest_path = expand_path(path, self.config().data_dir)
         if dest_path != self._path:
             if sys.platform == "win32":  # pragma: no cover
@@ -414,52 +598,74 @@ class SQLite(Database, SQLiteSync, SQLiteMedia, SQLiteLogging,
                     raise RuntimeError(\
 _("Putting a database on a network drive is forbidden under Windows to avoid data corruption."))
             copy(self._path, dest_path)
+            if self.has_separate_log_database():
+                copy(self.log_database_path(),
+                     dest_path + LOG_DATABASE_SUFFIX)
             self._path = dest_path
         self.config()["last_database"] \
             = contract_path(path, self.config().data_dir)
         # We don't log every save, as that could result in an event after
         # card repetitions.
 
-    def backup(self):
+    def backup(self, background=False, progress=None):
+
+        """Returns the name of the backup file, or None if the backup failed.
+        For a backup in the background, the name is returned immediately, but
+        the backup is only finished (hooks, removing old backups, ...) in
+        'wait_for_backup'. 'progress' gets called with the number of pages
+        remaining and the total number of pages, from the thread doing the
+        copying.
+
+        """
+
+        self.wait_for_backup()
         self.save()
         if self.config()["max_backups"] == 0:
             return
         backupdir = os.path.join(self.config().data_dir, "backups")
         db_name = os.path.basename(self._path).rsplit(".", 1)[0]
+        if self.config()["incremental_backups"]:
+            suffix = self.backup_manifest_suffix
+        else:
+            suffix = ".db"
         try:
             backupfile = db_name + "-" + \
-                datetime.datetime.today().strftime("%Y%m%d-%H%M%S.db")
+                datetime.datetime.today().strftime("%Y%m%d-%H%M%S") + suffix
         except:  # Work around strange Android library bug.
             from mnemosyne.libmnemosyne.utils import rand_uuid
-            backupfile = db_name + "-" + rand_uuid() + ".db"
+            backupfile = db_name + "-" + rand_uuid() + suffix
         backupfile = os.path.join(backupdir, backupfile)
-        failed = False
-        try:
-            copy(self._path, backupfile)
-        except:
-            failed = True
-        if failed or not os.path.exists(backupfile) or \
-          not os.stat(backupfile).st_size:
-            self.main_widget().show_information(\
-                _("Warning: backup creation failed for") + " " +  backupfile)
-            return None
-        for f in self.component_manager.all("hook", "after_backup"):
-            f.run(backupfile)
-        # Only keep the last logs.
-        files = [f for f in os.listdir(backupdir) \
-                if f.startswith(db_name + "-")]
-        files.sort()
-        if len(files) > self.config()["max_backups"]:
-            surplus = len(files) - self.config()["max_backups"]
-            for file in files[0:surplus]:
-                os.remove(os.path.join(backupdir, file))
-        return backupfile
+        return self._start_backup(backupfile, background, progress)
 
     def restore(self, path):
-        self.abandon()
+
+        """'path' is either a copy of the database, or the manifest of an
+        incremental backup.
+
+        """
+
         db_path = expand_path(\
             self.config()["last_database"], self.config().data_dir)
-        copy(path, db_path)
+        # Put the database together before throwing away the current one, in
+        # case the backup turns out to be damaged.
+        if path.endswith(self.backup_manifest_suffix):
+            restored_paths = self._assemble_database(path, db_path)
+        self.abandon()
+        # Make sure no stale write-ahead log gets applied to the restored
+        # database.
+        for suffix in ["-wal", "-shm"]:
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        # The log is either in the backup of the main database, or in a
+        # separate log database next to it.
+        self._remove_log_database(db_path + LOG_DATABASE_SUFFIX)
+        if path.endswith(self.backup_manifest_suffix):
+            for tmpfile, restored_path in restored_paths:
+                os.replace(tmpfile, restored_path)
+        else:
+            copy(path, db_path)
+            if os.path.exists(path + LOG_DATABASE_SUFFIX):
+                copy(path + LOG_DATABASE_SUFFIX, db_path + LOG_DATABASE_SUFFIX)
         self.load(db_path)
         # We need to indicate that a full sync needs to happen on the next
         # sync. Unfortunately, we can't do anything about the logs that have
@@ -481,20 +687,31 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             for f in self.component_manager.all("hook", "before_unload"):
                 f.run()
             self.log().dump_to_science_log()
+            self.regenerate_pregenerated_data()
             self.backup()  # Saves too.
+            self.dump_statement_statistics()
+            self.wait_for_queue_snapshot()
             self._connection.close()
         except Exception as e:
             pass
         finally:
             self._connection = None
             self._path = None
+            self._interned_log = False
+            self.clear_object_caches()
+            self._invalidate_due_index()
         return True
 
     def abandon(self):
+        self.wait_for_backup()
+        self.wait_for_queue_snapshot()
         if self._connection:
             self._connection.close()
         self._connection = None
         self._path = None
+        self._interned_log = False
+        self.clear_object_caches()
+        self._invalidate_due_index()
 
     def is_loaded(self):
         return self._connection is not None
@@ -519,18 +736,53 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             EventTypes.ADDED_FACT_VIEW, EventTypes.ADDED_CARD_TYPE)).\
             fetchone()[0] == 0
 
-    def _repr_extra_data(self, extra_data):
-        # Use simply repr(), as pickle is overkill for a simple dictionary.
+    def _encode_extra_data(self, extra_data):
         if extra_data == {}:
             return "" # Save space.
         else:
-            return repr(extra_data)
+            return encode_data(extra_data)
 
     def _construct_extra_data(self, extra_data, obj):
         if extra_data == "":
             obj.extra_data = {}
+        elif isinstance(obj, FactView):
+            obj.extra_data = self._decode_data(extra_data,
+                "fact_views", "extra_data", "id", obj.id)
+        elif isinstance(obj, CardType):
+            obj.extra_data = self._decode_data(extra_data,
+                "card_types", "extra_data", "id", obj.id)
         else:
-            obj.extra_data = eval(extra_data)
+            if isinstance(obj, Card):
+                table = "cards"
+            elif isinstance(obj, Fact):
+                table = "facts"
+            else:
+                table = "tags"
+            obj.extra_data = self._decode_data(extra_data,
+                table, "extra_data", "_id", obj._id)
+
+    def _decode_data(self, text, table, column, key_column, key):
+
+        """Decode 'text' from the 'column' of the row of 'table' with
+        'key_column' equal to 'key'. Rows written by an older version of the
+        codec are rewritten lazily, when we save.
+
+        """
+
+        data, version = decode_data_with_version(text)
+        if version != DATA_CODEC_VERSION:
+            self._data_to_migrate[(table, column, key_column, key)] = \
+                (text, encode_data(data))
+        return data
+
+    def _migrate_data(self):
+        # Don't overwrite rows which have been updated in the mean time.
+        for (table, column, key_column, key), (old_text, new_text) in \
+            self._data_to_migrate.items():
+            self.con.execute("update %s set %s=? where %s=? and %s=?" \
+                % (table, column, key_column, column),
+                (new_text, key, old_text))
+        self._data_to_migrate = {}
 
     #
     # Tags.
@@ -563,7 +815,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         tag.name = tag.name.replace(",", " - ")
         self.con.execute("""insert into tags(name, extra_data, id)
             values(?,?,?)""", (tag.name,
-            self._repr_extra_data(tag.extra_data), tag.id))
+            self._encode_extra_data(tag.extra_data), tag.id))
         tag._id = self.con.last_insert_rowid()
         # No need to log creation of the __UNTAGGED__ tag during sync, nor the
         # adding of this tag to the default criterion. Each client will have
@@ -627,6 +879,12 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         # save some time.
 
     def tag(self, id, is_id_internal):
+        if is_id_internal:
+            tag = self._tag_cache.get(id)
+        else:
+            tag = self._tag_cache.get_with_id(id)
+        if tag is not None:
+            return tag
         if is_id_internal:
             sql_res = self.con.execute("""select _id, id, name, extra_data
                 from tags where _id=?""", (id, )).fetchone()
@@ -636,9 +894,13 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         tag = Tag(sql_res[2], sql_res[1])
         tag._id = sql_res[0]
         self._construct_extra_data(sql_res[3], tag)
+        self._tag_cache.add(tag)
         return tag
 
     def update_tag(self, tag):
+        # Cards hold on to their tag objects, so these need to go as well.
+        self._tag_cache.discard(tag._id)
+        self._card_cache.clear()
         self.log().edited_tag(tag)
         # Corner case: change tag name into the name of an existing tag.
         new_name = tag.name
@@ -677,7 +939,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             return
         # Regular case.
         self.con.execute("""update tags set name=?, extra_data=? where
-            _id=?""", (tag.name, self._repr_extra_data(tag.extra_data),
+            _id=?""", (tag.name, self._encode_extra_data(tag.extra_data),
              tag._id))
         if self.store_pregenerated_data:
             _card_ids_affected = [cursor[0] for cursor in self.con.execute(
@@ -685,26 +947,31 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
                 (tag._id, ))]
             self._update_tag_strings(_card_ids_affected)
 
-    def _update_tag_strings(self, _card_ids):
+    def _update_tag_strings(self, _card_ids, chunk_size=5000):
         # To speed up the process, we don't construct the entire card object,
-        # but take shortcuts.
-        for _card_id in _card_ids:
-            tag_names = []
-            for cursor in self.con.execute("""select _tag_id from
-                tags_for_card where _card_id=?""", (_card_id, )):
-                tag_name = self.con.execute(\
-                    "select name from tags where _id=?",
-                    (cursor[0], )).fetchone()[0]
-                if tag_name != "__UNTAGGED__":
-                    tag_names.append(tag_name)
-            sorted_tag_names = sorted(tag_names, key=numeric_string_cmp_key)
-            tag_string = ", ".join(sorted_tag_names)
-            self.con.execute("update cards set tags=? where _id=?",
-                (tag_string, _card_id))
+        # but fetch the tag names of a whole chunk of cards in a single join,
+        # and do the sorting (which is not something SQL can do for us) in
+        # Python, using the same ordering as 'Card.tag_string'.
+        _card_ids = list(set(_card_ids))
+        for i in range(0, len(_card_ids), chunk_size):
+            tag_names_for__card_id = dict((_card_id, []) for _card_id \
+                in _card_ids[i:i+chunk_size])
+            for _card_id, tag_name in self.con.execute("""select
+                tags_for_card._card_id, tags.name from tags_for_card join tags
+                on tags._id=tags_for_card._tag_id where tags_for_card._card_id
+                in (%s) and tags.name!='__UNTAGGED__'""" % \
+                self._internal_id_list(tag_names_for__card_id)):
+                tag_names_for__card_id[_card_id].append(tag_name)
+            self.con.executemany("update cards set tags=? where _id=?",
+                ((", ".join(sorted(tag_names, key=numeric_string_cmp_key)),
+                _card_id) for _card_id, tag_names in \
+                tag_names_for__card_id.items()))
 
     def delete_tag(self, tag):
         if tag.id == "__UNTAGGED__":
             return
+        self._tag_cache.discard(tag._id)
+        self._card_cache.clear()
         self.con.execute("delete from tags where _id=?", (tag._id, ))
         _card_ids_affected = [cursor[0] for cursor in self.con.execute(
             "select _card_id from tags_for_card where _tag_id=?",
@@ -720,9 +987,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         if self.store_pregenerated_data:
             self._update_tag_strings(_card_ids_affected)
         # Update criteria, as e.g. deleting a forbidden tag needs to
-        # reactive the cards having this tag.
-        # TODO: some speed-up could be had here be only running the applier
-        # if the tag was relevant for the current criterion.
+        # reactive the cards having this tag. Only these cards are affected.
         self.log().deleted_tag(tag)
         # When syncing, don't bother to check for updates to criteria here, as
         # there will be separate log events coming later to deal with this
@@ -733,10 +998,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         for criterion in self.criteria():
             criterion.tag_deleted(tag)
             self.update_criterion(criterion)
-        criterion = self.current_criterion()
-        applier = self.component_manager.current("criterion_applier",
-            used_for=criterion.__class__)
-        applier.apply_to_database(criterion)
+        self._apply_criterion(self.current_criterion(), _card_ids_affected)
         del tag
 
     def delete_tag_if_unused(self, tag):
@@ -783,11 +1045,30 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         self.con.executemany("""insert into data_for_fact(_fact_id, key, value)
             values(?,?,?)""", ((fact._id, fact_key, value)
             for fact_key, value in fact.data.items() if value))
+        self._add_data_hashes([fact])
         self.log().added_fact(fact)
         # Process media files.
         self._process_media(fact)
 
+    def _data_hash(self, fact_key, value):
+        # Unlike Python's 'hash', this is the same on all platforms, and it
+        # fits in an SQLite integer.
+        return int(hashlib.sha1((fact_key + "\0" + value).\
+            encode("utf-8")).hexdigest()[:15], 16)
+
+    def _add_data_hashes(self, facts):
+        self.con.executemany("""insert into data_hashes_for_fact(_fact_id,
+            key, hash) values(?,?,?)""", ((fact._id, fact_key,
+            self._data_hash(fact_key, value)) for fact in facts
+            for fact_key, value in fact.data.items() if value))
+
     def fact(self, id, is_id_internal):
+        if is_id_internal:
+            fact = self._fact_cache.get(id)
+        else:
+            fact = self._fact_cache.get_with_id(id)
+        if fact is not None:
+            return fact
         if is_id_internal:
             sql_res = self.con.execute("""select _id, id, extra_data from
                 facts where _id=?""", (id, )).fetchone()
@@ -802,33 +1083,151 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         fact = Fact(fact_data, id=sql_res[1])
         fact._id = sql_res[0]
         self._construct_extra_data(sql_res[2], fact)
+        self._fact_cache.add(fact)
         return fact
 
+    def facts_with_internal_ids(self, _fact_ids):
+
+        """Return the facts with internal ids '_fact_ids', in the same order,
+        using two queries in total instead of two queries per fact.
+
+        """
+
+        _fact_ids = list(_fact_ids)
+        # Use the cached objects where possible. We don't add the others to
+        # the cache, as bulk operations would push out the frequently used
+        # objects.
+        fact_for__fact_id = {}
+        for _fact_id in _fact_ids:
+            fact = self._fact_cache.get(_fact_id)
+            if fact is not None:
+                fact_for__fact_id[_fact_id] = fact
+        _fact_ids_to_fetch = [_fact_id for _fact_id in _fact_ids \
+            if _fact_id not in fact_for__fact_id]
+        if len(_fact_ids_to_fetch) == 0:
+            return [fact_for__fact_id[_fact_id] for _fact_id in _fact_ids]
+        fact_for__fact_id.update(self._facts_from_rows(\
+            *self._fact_rows_with_internal_ids(_fact_ids_to_fetch, self.con)))
+        return [fact_for__fact_id[_fact_id] for _fact_id in _fact_ids \
+            if _fact_id in fact_for__fact_id]
+
+    def _fact_rows_with_internal_ids(self, _fact_ids, con):
+        # Since _fact_ids can have many elements, we need to construct the
+        # query without ? placeholders in order to prevent hitting sqlite
+        # limitations.
+        id_list = self._internal_id_list(_fact_ids)
+        fact_rows = con.execute("""select _id, id, extra_data from facts
+            where _id in (%s)""" % id_list).fetchall()
+        data_rows = con.execute("""select _fact_id, key, value from
+            data_for_fact where _fact_id in (%s)""" % id_list).fetchall()
+        return fact_rows, data_rows
+
+    def _facts_from_rows(self, fact_rows, data_rows):
+        fact_data_for__fact_id = {}
+        for cursor in data_rows:
+            fact_data_for__fact_id.setdefault(cursor[0], {})[cursor[1]] = \
+                cursor[2]
+        fact_for__fact_id = {}
+        for sql_res in fact_rows:
+            fact = Fact(fact_data_for__fact_id.get(sql_res[0], {}),
+                id=sql_res[1])
+            fact._id = sql_res[0]
+            self._construct_extra_data(sql_res[2], fact)
+            fact_for__fact_id[fact._id] = fact
+        return fact_for__fact_id
+
     def update_fact(self, fact):
+        # Cards hold on to their fact objects, so these need to go as well.
+        self._fact_cache.discard(fact._id)
+        self._card_cache.clear()
         # Delete data_for_fact and recreate it.
         self.con.execute("delete from data_for_fact where _fact_id=?",
             (fact._id, ))
         self.con.executemany("""insert into data_for_fact(_fact_id, key, value)
             values(?,?,?)""", ((fact._id, key, value)
                 for key, value in fact.data.items() if value))
+        self.con.execute("delete from data_hashes_for_fact where _fact_id=?",
+            (fact._id, ))
+        self._add_data_hashes([fact])
         self.log().edited_fact(fact)
         # Process media files.
         self._process_media(fact)
 
     def delete_fact(self, fact):
+        self._fact_cache.discard(fact._id)
+        self._card_cache.clear()
         self.con.execute("delete from facts where _id=?", (fact._id, ))
         self.con.execute("delete from data_for_fact where _fact_id=?",
             (fact._id, ))
+        self.con.execute("delete from data_hashes_for_fact where _fact_id=?",
+            (fact._id, ))
         self.log().deleted_fact(fact)
         del fact
 
+    def delete_facts_bulk(self, facts):
+        facts = list(facts)
+        if not facts:
+            return []
+        _fact_ids = self._internal_id_list(fact._id for fact in facts)
+        cards = self.cards_with_internal_ids([cursor[0] for cursor in \
+            self.con.execute("select _id from cards where _fact_id in (%s)" \
+            % _fact_ids)])
+        for fact in facts:
+            self._fact_cache.discard(fact._id)
+        self._card_cache.clear()
+        self._discard_from_due_index(card._id for card in cards)
+        self.con.execute("""delete from tags_for_card where _card_id in
+            (select _id from cards where _fact_id in (%s))""" % _fact_ids)
+        for table, column in [("cards", "_fact_id"), ("facts", "_id"),
+            ("data_for_fact", "_fact_id"),
+            ("data_hashes_for_fact", "_fact_id")]:
+            self.con.execute("delete from %s where %s in (%s)" % \
+                (table, column, _fact_ids))
+        self.log().deleted_cards(cards)
+        self.log().deleted_facts(facts)
+        # Delete the tags which are no longer used, like 'delete_tag_if_unused'
+        # does for a single tag.
+        tags = [self.tag(cursor[0], is_id_internal=True) for cursor in \
+            self.con.execute("""select _id from tags where
+            name!='__UNTAGGED__' and not exists (select 1 from tags_for_card
+            where tags_for_card._tag_id=tags._id)""")]
+        if not tags:
+            return cards
+        for tag in tags:
+            self._tag_cache.discard(tag._id)
+        self.con.execute("delete from tags where _id in (%s)" % \
+            self._internal_id_list(tag._id for tag in tags))
+        self.log().deleted_tags(tags)
+        if not self.syncing:
+            # Since no card has these tags anymore, the criteria need to
+            # forget about them, but the cards' active status is unaffected.
+            for criterion in self.criteria():
+                for tag in tags:
+                    criterion.tag_deleted(tag)
+                self.update_criterion(criterion)
+        return cards
+
     def has_fact_with_id(self, id):
         return self.con.execute("select 1 from facts where id=? limit 1",
             (id, )).fetchone() is not None
 
     def fact_ids_forgotten_and_learned_today(self, start_of_day, end_of_day):
-        return (cursor[0] for cursor in self.con.execute(
+        if self._interned_log:
+            # Only look up the ids of the result. Intersecting, rather than
+            # grouping, lets both halves use the index on the timestamp.
+            query = """
+            select cards._fact_id from log_object_ids inner join cards where
+            log_object_ids.id = cards.id and log_object_ids._id in (
+              select _object_id from interned_log where
+              timestamp >= :start_of_day and timestamp < :end_of_day and
+              event_type = :event_type and grade >= 2
+              intersect
+              select _object_id from interned_log where
+              timestamp >= :start_of_day and timestamp < :end_of_day and
+              event_type = :event_type and grade < 2 and ret_reps > 0)
             """
+        else:
+            query = """
             select cards._fact_id from log inner join cards where
             log.object_id = cards.id and log.timestamp >= :start_of_day and
             log.timestamp < :end_of_day and log.event_type = :event_type and
@@ -837,16 +1236,25 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
               timestamp < :end_of_day and event_type = :event_type and
               grade < 2 and ret_reps > 0 group by object_id)
             group by log.object_id
-            """,
+            """
+        return (cursor[0] for cursor in self.con.execute(query,
             {"start_of_day": start_of_day,
              "end_of_day": end_of_day,
              "event_type": EventTypes.REPETITION}).fetchall())
 
     def fact_ids_newly_learned_today(self, start_of_day, end_of_day):
-        return (cursor[0] for cursor in self.con.execute(
-            """select cards._fact_id from log inner join cards where
+        if self._interned_log:
+            query = """select cards._fact_id from interned_log as log
+            inner join log_object_ids inner join cards where
+            log._object_id = log_object_ids._id and
+            log_object_ids.id = cards.id and ?<=log.timestamp and
+            log.timestamp<? and log.event_type=? and log.grade>=2 and
+            log.ret_reps==0"""
+        else:
+            query = """select cards._fact_id from log inner join cards where
             log.object_id = cards.id and ?<=log.timestamp and log.timestamp<?
-            and log.event_type=? and log.grade>=2 and log.ret_reps==0""",
+            and log.event_type=? and log.grade>=2 and log.ret_reps==0"""
+        return (cursor[0] for cursor in self.con.execute(query,
             (start_of_day, end_of_day, EventTypes.REPETITION)).fetchall())
 
     #
@@ -869,10 +1277,13 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             card.easiness, card.acq_reps, card.ret_reps, card.lapses,
             card.acq_reps_since_lapse, card.ret_reps_since_lapse,
             card.creation_time, card.modification_time,
-            self._repr_extra_data(card.extra_data), card.scheduler_data,
+            self._encode_extra_data(card.extra_data), card.scheduler_data,
             card.active,))
         card._id = self.con.last_insert_rowid()
-        if self.store_pregenerated_data:
+        self._update_due_index([card])
+        if self._defer_pregenerated_data():
+            self._mark_pregenerated_data_stale([card._id])
+        elif self.store_pregenerated_data:
             self.con.execute(\
                 "update cards set question=?, answer=?, tags=? where _id=?",
                 (card.question("plain_text"), card.answer("plain_text"),
@@ -886,31 +1297,88 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
                 _card_id) values(?,?)""", (tag._id, card._id))
         self.log().added_card(card)
 
-    def card(self, id, is_id_internal):
-        query = """select _id, id, card_type_id, _fact_id, fact_view_id,
+    def add_facts_and_cards_bulk(self, facts, cards):
+        facts, cards = list(facts), list(cards)
+        # We hand out the internal ids ourselves, such that we don't need to
+        # retrieve them one insert at a time.
+        if facts:
+            _fact_id = self.con.execute(\
+                "select coalesce(max(_id), 0) from facts").fetchone()[0]
+            for fact in facts:
+                _fact_id += 1
+                fact._id = _fact_id
+            self.con.executemany("insert into facts(_id, id) values(?,?)",
+                ((fact._id, fact.id) for fact in facts))
+            self.con.executemany("""insert into data_for_fact(_fact_id, key,
+                value) values(?,?,?)""", ((fact._id, fact_key, value)
+                for fact in facts for fact_key, value in fact.data.items()
+                if value))
+            self._add_data_hashes(facts)
+            self.log().added_facts(facts)
+            for fact in facts:
+                self._process_media(fact)
+        if not cards:
+            return
+        untagged = None
+        criterion = self.current_criterion()
+        for card in cards:
+            if len(card.tags) == 0:
+                if untagged is None:
+                    untagged = \
+                        self.get_or_create_tag_with_name("__UNTAGGED__")
+                card.tags.add(untagged)
+            criterion.apply_to_card(card)
+        _card_id = self.con.execute(\
+            "select coalesce(max(_id), 0) from cards").fetchone()[0]
+        for card in cards:
+            _card_id += 1
+            card._id = _card_id
+        def values(card):
+            return (card._id, card.id, card.card_type.id, card.fact._id,
+                card.fact_view.id, card.grade, card.next_rep, card.last_rep,
+                card.easiness, card.acq_reps, card.ret_reps, card.lapses,
+                card.acq_reps_since_lapse, card.ret_reps_since_lapse,
+                card.creation_time, card.modification_time,
+                self._encode_extra_data(card.extra_data), card.scheduler_data,
+                card.active)
+        if self.store_pregenerated_data and \
+            not self._defer_pregenerated_data():
+            # Fill in the pregenerated data in the same pass.
+            self.con.executemany("""insert into cards(%s, question, answer,
+                tags) values(%s)""" % (self._card_columns, ",".join(["?"] * 22)),
+                (values(card) + (card.question("plain_text"),
+                card.answer("plain_text"), card.tag_string())
+                for card in cards))
+        else:
+            self.con.executemany("insert into cards(%s) values(%s)" \
+                % (self._card_columns, ",".join(["?"] * 19)),
+                (values(card) for card in cards))
+            if self._defer_pregenerated_data():
+                self._mark_pregenerated_data_stale(card._id for card in cards)
+        self._update_due_index(cards)
+        self.con.executemany(\
+            "insert into tags_for_card(_tag_id, _card_id) values(?,?)",
+            ((tag._id, card._id) for card in cards for tag in card.tags))
+        self.log().added_cards(cards)
+
+    _card_columns = """_id, id, card_type_id, _fact_id, fact_view_id,
             grade, next_rep, last_rep, easiness, acq_reps, ret_reps, lapses,
             acq_reps_since_lapse, ret_reps_since_lapse, creation_time,
-            modification_time, extra_data, scheduler_data, active from cards
-            where """
-        if is_id_internal:
-            sql_res = self.con.execute(query + "_id=?", (id, )).fetchone()
-        else:
-            sql_res = self.con.execute(query + "id=?", (id, )).fetchone()
-        if sql_res is None or sql_res[3] is None:
-            from mnemosyne.libmnemosyne.utils import MnemosyneError
-            raise MnemosyneError
-        fact = self.fact(sql_res[3], is_id_internal=True)
+            modification_time, extra_data, scheduler_data, active"""
+
+    def _construct_card(self, sql_res, fact):
         # Note that for the card type, we turn to the component manager as
         # opposed to this database, as we would otherwise miss the built-in
         # system card types
         card_type = self.card_type_with_id(sql_res[2])
         for fact_view in card_type.fact_views:
             if fact_view.id == sql_res[4]:
+                # Passing the id avoids generating a random one, which would
+                # make the random sequence depend on what is being cached.
                 card = Card(card_type, fact, fact_view,
-                    creation_time=sql_res[14])
+                    creation_time=sql_res[14], id=sql_res[1])
                 break
         card._id = sql_res[0]
-        card.id = sql_res[1]
         card.grade = sql_res[5]
         card.next_rep = sql_res[6]
         card.last_rep = sql_res[7]
@@ -924,12 +1392,118 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         self._construct_extra_data(sql_res[16], card)
         card.scheduler_data = sql_res[17]
         card.active = sql_res[18]
+        return card
+
+    def card(self, id, is_id_internal):
+        if is_id_internal:
+            card = self._card_cache.get(id)
+        else:
+            card = self._card_cache.get_with_id(id)
+        if card is not None:
+            return card
+        query = "select " + self._card_columns + " from cards where "
+        if is_id_internal:
+            sql_res = self.con.execute(query + "_id=?", (id, )).fetchone()
+        else:
+            sql_res = self.con.execute(query + "id=?", (id, )).fetchone()
+        if sql_res is None or sql_res[3] is None:
+            from mnemosyne.libmnemosyne.utils import MnemosyneError
+            raise MnemosyneError
+        fact = self.fact(sql_res[3], is_id_internal=True)
+        card = self._construct_card(sql_res, fact)
         for cursor in self.con.execute("""select _tag_id from tags_for_card
             where _card_id=?""", (card._id, )):
             card.tags.add(self.tag(cursor[0], is_id_internal=True))
+        self._card_cache.add(card)
         return card
 
+    def cards_with_internal_ids(self, _card_ids):
+
+        """Return the cards with internal ids '_card_ids', in the same order.
+
+        Whereas 'card' needs several queries per card (card, fact, fact data
+        and one per tag), this hydrates all the cards with a fixed number of
+        set-based queries, which makes a large difference for bulk operations.
+        Sister cards share the same fact object. Ids which are not in the
+        database are skipped.
+
+        """
+
+        _card_ids = list(_card_ids)
+        # As in 'facts_with_internal_ids', only use the cache for lookups.
+        card_for__card_id = {}
+        for _card_id in _card_ids:
+            card = self._card_cache.get(_card_id)
+            if card is not None:
+                card_for__card_id[_card_id] = card
+        _card_ids_to_fetch = [_card_id for _card_id in _card_ids \
+            if _card_id not in card_for__card_id]
+        if len(_card_ids_to_fetch) == 0:
+            return [card_for__card_id[_card_id] for _card_id in _card_ids]
+        card_rows, tag_rows = self._card_rows_with_internal_ids(\
+            _card_ids_to_fetch, self.con)
+        fact_for__fact_id = dict((fact._id, fact) for fact in \
+            self.facts_with_internal_ids(set(sql_res[3] for sql_res in \
+            card_rows)))
+        card_for__card_id.update(self._cards_from_rows(card_rows, tag_rows,
+            fact_for__fact_id))
+        return [card_for__card_id[_card_id] for _card_id in _card_ids \
+            if _card_id in card_for__card_id]
+
+    def _card_rows_with_internal_ids(self, _card_ids, con):
+        id_list = self._internal_id_list(_card_ids)
+        card_rows = [sql_res for sql_res in con.execute("select " + \
+            self._card_columns + " from cards where _id in (%s)" % id_list) \
+            if sql_res[3] is not None]
+        tag_rows = con.execute("""select tags_for_card._card_id,
+            tags._id, tags.id, tags.name, tags.extra_data from tags_for_card,
+            tags where tags_for_card._tag_id=tags._id and
+            tags_for_card._card_id in (%s)""" % id_list).fetchall()
+        return card_rows, tag_rows
+
+    def _cards_from_rows(self, card_rows, tag_rows, fact_for__fact_id):
+        tag_for__tag_id = {}
+        _tag_ids_for__card_id = {}
+        for cursor in tag_rows:
+            _tag_id = cursor[1]
+            if _tag_id not in tag_for__tag_id:
+                tag = self._tag_cache.get(_tag_id)
+                if tag is None:
+                    tag = Tag(cursor[3], cursor[2])
+                    tag._id = _tag_id
+                    self._construct_extra_data(cursor[4], tag)
+                tag_for__tag_id[_tag_id] = tag
+            _tag_ids_for__card_id.setdefault(cursor[0], []).append(_tag_id)
+        card_for__card_id = {}
+        for sql_res in card_rows:
+            card = self._construct_card(sql_res, fact_for__fact_id[sql_res[3]])
+            for _tag_id in _tag_ids_for__card_id.get(card._id, []):
+                card.tags.add(tag_for__tag_id[_tag_id])
+            card_for__card_id[card._id] = card
+        return card_for__card_id
+
+    def cards_with_ids(self, ids):
+
+        """Same as 'cards_with_internal_ids', but for the external ids."""
+
+        ids = list(ids)
+        _card_id_for_id = {}
+        # Limit to 500 at a time to deal with SQLite limitations.
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i+500]
+            for cursor in self.con.execute(\
+                "select _id, id from cards where id in (%s)" \
+                % ",".join("?" * len(chunk)), chunk):
+                _card_id_for_id[cursor[1]] = cursor[0]
+        return self.cards_with_internal_ids(_card_id_for_id[id] for id in ids \
+            if id in _card_id_for_id)
+
+    def _internal_id_list(self, _ids):
+        # Internal ids are integers, so we can safely inline them.
+        return ",".join(str(int(_id)) for _id in _ids)
+
     def update_card(self, card, repetition_only=False):
+        self._card_cache.discard(card._id)
         # The card should at least have the __UNTAGGED__ tag. This allows for
         # an easy and fast implementation of applying criteria.
         if len(card.tags) == 0:
@@ -944,14 +1518,17 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             card.acq_reps, card.ret_reps, card.lapses,
             card.acq_reps_since_lapse, card.ret_reps_since_lapse,
             card.scheduler_data, card.active, card._id))
+        self._update_due_index([card])
         if repetition_only:
             return
         self.con.execute("""update cards set card_type_id=?, _fact_id=?,
             fact_view_id=?, creation_time=?, modification_time=?, extra_data=?
             where _id=?""", (card.card_type.id, card.fact._id,
             card.fact_view.id, card.creation_time, card.modification_time,
-            self._repr_extra_data(card.extra_data), card._id))
-        if self.store_pregenerated_data:
+            self._encode_extra_data(card.extra_data), card._id))
+        if self._defer_pregenerated_data():
+            self._mark_pregenerated_data_stale([card._id])
+        elif self.store_pregenerated_data:
             self.con.execute(\
                 "update cards set question=?, answer=?, tags=? where _id=?",
                 (card.question("plain_text"), card.answer("plain_text"),
@@ -969,15 +1546,38 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             self.con.execute("""insert into tags_for_card(_tag_id,
                 _card_id) values(?,?)""", (tag._id, card._id))
 
+    def update_cards(self, cards, repetition_only=False):
+        if not repetition_only:
+            for card in cards:
+                self.update_card(card)
+            return
+        # Only the scheduling data changed, which can be written in bulk.
+        for card in cards:
+            self._card_cache.discard(card._id)
+            if len(card.tags) == 0:
+                card.tags.add(self.get_or_create_tag_with_name("__UNTAGGED__"))
+        self.con.executemany("""update cards set grade=?, next_rep=?,
+            last_rep=?, easiness=?, acq_reps=?, ret_reps=?, lapses=?,
+            acq_reps_since_lapse=?, ret_reps_since_lapse=?,
+            scheduler_data=?, active=? where _id=?""",
+            ((card.grade, card.next_rep, card.last_rep, card.easiness,
+            card.acq_reps, card.ret_reps, card.lapses,
+            card.acq_reps_since_lapse, card.ret_reps_since_lapse,
+            card.scheduler_data, card.active, card._id) for card in cards))
+        self._update_due_index(cards)
+
     def delete_card(self, card, check_for_unused_tags=True):
+        self._card_cache.discard_with_id(card.id)
         if card._id is None:
             # A card which was created and deleted before a sync, so that
             # it has incomplete information.
             self.con.execute("delete from cards where id=?", (card.id, ))
+            self._invalidate_due_index()
         else:
             self.con.execute("delete from cards where _id=?", (card._id, ))
             self.con.execute("delete from tags_for_card where _card_id=?",
                              (card._id, ))
+            self._discard_from_due_index([card._id])
         if not self.syncing and check_for_unused_tags:
             for tag in card.tags:
                 self.delete_tag_if_unused(tag)
@@ -1016,21 +1616,15 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             values(?,?)""", arguments)
         if self.store_pregenerated_data:
             self._update_tag_strings(_card_ids)
-        # Apply criterion. (There does not seem to be any watertight shortcut
-        # we can take for a special case, especially when a card can have many
-        # tags, so we apply the criterion in full.)
-        criterion = self.current_criterion()
-        applier = self.component_manager.current("criterion_applier",
-            used_for=criterion.__class__)
-        applier.apply_to_database(criterion)
+        # Apply criterion, but only to the cards we touched.
+        self._apply_criterion(self.current_criterion(), _card_ids)
         # We don't call 'self.log.edited_card(card)', which would require us to
         # construct the entire card object, but take a short cut.
-        for _card_id in _card_ids:
-            card_id = self.con.execute("select id from cards where _id=?",
-                (_card_id, )).fetchone()[0]
-            self.con.execute("""insert into log(event_type, timestamp,
-                object_id) values(?,?,?)""",
-                (EventTypes.EDITED_CARD, int(time.time()), card_id))
+        timestamp = int(time.time())
+        self.con.executemany("""insert into log(event_type, timestamp,
+            object_id) select ?, ?, id from cards where _id=?""",
+            ((EventTypes.EDITED_CARD, timestamp, _card_id) \
+            for _card_id in _card_ids))
 
     def remove_tag_from_cards_with_internal_ids(self, tag, _card_ids):
         # Delete tags.
@@ -1050,13 +1644,8 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         self.delete_tag_if_unused(tag)
         if self.store_pregenerated_data:
             self._update_tag_strings(_card_ids)
-        # Apply criterion. (There does not seem to be any watertight shortcut
-        # we can take for a special case, especially when a card can have many
-        # tags, so we apply the criterion in full.)
-        criterion = self.current_criterion()
-        applier = self.component_manager.current("criterion_applier",
-            used_for=criterion.__class__)
-        applier.apply_to_database(criterion)
+        # Apply criterion, but only to the cards we touched.
+        self._apply_criterion(self.current_criterion(), _card_ids)
         # We don't call 'self.log.edited_card(card)', which would require us
         # to construct the entire card object, but take a short cut.
         for _card_id in _card_ids:
@@ -1079,12 +1668,13 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             a_fact_keys, q_fact_key_decorators, a_fact_key_decorators,
             a_on_top_of_q, type_answer, extra_data)
             values(?,?,?,?,?,?,?,?,?)""",
-            (fact_view.id, fact_view.name, repr(fact_view.q_fact_keys),
-            repr(fact_view.a_fact_keys),
-            repr(fact_view.q_fact_key_decorators),
-            repr(fact_view.a_fact_key_decorators), fact_view.a_on_top_of_q,
+            (fact_view.id, fact_view.name, encode_data(fact_view.q_fact_keys),
+            encode_data(fact_view.a_fact_keys),
+            encode_data(fact_view.q_fact_key_decorators),
+            encode_data(fact_view.a_fact_key_decorators),
+            fact_view.a_on_top_of_q,
             fact_view.type_answer,
-            self._repr_extra_data(fact_view.extra_data)))
+            self._encode_extra_data(fact_view.extra_data)))
         self.log().added_fact_view(fact_view)
 
     def fact_view(self, id, is_id_internal):
@@ -1095,10 +1685,12 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             a_on_top_of_q, type_answer, extra_data from fact_views
             where id=?""", (id, )).fetchone()
         fact_view = FactView(sql_res[1], sql_res[0])
-        fact_view.q_fact_keys = eval(sql_res[2])
-        fact_view.a_fact_keys = eval(sql_res[3])
-        fact_view.q_fact_key_decorators = eval(sql_res[4])
-        fact_view.a_fact_key_decorators = eval(sql_res[5])
+        decode = lambda i, column: self._decode_data(sql_res[i],
+            "fact_views", column, "id", fact_view.id)
+        fact_view.q_fact_keys = decode(2, "q_fact_keys")
+        fact_view.a_fact_keys = decode(3, "a_fact_keys")
+        fact_view.q_fact_key_decorators = decode(4, "q_fact_key_decorators")
+        fact_view.a_fact_key_decorators = decode(5, "a_fact_key_decorators")
         fact_view.a_on_top_of_q = bool(sql_res[6])
         fact_view.type_answer = bool(sql_res[7])
         self._construct_extra_data(sql_res[8], fact_view)
@@ -1108,16 +1700,20 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         self.con.execute("""update fact_views set name=?, q_fact_keys=?,
             a_fact_keys=?, q_fact_key_decorators=?, a_fact_key_decorators=?,
             a_on_top_of_q=?, type_answer=?, extra_data=? where id=?""",
-            (fact_view.name, repr(fact_view.q_fact_keys),
-            repr(fact_view.a_fact_keys), repr(fact_view.q_fact_key_decorators),
-            repr(fact_view.a_fact_key_decorators), fact_view.a_on_top_of_q,
+            (fact_view.name, encode_data(fact_view.q_fact_keys),
+            encode_data(fact_view.a_fact_keys),
+            encode_data(fact_view.q_fact_key_decorators),
+            encode_data(fact_view.a_fact_key_decorators),
+            fact_view.a_on_top_of_q,
             fact_view.type_answer,
-            self._repr_extra_data(fact_view.extra_data), fact_view.id))
+            self._encode_extra_data(fact_view.extra_data), fact_view.id))
+        self._card_cache.clear()
         self.log().edited_fact_view(fact_view)
 
     def delete_fact_view(self, fact_view):
         self.con.execute("delete from fact_views where id=?",
             (fact_view.id, ))
+        self._card_cache.clear()
         self.log().deleted_fact_view(fact_view)
         del fact_view
 
@@ -1163,12 +1759,12 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             fact_keys_and_names, unique_fact_keys, required_fact_keys,
             fact_view_ids, keyboard_shortcuts, extra_data)
             values (?,?,?,?,?,?,?,?)""", (card_type.id,
-            card_type.name, repr(card_type.fact_keys_and_names),
-            repr(card_type.unique_fact_keys),
-            repr(card_type.required_fact_keys),
-            repr([fact_view.id for fact_view in card_type.fact_views]),
-            repr(card_type.keyboard_shortcuts),
-            self._repr_extra_data(card_type.extra_data)))
+            card_type.name, encode_data(card_type.fact_keys_and_names),
+            encode_data(card_type.unique_fact_keys),
+            encode_data(card_type.required_fact_keys),
+            encode_data([fact_view.id for fact_view in card_type.fact_views]),
+            encode_data(card_type.keyboard_shortcuts),
+            self._encode_extra_data(card_type.extra_data)))
         # When we are syncing/merging, make sure we correctly insert the
         # class in the inheritance hierarchy.
         card_type = self.card_type(card_type.id, is_id_internal=False)
@@ -1222,15 +1818,18 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             (id, )).fetchone()
         card_type = type(mangle(id), (parent.__class__, ),
             {"name": sql_res[0], "id": id})(self.component_manager)
-        card_type.fact_keys_and_names = eval(sql_res[1])
-        card_type.unique_fact_keys = eval(sql_res[2])
-        card_type.required_fact_keys = eval(sql_res[3])
-        card_type.keyboard_shortcuts = eval(sql_res[5])
+        decode = lambda i, column: self._decode_data(sql_res[i],
+            "card_types", column, "id", id)
+        card_type.fact_keys_and_names = decode(1, "fact_keys_and_names")
+        card_type.unique_fact_keys = decode(2, "unique_fact_keys")
+        card_type.required_fact_keys = decode(3, "required_fact_keys")
+        card_type.keyboard_shortcuts = decode(5, "keyboard_shortcuts")
         self._construct_extra_data(sql_res[6], card_type)
         if "hidden_from_UI" in card_type.extra_data:
             card_type.hidden_from_UI = card_type.extra_data["hidden_from_UI"]
         card_type.fact_views = [self.fact_view(fact_view_id,
-            is_id_internal=False) for fact_view_id in eval(sql_res[4])]
+            is_id_internal=False) for fact_view_id in \
+            decode(4, "fact_view_ids")]
         return card_type
 
     def is_user_card_type(self, card_type):
@@ -1253,14 +1852,15 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         self.con.execute("""update card_types set name=?,
             fact_keys_and_names=?, unique_fact_keys=?, required_fact_keys=?,
             fact_view_ids=?, keyboard_shortcuts=?, extra_data=? where id=?""",
-            (card_type.name, repr(card_type.fact_keys_and_names),
-            repr(card_type.unique_fact_keys),
-            repr(card_type.required_fact_keys),
-            repr([fact_view.id for fact_view in card_type.fact_views]),
-            repr(card_type.keyboard_shortcuts),
-            self._repr_extra_data(card_type.extra_data), card_type.id))
+            (card_type.name, encode_data(card_type.fact_keys_and_names),
+            encode_data(card_type.unique_fact_keys),
+            encode_data(card_type.required_fact_keys),
+            encode_data([fact_view.id for fact_view in card_type.fact_views]),
+            encode_data(card_type.keyboard_shortcuts),
+            self._encode_extra_data(card_type.extra_data), card_type.id))
         self.component_manager.unregister(card_type)
         self.component_manager.register(card_type)
+        self._card_cache.clear()
         self.log().edited_card_type(card_type)
 
     def delete_card_type(self, card_type):
@@ -1269,6 +1869,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         self.con.execute("delete from card_types where id=?",
             (card_type.id, ))
         self.component_manager.unregister(card_type)
+        self._card_cache.clear()
         self.log().deleted_card_type(card_type)
         # When syncing, don't bother to check for updates to criteria here, as
         # there will be separate log events coming later to deal with this.
@@ -1316,6 +1917,11 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
                 criterion._id = sql_res[0]
                 criterion.name = sql_res[2]
                 criterion.set_data_from_string(sql_res[4])
+                # Migrate data from older versions of the codec lazily.
+                data = criterion.data_to_string()
+                if data != sql_res[4]:
+                    self._data_to_migrate[("criteria", "data", "_id",
+                        criterion._id)] = (sql_res[4], data)
                 return criterion
 
     def update_criterion(self, criterion):
@@ -1336,9 +1942,26 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         criterion._id = 1
         criterion.id = "__DEFAULT__"
         self.update_criterion(criterion)
+        self._apply_criterion(criterion)
+
+    def _apply_criterion(self, criterion, _card_ids=None):
+
+        """Apply 'criterion' to the entire database, or, if the criterion
+        itself did not change but only the tags of some cards did, just to
+        those cards.
+
+        """
+
         applier = self.component_manager.current("criterion_applier",
             used_for=criterion.__class__)
-        applier.apply_to_database(criterion)
+        if _card_ids is None:
+            applier.apply_to_database(criterion)
+        else:
+            applier.apply_to_cards_with_internal_ids(criterion, _card_ids)
+        # The appliers update the 'active' field of the cards directly. Note
+        # that appliers without an incremental version still do a full pass.
+        self._card_cache.clear()
+        self._invalidate_due_index()
 
     def current_criterion(self):
         return self._current_criterion
@@ -1357,9 +1980,9 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
     #
 
     def cards_from_fact(self, fact):
-        return list(self.card(cursor[0], is_id_internal=True) for cursor
+        return self.cards_with_internal_ids([cursor[0] for cursor
             in self.con.execute("select _id from cards where _fact_id=?",
-                                (fact._id, )))
+                                (fact._id, ))])
 
     def duplicates_for_fact(self, fact, card_type):
 
@@ -1370,69 +1993,68 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
 
         _fact_ids = set()
         for fact_key in card_type.unique_fact_keys:
-            if fact._id:
-                for cursor in self.con.execute("""select _fact_id from
-                    data_for_fact where key=? and value=? and not
-                    _fact_id=?""", (fact_key, fact[fact_key], fact._id)):
-                    _fact_ids.add(cursor[0])
-            else:
-                # The fact has not yet been saved in the database.
-                for cursor in self.con.execute("""select _fact_id from
-                    data_for_fact where key=? and value=?""",
-                    (fact_key, fact[fact_key])):
-                    _fact_ids.add(cursor[0])
-        # Now we still need to make sure these facts are from cards with
-        # the correct card type.
-        facts = []
-        for _fact_id in _fact_ids:
-            this_card_type_id = self.con.execute("""select card_type_id
-                from cards where _fact_id=?""", (_fact_id, )).fetchone()[0]
-            if this_card_type_id == card_type.id:
-                facts.append(self.fact(_fact_id, is_id_internal=True))
-        return facts
+            value = fact[fact_key]
+            if not value:  # Empty data is not stored.
+                continue
+            # The hash narrows it down to a handful of rows, for which we
+            # check the actual data and the card type.
+            for cursor in self.con.execute("""select
+                data_hashes_for_fact._fact_id from data_hashes_for_fact
+                join data_for_fact on
+                data_for_fact._fact_id=data_hashes_for_fact._fact_id and
+                data_for_fact.key=data_hashes_for_fact.key
+                where data_hashes_for_fact.hash=? and
+                data_hashes_for_fact.key=? and data_for_fact.value=? and
+                exists (select 1 from cards where
+                cards._fact_id=data_hashes_for_fact._fact_id and
+                card_type_id=?)""", (self._data_hash(fact_key, value),
+                fact_key, value, card_type.id)):
+                _fact_ids.add(cursor[0])
+        # The fact could already be in the database.
+        _fact_ids.discard(fact._id)
+        return self.facts_with_internal_ids(sorted(_fact_ids))
 
     def tag_all_duplicates(self):
-        # Find the _fact_ids of the candidate duplicates, i.e. not yet taking
-        # into account that duplicates in different card types are allowed and
-        # that we only need to check the unique fact keys. This preprocessing
-        # step speeds up the rest of the calculations.
-        _fact_ids = set()
-        _fact_id_for_data = {}
-        for key, value, _fact_id in self.con.execute(\
-            """select key, value, _fact_id from data_for_fact"""):
-            if key not in _fact_id_for_data:
-                _fact_id_for_data[key] = {}
-            if value in _fact_id_for_data[key]:
-                _fact_ids.add(_fact_id_for_data[key][value])
-                _fact_ids.add(_fact_id)
-            else:
-                _fact_id_for_data[key][value] = _fact_id
-        # Sort the candidates per card type.
-        _fact_ids_in_card_type = {}
-        for _fact_id in _fact_ids:
-            card_type_id = self.con.execute("""select card_type_id from cards
-                where _fact_id=?""", (_fact_id, )).fetchone()[0]
-            if card_type_id not in _fact_ids_in_card_type:
-                _fact_ids_in_card_type[card_type_id] = []
-            _fact_ids_in_card_type[card_type_id].append(_fact_id)
-        # Check if the duplicates are really in the fields that should be
-        # unique.
-        duplicate_facts = set([])
-        for card_type_id in _fact_ids_in_card_type:
-            facts = [self.fact(_fact_id, is_id_internal=True) for _fact_id in \
-                _fact_ids_in_card_type[card_type_id]]
-            for fact_key in self.card_type_with_id(card_type_id).\
-                unique_fact_keys:
-                for i in range(len(facts)):
-                    for j in range(i + 1, len(facts)):
-                        if facts[i][fact_key] == facts[j][fact_key]:
-                            duplicate_facts.add(facts[i])
-                            duplicate_facts.add(facts[j])
+        # Only facts which share the data in one of the unique keys of their
+        # card type are duplicates. We let SQL find the hashes which occur
+        # more than once for such a key, and then stream through the
+        # corresponding data, one hash at a time, to rule out collisions.
+        self.main_widget().set_progress_text(_("Looking for duplicates..."))
+        keys_to_check = []
+        for cursor in self.con.execute(\
+            "select distinct card_type_id from cards"):
+            card_type = self.card_type_with_id(cursor[0])
+            for fact_key in card_type.unique_fact_keys:
+                keys_to_check.append((card_type.id, fact_key))
+        self.main_widget().set_progress_range(len(keys_to_check))
+        duplicate__fact_ids = set()
+        for card_type_id, fact_key in keys_to_check:
+            previous_hash, _fact_ids_for_value = None, {}
+            for hash, _fact_id, value in self.con.execute("""select
+                data_hashes_for_fact.hash, data_for_fact._fact_id,
+                data_for_fact.value from data_hashes_for_fact join
+                data_for_fact on
+                data_for_fact._fact_id=data_hashes_for_fact._fact_id and
+                data_for_fact.key=data_hashes_for_fact.key
+                where data_hashes_for_fact.key=? and exists (select 1 from
+                cards where cards._fact_id=data_hashes_for_fact._fact_id and
+                card_type_id=?) and data_hashes_for_fact.hash in (select hash
+                from data_hashes_for_fact as hashes where key=? and exists
+                (select 1 from cards where cards._fact_id=hashes._fact_id and
+                card_type_id=?) group by hash having count() > 1)
+                order by data_hashes_for_fact.hash""",
+                (fact_key, card_type_id, fact_key, card_type_id)):
+                if hash != previous_hash:
+                    previous_hash, _fact_ids_for_value = hash, {}
+                _fact_ids_for_value.setdefault(value, []).append(_fact_id)
+                if len(_fact_ids_for_value[value]) > 1:
+                    duplicate__fact_ids.update(_fact_ids_for_value[value])
+            self.main_widget().increase_progress(1)
+        self.main_widget().close_progress()
         # Tag the duplicate cards.
-        _card_ids = []
-        for fact in duplicate_facts:
-            _card_ids += [cursor[0] for cursor in self.con.execute(\
-                "select _id from cards where _fact_id=?", (fact._id, ))]
+        _card_ids = [cursor[0] for cursor in self.con.execute(\
+            "select _id from cards where _fact_id in (%s)" % \
+            self._internal_id_list(duplicate__fact_ids))]
         if len(_card_ids) == 0:
             self.main_widget().show_information(_("No duplicates found."))
         else:
@@ -1474,15 +2096,11 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
         # test them in more detail to see if they fullfill all the criteria,
         # and do the conversion.
         card_type_2 = self.card_type_with_id("2")
-        _fact_ids_dealt_with = []
+        candidate_pairs = []
         for key in set(_fact_id_for_front.keys()).\
             intersection(list(_fact_id_for_back.keys())):
             _fact_id_1 = _fact_id_for_front[key]
             _fact_id_2 = _fact_id_for_back[key]
-            # Deal only once with a pair.
-            if _fact_id_1 in _fact_ids_dealt_with or \
-                _fact_id_2 in _fact_ids_dealt_with:
-                continue
             # Try to keep ordering consistent.
             if _fact_id_1 > _fact_id_2:
                 _fact_id_1, _fact_id_2 = _fact_id_2, _fact_id_1
@@ -1493,10 +2111,20 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             if _fact_id_1 not in _card_id_for__fact_id or \
                 _fact_id_2 not in _card_id_for__fact_id:
                 continue
-            _card_id_1 = _card_id_for__fact_id[_fact_id_1]
-            _card_id_2 = _card_id_for__fact_id[_fact_id_2]
-            card_1 = self.card(_card_id_1, is_id_internal=True)
-            card_2 = self.card(_card_id_2, is_id_internal=True)
+            candidate_pairs.append((_fact_id_1, _fact_id_2))
+        # Fetch all the candidate cards in one go. Each card only gets
+        # converted once, so we don't need to worry about stale copies.
+        card_for__card_id = dict((card._id, card) for card in \
+            self.cards_with_internal_ids(set(_card_id_for__fact_id[_fact_id] \
+            for pair in candidate_pairs for _fact_id in pair)))
+        _fact_ids_dealt_with = set()
+        for _fact_id_1, _fact_id_2 in candidate_pairs:
+            # Deal only once with a pair.
+            if _fact_id_1 in _fact_ids_dealt_with or \
+                _fact_id_2 in _fact_ids_dealt_with:
+                continue
+            card_1 = card_for__card_id[_card_id_for__fact_id[_fact_id_1]]
+            card_2 = card_for__card_id[_card_id_for__fact_id[_fact_id_2]]
             # Make sure they are truly duplicates, and not coming
             # from two values for the same key in 'fact_id_for_front' and
             # 'fact_id_for_back'.
@@ -1518,7 +2146,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             self.update_card(card_1)
             self.update_card(card_2)
             # Only now is it safe to mark these cards as dealt with.
-            _fact_ids_dealt_with.extend([_fact_id_1, _fact_id_2])
+            _fact_ids_dealt_with.update([_fact_id_1, _fact_id_2])
 
 
     #
@@ -1530,10 +2158,12 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             return "_id"
         elif sort_key == "random":
             return "random()"
+        # Break ties on the interval, such that the order does not depend on
+        # the query plan.
         elif sort_key == "interval":
-            return "next_rep - last_rep"
+            return "next_rep - last_rep, _id"
         elif sort_key == "-interval":
-            return "last_rep - next_rep"
+            return "last_rep - next_rep, _id"
         else:
             return sort_key
 
@@ -1551,6 +2181,9 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             % sort_key, (limit, )))
 
     def cards_due_for_ret_rep(self, timestamp, sort_key="", limit=-1):
+        if self._use_due_index(sort_key):
+            return self.due_index().cards_due_for_ret_rep(timestamp,
+                self.config()["max_ret_reps_since_lapse"], sort_key, limit)
         sort_key = self._process_sort_key(sort_key)
         return ((cursor[0], cursor[1]) for cursor in self.con.execute("""
             select _id, _fact_id from cards where active=1 and grade>=2
@@ -1559,6 +2192,8 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             self.config()["max_ret_reps_since_lapse"], limit)))
 
     def cards_to_relearn(self, grade, sort_key="", limit=-1):
+        if self._use_due_index(sort_key):
+            return self.due_index().cards_to_relearn(grade, sort_key, limit)
         sort_key = self._process_sort_key(sort_key)
         return ((cursor[0], cursor[1]) for cursor in self.con.execute("""
             select _id, _fact_id from cards where
@@ -1566,6 +2201,9 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             % sort_key, (grade, limit)))
 
     def cards_new_memorising(self, grade, sort_key="", limit=-1):
+        if self._use_due_index(sort_key):
+            return self.due_index().cards_new_memorising(grade, sort_key,
+                limit)
         sort_key = self._process_sort_key(sort_key)
         return ((cursor[0], cursor[1]) for cursor in self.con.execute("""
             select _id, _fact_id from cards where
@@ -1573,6 +2211,8 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             % sort_key, (grade, limit)))
 
     def cards_unseen(self, sort_key="", limit=-1):
+        if self._use_due_index(sort_key):
+            return self.due_index().cards_unseen(sort_key, limit)
         sort_key = self._process_sort_key(sort_key)
         return ((cursor[0], cursor[1]) for cursor in self.con.execute("""
             select _id, _fact_id from cards where
@@ -1580,6 +2220,9 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             % sort_key, (limit, )))
 
     def cards_learn_ahead(self, timestamp, sort_key="", limit=-1):
+        if self._use_due_index(sort_key):
+            return self.due_index().cards_learn_ahead(timestamp,
+                self.config()["max_ret_reps_since_lapse"], sort_key, limit)
         sort_key = self._process_sort_key(sort_key)
         return ((cursor[0], cursor[1]) for cursor in self.con.execute("""
             select _id, _fact_id from cards where
@@ -1600,6 +2243,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
     def set_scheduler_data(self, scheduler_data):
         self.con.execute("update cards set scheduler_data=?",
             (scheduler_data, ))
+        self._card_cache.clear()
 
     def cards_with_scheduler_data(self, scheduler_data, sort_key="",
                                   limit=-1, max_ret_reps=-1):
@@ -1618,8 +2262,10 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             where active=1 and scheduler_data=? %s """ % extra_cond,
             (scheduler_data, )).fetchone()[0]
 
-    def has_already_warned_today(self, start_of_day, end_of_day):
-        result = self.database().con.execute(
+    def has_already_warned_today(self, start_of_day, end_of_day, con=None):
+        if con is None:
+            con = self.con
+        result = con.execute(
             """select timestamp from log where ? <= log.timestamp and
             log.timestamp <? and log.event_type=?""",
             (start_of_day, end_of_day,
@@ -1647,6 +2293,7 @@ _("Putting a database on a network drive is forbidden under Windows to avoid dat
             "select count() from cards " + clause, args).fetchone()[0]
 
     def known_recognition_questions_from_card_types_ids(self, card_type_ids):
+        self.regenerate_pregenerated_data()
         clause, args = \
             self._where_clause_known_recognition_questions(card_type_ids)
         return (cursor[0] for cursor in \
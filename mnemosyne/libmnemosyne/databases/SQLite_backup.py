@@ -0,0 +1,460 @@
+#
+# SQLite_backup.py <Peter.Bienstman@gmail.com>
+#
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from mnemosyne.libmnemosyne.gui_translator import _
+from mnemosyne.libmnemosyne.databases.SQLite_log_database import \
+     LOG_DATABASE, LOG_DATABASE_SUFFIX
+
+# Incremental backups consist of a manifest, listing the SHA-256 hashes of the
+# chunks the database file is made of. The chunks themselves are stored
+# compressed in a directory shared by all backups, named after their hash,
+# such that chunks which did not change since a previous backup don't take up
+# any extra space.
+
+MANIFEST_SUFFIX = ".manifest"
+MANIFEST_VERSION = 1
+CHUNK_DIR = "chunks"
+
+
+class SQLiteBackup(object):
+
+    """Code to be injected into the SQLite database class through inheritance,
+    so that SQLite.py does not becomes too large.
+
+    Backups are made through SQLite's online backup API, using connections of
+    their own. This means they can also run in a background thread while the
+    main connection continues to be used for e.g. reviews. If the database
+    gets modified during the copy, SQLite restarts the backup, so the result
+    is always a consistent snapshot.
+
+    Note that only committed data ends up in the backup, so we save first.
+
+    If the 'incremental_backups' option is set, the backup is written to the
+    chunk store instead of to a separate copy of the database file, see
+    '_store_database'.
+
+    A separate log database is backed up as well, to a file with the same
+    name as the backup of the main database, followed by '-log', or as a
+    second list of chunks in the manifest.
+
+    """
+
+    # Number of pages copied in each step of a background backup, and the
+    # time we pause between steps to let writers in. When using a write-ahead
+    # log, readers don't block writers, so we copy everything in one step,
+    # i.e. from a single snapshot.
+    backup_pages_per_step = 1024
+    backup_sleep_between_steps = 0.01
+
+    # Size of the chunks in the chunk store. Needs to be a multiple of the page
+    # size, so that a changed page only affects a single chunk.
+    backup_chunk_size = 64 * 1024
+    backup_compression_level = 1
+    backup_manifest_suffix = MANIFEST_SUFFIX
+
+    _backup_thread = None
+    _backup_db_name = None
+    _backup_result = None
+    _backup_statistics = None
+
+    def _start_backup(self, backupfile, background, progress):
+        db_name = os.path.basename(self._path).rsplit(".", 1)[0]
+        if backupfile.endswith(MANIFEST_SUFFIX):
+            copy_database = self._store_database
+            # Move everything to the database file, such that we can read
+            # it from there.
+            self.con.checkpoint("TRUNCATE")
+        else:
+            copy_database = self._copy_database
+        log_path = None
+        if self.has_separate_log_database():
+            log_path = self.log_database_path()
+        if not background:
+            self._backup_result = copy_database(self._path, backupfile,
+                pages=-1, progress=progress, log_path=log_path)
+            return self._finish_backup(db_name)
+        if self.con.journal_mode == "wal":
+            pages = -1
+        else:
+            pages = self.backup_pages_per_step
+        path = self._path
+        def run():
+            self._backup_result = \
+                copy_database(path, backupfile, pages, progress, log_path)
+        self._backup_db_name = db_name
+        self._backup_thread = threading.Thread(target=run)
+        self._backup_thread.start()
+        return backupfile
+
+    def backup_in_progress(self):
+        return self._backup_thread is not None and \
+            self._backup_thread.is_alive()
+
+    def wait_for_backup(self, block=True):
+
+        """Wait for a background backup to finish, if any, and return the
+        name of the backup file. If 'block' is False, only finish the backup
+        if the copying is already done.
+
+        """
+
+        if self._backup_thread is None:
+            return None
+        if not block and self._backup_thread.is_alive():
+            return None
+        self._backup_thread.join()
+        self._backup_thread = None
+        return self._finish_backup(self._backup_db_name)
+
+    def backup_statistics(self):
+
+        """Returns a dictionary with the file name, the number of pages and
+        restarts and the time in seconds it took to create the last backup.
+        For incremental backups, it also contains the total number of chunks,
+        and the number of chunks and bytes which actually got written.
+
+        """
+
+        return self._backup_statistics
+
+    def _copy_database(self, path, backupfile, pages, progress,
+                       log_path=None):
+
+        """Copy the database and its log database, if any, from a single
+        connection which has the log attached, such that the cards and the
+        log in the backup belong together.
+
+        When copying everything in one step, we do this from a single read
+        transaction. When copying in steps to let writers in, holding a read
+        transaction would keep them out for the entire copy, so we start over
+        instead if the database got modified before the log was copied.
+
+        """
+
+        start = time.time()
+        statistics = {"file": backupfile, "pages": 0, "restarts": 0}
+        files = [("main", backupfile)]
+        if log_path is not None:
+            files.append((LOG_DATABASE, backupfile + LOG_DATABASE_SUFFIX))
+        # Write to temporary files first, so that a partial backup never
+        # gets mistaken for a real one.
+        tmpfiles = [destination_path + ".tmp" for schema, destination_path \
+            in files]
+        def copy(source, schema, tmpfile):
+            copied = {"pages": 0}
+            def report(status, remaining, total):
+                # Note that steps can also fail to copy anything because the
+                # database was locked.
+                if status in (sqlite3.SQLITE_OK, sqlite3.SQLITE_DONE):
+                    # When the source got modified, the backup restarts, and
+                    # the number of pages copied no longer goes up.
+                    if copied["pages"] and \
+                        total - remaining <= copied["pages"]:
+                        statistics["restarts"] += 1
+                    copied["pages"] = total - remaining
+                if progress:
+                    progress(remaining, total)
+            destination = sqlite3.connect(tmpfile)
+            try:
+                source.backup(destination, pages=pages, progress=report,
+                    name=schema, sleep=self.backup_sleep_between_steps)
+            finally:
+                destination.close()
+            return copied["pages"]
+        try:
+            source = sqlite3.connect(path, isolation_level=None)
+            try:
+                if log_path is not None:
+                    source.execute("attach database ? as %s" % LOG_DATABASE,
+                        (log_path, ))
+                if pages == -1:
+                    source.execute("begin")
+                    # Reading from each database starts the read transaction.
+                    for schema, destination_path in files:
+                        source.execute("pragma %s.page_count" % schema)
+                    statistics["pages"] = sum(copy(source, schema, tmpfile) \
+                        for (schema, destination_path), tmpfile in \
+                        zip(files, tmpfiles))
+                    source.execute("commit")
+                else:
+                    while True:
+                        data_version = source.execute(\
+                            "pragma main.data_version").fetchone()[0]
+                        statistics["pages"] = copy(source, "main", tmpfiles[0])
+                        if log_path is None:
+                            break
+                        statistics["pages"] += copy(source, LOG_DATABASE,
+                            tmpfiles[1])
+                        if source.execute("pragma main.data_version").\
+                            fetchone()[0] == data_version:
+                            break
+                        statistics["restarts"] += 1
+            finally:
+                source.close()
+            for (schema, destination_path), tmpfile in zip(files, tmpfiles):
+                os.replace(tmpfile, destination_path)
+        except Exception as e:
+            # Don't leave a backup without its log behind.
+            for filename in tmpfiles + [backupfile]:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            return backupfile, e
+        statistics["time"] = time.time() - start
+        self._backup_statistics = statistics
+        return backupfile, None
+
+    def _finish_backup(self, db_name):
+        backupfile, error = self._backup_result
+        if error is not None or not os.path.exists(backupfile) or \
+          not os.stat(backupfile).st_size:
+            self.main_widget().show_information(\
+                _("Warning: backup creation failed for") + " " +  backupfile)
+            return None
+        for f in self.component_manager.all("hook", "after_backup"):
+            f.run(backupfile)
+        # Only keep the last logs.
+        backupdir = os.path.dirname(backupfile)
+        files = [f for f in os.listdir(backupdir) \
+                if f.startswith(db_name + "-") and not f.endswith(".tmp") \
+                and not f.endswith(LOG_DATABASE_SUFFIX)]
+        files.sort()
+        if len(files) > self.config()["max_backups"]:
+            surplus = len(files) - self.config()["max_backups"]
+            for file in files[0:surplus]:
+                os.remove(os.path.join(backupdir, file))
+                log_file = os.path.join(backupdir, file + LOG_DATABASE_SUFFIX)
+                if os.path.exists(log_file):
+                    os.remove(log_file)
+        if os.path.exists(os.path.join(backupdir, CHUNK_DIR)):
+            self.collect_backup_garbage()
+        return backupfile
+
+    def _store_database(self, path, manifest_file, pages, progress,
+                        log_path=None):
+
+        """Write the chunks of the database which are not yet in the store,
+        followed by the manifest.
+
+        We read the database file directly, while holding a read transaction
+        to keep writers from committing in the mean time. This is only
+        possible if all the data is in the database file, i.e. if there is
+        nothing in the write-ahead log, and if we don't want to block writers
+        for too long, like for a background backup without a write-ahead log.
+        In the other cases, we make a snapshot through the backup API first.
+
+        """
+
+        chunkdir = os.path.join(os.path.dirname(manifest_file), CHUNK_DIR)
+        start = time.time()
+        snapshot = None
+        schemas = [("main", path)]
+        if log_path is not None:
+            schemas.append((LOG_DATABASE, log_path))
+        try:
+            if not os.path.exists(chunkdir):
+                os.makedirs(chunkdir)
+            source = sqlite3.connect(path, isolation_level=None)
+            try:
+                if log_path is not None:
+                    source.execute("attach database ? as %s" % LOG_DATABASE,
+                        (log_path, ))
+                source.execute("begin")
+                # Reading the page count starts the read transaction.
+                page_count, page_size = {}, {}
+                for schema, schema_path in schemas:
+                    page_count[schema] = source.execute(\
+                        "pragma %s.page_count" % schema).fetchone()[0]
+                    page_size[schema] = source.execute(\
+                        "pragma %s.page_size" % schema).fetchone()[0]
+                in_wal = [schema_path for schema, schema_path in schemas if \
+                    os.path.exists(schema_path + "-wal") and \
+                    os.path.getsize(schema_path + "-wal")]
+                if pages != -1 or in_wal:
+                    source.execute("rollback")
+                    snapshot, error = self._copy_database(path,
+                        os.path.join(chunkdir, "snapshot"), pages, progress,
+                        log_path)
+                    if error is not None:
+                        raise error
+                    statistics = self._backup_statistics
+                    files = {"main": snapshot,
+                             LOG_DATABASE: snapshot + LOG_DATABASE_SUFFIX}
+                    sizes = dict((schema, os.path.getsize(files[schema])) \
+                        for schema, schema_path in schemas)
+                    progress = None
+                else:
+                    statistics = {"pages": sum(page_count.values()),
+                                  "restarts": 0}
+                    files = dict(schemas)
+                    sizes = dict((schema, page_count[schema] * \
+                        page_size[schema]) for schema, schema_path in schemas)
+                manifest = self._write_chunks(files["main"], sizes["main"],
+                    page_size["main"], chunkdir, statistics, progress)
+                if log_path is not None:
+                    manifest["log"] = self._write_chunks(files[LOG_DATABASE],
+                        sizes[LOG_DATABASE], page_size[LOG_DATABASE],
+                        chunkdir, statistics, progress)
+            finally:
+                source.close()
+            tmpfile = manifest_file + ".tmp"
+            with open(tmpfile, "wb") as f:
+                f.write(zlib.compress(json.dumps(manifest).encode("utf-8")))
+            os.replace(tmpfile, manifest_file)
+        except Exception as e:
+            if os.path.exists(manifest_file + ".tmp"):
+                os.remove(manifest_file + ".tmp")
+            return manifest_file, e
+        finally:
+            if snapshot:
+                for filename in [snapshot, snapshot + LOG_DATABASE_SUFFIX]:
+                    if os.path.exists(filename):
+                        os.remove(filename)
+        statistics["file"] = manifest_file
+        statistics["time"] = time.time() - start
+        self._backup_statistics = statistics
+        return manifest_file, None
+
+    def _write_chunks(self, path, size, page_size, chunkdir, statistics,
+                      progress):
+        chunk_size = max(page_size,
+            self.backup_chunk_size - self.backup_chunk_size % page_size)
+        for key in ["chunks", "chunks_written", "bytes_written"]:
+            statistics.setdefault(key, 0)
+        chunks = []
+        with open(path, "rb") as f:
+            position = 0
+            while position < size:
+                data = f.read(min(chunk_size, size - position))
+                if not data:
+                    raise IOError("Unexpected end of file: " + path)
+                position += len(data)
+                key = hashlib.sha256(data).hexdigest()
+                chunks.append(key)
+                chunk_file = self._chunk_file(chunkdir, key)
+                if not os.path.exists(chunk_file):
+                    if not os.path.exists(os.path.dirname(chunk_file)):
+                        os.makedirs(os.path.dirname(chunk_file))
+                    data = zlib.compress(data, self.backup_compression_level)
+                    with open(chunk_file + ".tmp", "wb") as chunk:
+                        chunk.write(data)
+                    os.replace(chunk_file + ".tmp", chunk_file)
+                    statistics["chunks_written"] += 1
+                    statistics["bytes_written"] += len(data)
+                if progress:
+                    progress((size - position) // page_size, size // page_size)
+        statistics["chunks"] += len(chunks)
+        return {"version": MANIFEST_VERSION, "page_size": page_size,
+                "size": size, "chunks": chunks}
+
+    def _chunk_file(self, chunkdir, key):
+        # Spread the chunks over subdirectories to keep directories small.
+        return os.path.join(chunkdir, key[:2], key)
+
+    def _read_manifest(self, manifest_file):
+        try:
+            with open(manifest_file, "rb") as f:
+                manifest = json.loads(\
+                    zlib.decompress(f.read()).decode("utf-8"))
+        except (zlib.error, ValueError):
+            raise RuntimeError(_("Backup is corrupt:") + " " + manifest_file)
+        if manifest.get("version", None) != MANIFEST_VERSION:
+            raise RuntimeError(_("Unsupported backup format:") + " " + \
+                manifest_file)
+        return manifest
+
+    def _assemble_database(self, manifest_file, path):
+
+        """Reconstruct the database file from the chunk store, verifying
+        that none of the chunks got corrupted. Returns a list of temporary
+        files and the paths they should be moved to, which also includes the
+        log database if the backup has one.
+
+        """
+
+        manifest = self._read_manifest(manifest_file)
+        files = [(manifest, path)]
+        if "log" in manifest:
+            files.append((manifest["log"], path + LOG_DATABASE_SUFFIX))
+        assembled = []
+        try:
+            for file_manifest, restored_path in files:
+                tmpfile = restored_path + ".tmp"
+                self._assemble_file(manifest_file, file_manifest, tmpfile)
+                assembled.append((tmpfile, restored_path))
+        except Exception:
+            for tmpfile, restored_path in assembled:
+                os.remove(tmpfile)
+            raise
+        return assembled
+
+    def _assemble_file(self, manifest_file, manifest, tmpfile):
+        chunkdir = os.path.join(os.path.dirname(manifest_file), CHUNK_DIR)
+        try:
+            with open(tmpfile, "wb") as f:
+                for key in manifest["chunks"]:
+                    chunk_file = self._chunk_file(chunkdir, key)
+                    if not os.path.exists(chunk_file):
+                        raise RuntimeError(_("Backup is incomplete:") + \
+                            " " + manifest_file)
+                    with open(chunk_file, "rb") as chunk:
+                        data = chunk.read()
+                    try:
+                        data = zlib.decompress(data)
+                    except zlib.error:
+                        data = None
+                    if data is None or hashlib.sha256(data).hexdigest() != key:
+                        raise RuntimeError(_("Backup is corrupt:") + " " + \
+                            manifest_file)
+                    f.write(data)
+                if f.tell() != manifest["size"]:
+                    raise RuntimeError(_("Backup is corrupt:") + " " + \
+                        manifest_file)
+        except Exception:
+            os.remove(tmpfile)
+            raise
+
+    def collect_backup_garbage(self):
+
+        """Remove the chunks which are no longer used by any of the backups
+        in the backup directory, and return how many were removed.
+
+        """
+
+        if self.backup_in_progress():
+            return 0
+        backupdir = os.path.join(self.config().data_dir, "backups")
+        chunkdir = os.path.join(backupdir, CHUNK_DIR)
+        if not os.path.exists(chunkdir):
+            return 0
+        used_chunks = set()
+        for filename in os.listdir(backupdir):
+            if filename.endswith(MANIFEST_SUFFIX):
+                try:
+                    manifest = self._read_manifest(\
+                        os.path.join(backupdir, filename))
+                    used_chunks.update(manifest["chunks"])
+                    if "log" in manifest:
+                        used_chunks.update(manifest["log"]["chunks"])
+                except Exception:
+                    # Better to waste some space than to risk deleting
+                    # chunks from a backup we don't understand.
+                    return 0
+        removed = 0
+        for subdir in os.listdir(chunkdir):
+            subdir = os.path.join(chunkdir, subdir)
+            if not os.path.isdir(subdir):
+                continue
+            for key in os.listdir(subdir):
+                if key not in used_chunks:
+                    os.remove(os.path.join(subdir, key))
+                    removed += 1
+        return removed
@@ -60,3 +60,38 @@ class DefaultCriterionApplier(CriterionApplier):
         for chunked__tag_ids in self.split_set(\
                 criterion._tag_ids_forbidden, 500):
             self.set_activity_for_tags_with__id(chunked__tag_ids, active=0)
+
+    def apply_to_cards_with_internal_ids(self, criterion, _card_ids,
+                                         chunk_size=5000):
+        # Instead of turning everything off and then on again, we calculate
+        # the final value of 'active' directly, and only for '_card_ids'.
+        # This gives the same result as 'apply_to_database', as the activity
+        # of a card only depends on its own card type, fact view and tags.
+        if len(criterion._tag_ids_forbidden) != 0:
+            assert len(criterion._tag_ids_active) != 0
+        db = self.database()
+        # Note that tag _ids are integers, so we can safely inline them.
+        id_list = db._internal_id_list
+        tag_count = db.con.execute("select count() from tags").fetchone()[0]
+        if len(criterion._tag_ids_active) == tag_count:
+            # Every card has at least one tag, if only __UNTAGGED__.
+            condition = "1"
+        elif len(criterion._tag_ids_active) == 0:
+            condition = "0"
+        else:
+            condition = """exists (select 1 from tags_for_card where
+                _card_id=cards._id and _tag_id in (%s))""" \
+                % id_list(criterion._tag_ids_active)
+        args = []
+        for card_type_id, fact_view_id in \
+                criterion.deactivated_card_type_fact_view_ids:
+            condition += " and not (fact_view_id=? and card_type_id=?)"
+            args.append(fact_view_id)
+            args.append(card_type_id)
+        if criterion._tag_ids_forbidden:
+            condition += """ and not exists (select 1 from tags_for_card
+                where _card_id=cards._id and _tag_id in (%s))""" \
+                % id_list(criterion._tag_ids_forbidden)
+        for chunked__card_ids in self.split_set(set(_card_ids), chunk_size):
+            db.con.execute("update cards set active=(%s) where _id in (%s)" \
+                % (condition, id_list(chunked__card_ids)), args)
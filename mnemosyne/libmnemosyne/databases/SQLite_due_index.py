@@ -0,0 +1,681 @@
+#
+# SQLite_due_index.py <Peter.Bienstman@gmail.com>
+#
+
+import heapq
+import bisect
+import random
+import itertools
+import threading
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class DueIndex(object):
+
+    """Compact copy of the scheduling data of the active cards, such that the
+    scheduler can build its queue without going to the database.
+
+    The data is stored column by column in standard library arrays, which
+    can be updated in place when a single card changes. If NumPy is
+    available, the selections work directly on the memory of these arrays.
+    Otherwise, we keep track of the cards per grade, and of the cards in the
+    retention phase sorted on their next repetition, so that plain Python
+    does not need to look at all the cards either.
+
+    Ties in the sort order are broken in the same way as in the
+    corresponding SQL queries, i.e. by the card's _id, or, when sorting on
+    'next_rep', following the order of the index on the cards table which
+    these queries use.
+
+    """
+
+    # The timestamps are not always integers, e.g. for cards coming from
+    # other programs.
+    columns = (("_id", "q"), ("_fact_id", "q"), ("grade", "q"),
+        ("next_rep", "d"), ("last_rep", "d"), ("lapses", "q"),
+        ("easiness", "d"), ("acq_reps", "q"), ("ret_reps_since_lapse", "q"))
+
+    sort_keys = ("", "random", "interval", "-interval", "next_rep")
+
+    def __init__(self, rows=()):
+        for column, typecode in self.columns:
+            setattr(self, column, array(typecode))
+        self._row_for__id = {}
+        self._ids_for_grade = {}
+        self._retention_order = []
+        for sql_res in rows:
+            self._append(sql_res, in_order=False)
+        self._retention_order.sort()
+
+    def __len__(self):
+        return len(self._id)
+
+    def __contains__(self, _card_id):
+        return _card_id in self._row_for__id
+
+    def _append(self, values, in_order=True):
+        self._row_for__id[values[0]] = len(self._id)
+        for (column, typecode), value in zip(self.columns, values):
+            getattr(self, column).append(value)
+        if not numpy:
+            self._add_to_lookups(len(self._id) - 1, in_order)
+
+    def _retention_entry(self, row):
+        return (self.next_rep[row], self.ret_reps_since_lapse[row],
+            self._fact_id[row], self._id[row])
+
+    def _add_to_lookups(self, row, in_order=True):
+        grade = self.grade[row]
+        if grade < 2:
+            self._ids_for_grade.setdefault(grade, set()).add(self._id[row])
+        elif in_order:
+            bisect.insort(self._retention_order, self._retention_entry(row))
+        else:
+            self._retention_order.append(self._retention_entry(row))
+
+    def _remove_from_lookups(self, row):
+        grade = self.grade[row]
+        if grade < 2:
+            self._ids_for_grade[grade].discard(self._id[row])
+        else:
+            del self._retention_order[bisect.bisect_left(\
+                self._retention_order, self._retention_entry(row))]
+
+    def update(self, card):
+        if not card.active:
+            self.discard(card._id)
+            return
+        values = (card._id, card.fact._id, card.grade, card.next_rep,
+            card.last_rep, card.lapses, card.easiness, card.acq_reps,
+            card.ret_reps_since_lapse)
+        row = self._row_for__id.get(card._id)
+        if row is None:
+            self._append(values)
+            return
+        if not numpy:
+            self._remove_from_lookups(row)
+        for (column, typecode), value in zip(self.columns, values):
+            getattr(self, column)[row] = value
+        if not numpy:
+            self._add_to_lookups(row)
+
+    def discard(self, _card_id):
+        row = self._row_for__id.pop(_card_id, None)
+        if row is None:
+            return
+        if not numpy:
+            self._remove_from_lookups(row)
+        # Keep the arrays dense by moving the last row into the hole.
+        last = len(self._id) - 1
+        for column, typecode in self.columns:
+            values = getattr(self, column)
+            values[row] = values[last]
+            values.pop()
+        if row != last:
+            self._row_for__id[self._id[row]] = row
+
+    #
+    # Queries, see the corresponding functions in SQLite.py.
+    #
+
+    def cards_due_for_ret_rep(self, timestamp, max_ret_reps_since_lapse,
+                              sort_key="", limit=-1):
+        if numpy:
+            grade, next_rep, ret_reps_since_lapse = self._numpy_columns(\
+                "grade", "next_rep", "ret_reps_since_lapse")
+            return self._sorted_rows(numpy.flatnonzero((grade >= 2) & \
+                (next_rep <= timestamp) & \
+                (ret_reps_since_lapse <= max_ret_reps_since_lapse)),
+                sort_key, limit)
+        end = self._retention_position(timestamp)
+        return self._sorted_ids([entry[3] for entry in \
+            self._retention_order[:end] \
+            if entry[1] <= max_ret_reps_since_lapse], sort_key, limit)
+
+    def cards_to_relearn(self, grade, sort_key="", limit=-1):
+        if numpy:
+            grades, lapses = self._numpy_columns("grade", "lapses")
+            return self._sorted_rows(numpy.flatnonzero(\
+                (grades == grade) & (lapses > 0)), sort_key, limit)
+        return self._sorted_ids([_card_id for _card_id in \
+            self._ids_for_grade.get(grade, ()) if \
+            self.lapses[self._row_for__id[_card_id]] > 0], sort_key, limit)
+
+    def cards_new_memorising(self, grade, sort_key="", limit=-1):
+        if numpy:
+            grades, lapses = self._numpy_columns("grade", "lapses")
+            return self._sorted_rows(numpy.flatnonzero(\
+                (grades == grade) & (lapses == 0)), sort_key, limit)
+        return self._sorted_ids([_card_id for _card_id in \
+            self._ids_for_grade.get(grade, ()) if \
+            self.lapses[self._row_for__id[_card_id]] == 0], sort_key, limit)
+
+    def cards_unseen(self, sort_key="", limit=-1):
+        if numpy:
+            grade, = self._numpy_columns("grade")
+            return self._sorted_rows(numpy.flatnonzero(grade == -1),
+                sort_key, limit)
+        return self._sorted_ids(list(self._ids_for_grade.get(-1, ())),
+            sort_key, limit)
+
+    def cards_learn_ahead(self, timestamp, max_ret_reps_since_lapse,
+                          sort_key="", limit=-1):
+        if numpy:
+            grade, next_rep, ret_reps_since_lapse = self._numpy_columns(\
+                "grade", "next_rep", "ret_reps_since_lapse")
+            return self._sorted_rows(numpy.flatnonzero((grade >= 2) & \
+                (next_rep > timestamp) & \
+                (ret_reps_since_lapse <= max_ret_reps_since_lapse)),
+                sort_key, limit)
+        start = self._retention_position(timestamp)
+        _card_ids = []
+        for entry in itertools.islice(self._retention_order, start, None):
+            if entry[1] <= max_ret_reps_since_lapse:
+                _card_ids.append(entry[3])
+                # Already in the right order, no need to look further.
+                if sort_key == "next_rep" and len(_card_ids) == limit:
+                    break
+        return self._sorted_ids(_card_ids, sort_key, limit)
+
+    def _retention_position(self, timestamp):
+        # Position of the first card with 'next_rep' after 'timestamp'.
+        return bisect.bisect_right(self._retention_order,
+            (timestamp, float("inf")))
+
+    def _numpy_columns(self, *columns):
+        # Views on the memory of the arrays. These need to be gone before
+        # the next update, as an array can't grow while it is being viewed.
+        return [numpy.frombuffer(getattr(self, column),
+            dtype=getattr(self, column).typecode) if len(self._id) else \
+            numpy.zeros(0) for column in columns]
+
+    def _sorted_rows(self, rows, sort_key, limit):
+        if not len(rows):
+            return []
+        if sort_key == "random":
+            rows = rows.tolist()
+            if limit < 0 or limit > len(rows):
+                limit = len(rows)
+            rows = random.sample(rows, limit)
+        else:
+            _id, _fact_id, next_rep, last_rep, ret_reps_since_lapse = \
+                self._numpy_columns("_id", "_fact_id", "next_rep",
+                "last_rep", "ret_reps_since_lapse")
+            # The last key is the primary one.
+            if sort_key == "":
+                keys = (_id, )
+            elif sort_key == "interval":
+                keys = (_id, next_rep - last_rep)
+            elif sort_key == "-interval":
+                keys = (_id, last_rep - next_rep)
+            else:
+                keys = (_id, _fact_id, ret_reps_since_lapse, next_rep)
+            rows = rows[numpy.lexsort([key[rows] for key in keys])]
+            if limit >= 0:
+                rows = rows[:limit]
+            rows = rows.tolist()
+        return [(self._id[row], self._fact_id[row]) for row in rows]
+
+    def _sorted_ids(self, _card_ids, sort_key, limit):
+        if sort_key == "random":
+            if limit < 0 or limit > len(_card_ids):
+                limit = len(_card_ids)
+            _card_ids = random.sample(_card_ids, limit)
+        else:
+            row_for__id = self._row_for__id
+            if sort_key == "":
+                key = None
+            elif sort_key == "interval":
+                key = lambda _card_id: (self.next_rep[row_for__id[_card_id]]\
+                    - self.last_rep[row_for__id[_card_id]], _card_id)
+            elif sort_key == "-interval":
+                key = lambda _card_id: (self.last_rep[row_for__id[_card_id]]\
+                    - self.next_rep[row_for__id[_card_id]], _card_id)
+            else:
+                key = lambda _card_id: \
+                    self._retention_entry(row_for__id[_card_id])
+            if limit >= 0:
+                _card_ids = heapq.nsmallest(limit, _card_ids, key=key)
+            else:
+                _card_ids = sorted(_card_ids, key=key)
+        return [(_card_id, self._fact_id[self._row_for__id[_card_id]]) \
+            for _card_id in _card_ids]
+
+
+class QueueSnapshot(object):
+
+    """The part of the active cards the scheduler needs to build its next
+    queue, read by a worker thread while the reviews continue.
+
+    As opposed to the 'DueIndex' it wraps, this only contains the cards which
+    the queries can return, i.e. all the cards in the acquisition phase, and
+    for the others the first 'limit' ones in the order the scheduler asks
+    for, as it never asks for more. Only the sort keys which don't involve
+    randomness are supported.
+
+    The cards which get changed in the mean time, and the ones which were
+    not yet committed when starting, are applied to it just before it gets
+    used. Such a card can take the place of one of the cards
+    we fetched, or make room for a card we did not fetch, which is why we
+    fetch 'margin' extra cards, and give up when more cards than that got
+    changed.
+
+    For the cards which are likely to end up in the queue, we also fetch the
+    rows needed to construct the card objects, see 'SQLiteDueIndex'.
+
+    """
+
+    def __init__(self, timestamp, start_of_day, end_of_day,
+                 max_ret_reps_since_lapse, limit, margin):
+        self.timestamp = timestamp
+        self.start_of_day = start_of_day
+        self.end_of_day = end_of_day
+        self.max_ret_reps_since_lapse = max_ret_reps_since_lapse
+        self.limit = limit
+        self.margin = margin
+        self.index = None
+        self.next_rep_boundary = None
+        self.already_warned_today = False
+        self.card_rows = []
+        self.tag_rows = []
+        self.fact_rows = []
+        self.fact_data_rows = []
+        self._active_count = 0
+        # Cards changed after starting, None for deleted ones.
+        self.card_for_changed__card_id = {}
+        self.is_valid = True
+        self.thread = None
+        self.card_cache_generation = None
+
+    def is_usable(self, timestamp, start_of_day, max_ret_reps_since_lapse):
+        return self.is_valid and self.index is not None and \
+            len(self.card_for_changed__card_id) <= self.margin and \
+            self.active_count() > 0 and start_of_day == self.start_of_day \
+            and max_ret_reps_since_lapse == self.max_ret_reps_since_lapse \
+            and (self.next_rep_boundary is None or \
+            timestamp < self.next_rep_boundary)
+
+    def card_changed(self, card):
+        self.card_for_changed__card_id[card._id] = card
+
+    def card_deleted(self, _card_id):
+        self.card_for_changed__card_id[_card_id] = None
+
+    def apply_changes(self):
+        for _card_id, card in self.card_for_changed__card_id.items():
+            if card is None:
+                self.index.discard(_card_id)
+            else:
+                self.index.update(card)
+
+    #
+    # Queries, see the corresponding functions in SQLite.py.
+    #
+
+    def active_count(self):
+        # Only a lower bound, but the scheduler just wants to know whether
+        # there are any active cards at all.
+        return self._active_count - len(self.card_for_changed__card_id)
+
+    def has_already_warned_today(self, start_of_day, end_of_day):
+        return self.already_warned_today
+
+    def cards_due_for_ret_rep(self, timestamp, sort_key="", limit=-1):
+        return self.index.cards_due_for_ret_rep(timestamp,
+            self.max_ret_reps_since_lapse, sort_key, limit)
+
+    def cards_to_relearn(self, grade, sort_key="", limit=-1):
+        return self.index.cards_to_relearn(grade, sort_key, limit)
+
+    def cards_new_memorising(self, grade, sort_key="", limit=-1):
+        return self.index.cards_new_memorising(grade, sort_key, limit)
+
+    def cards_unseen(self, sort_key="", limit=-1):
+        return self.index.cards_unseen(sort_key, limit)
+
+    def cards_learn_ahead(self, timestamp, sort_key="", limit=-1):
+        return self.index.cards_learn_ahead(timestamp,
+            self.max_ret_reps_since_lapse, sort_key, limit)
+
+
+class SisterCardNextReps(object):
+
+    """For each fact, the next repetitions of its active cards in the
+    retention phase, such that a card can be kept away from the days its
+    sister cards are scheduled on without going to the database for each
+    candidate day.
+
+    The facts are added one at a time, the first time they are needed. For
+    facts which are not present, changes to their cards can be ignored.
+
+    """
+
+    def __init__(self):
+        self._next_rep_for__card_id_for__fact_id = {}
+        self._fact_id_for__card_id = {}
+
+    def __contains__(self, _fact_id):
+        return _fact_id in self._next_rep_for__card_id_for__fact_id
+
+    def add_fact(self, _fact_id, rows):
+
+        """'rows' are tuples of _card_id, active, grade, next_rep for all the
+        cards of the fact.
+
+        """
+
+        next_rep_for__card_id = {}
+        for _card_id, active, grade, next_rep in rows:
+            if active and grade >= 2:
+                next_rep_for__card_id[_card_id] = next_rep
+            self._fact_id_for__card_id[_card_id] = _fact_id
+        self._next_rep_for__card_id_for__fact_id[_fact_id] = \
+            next_rep_for__card_id
+
+    def next_reps(self, _fact_id, exclude__card_id=None):
+        return [next_rep for _card_id, next_rep in \
+            self._next_rep_for__card_id_for__fact_id[_fact_id].items() \
+            if _card_id != exclude__card_id]
+
+    def update(self, card):
+        # The card could have been moved to a different fact.
+        if self._fact_id_for__card_id.get(card._id) != card.fact._id:
+            self.discard(card._id)
+        next_rep_for__card_id = \
+            self._next_rep_for__card_id_for__fact_id.get(card.fact._id)
+        if next_rep_for__card_id is None:
+            return
+        self._fact_id_for__card_id[card._id] = card.fact._id
+        if card.active and card.grade >= 2:
+            next_rep_for__card_id[card._id] = card.next_rep
+        else:
+            next_rep_for__card_id.pop(card._id, None)
+
+    def discard(self, _card_id):
+        _fact_id = self._fact_id_for__card_id.pop(_card_id, None)
+        if _fact_id is not None:
+            self._next_rep_for__card_id_for__fact_id[_fact_id].\
+                pop(_card_id, None)
+
+
+class SQLiteDueIndex(object):
+
+    """Code to be injected into the SQLite database class through inheritance,
+    so that SQLite.py does not becomes too large.
+
+    With the 'in_memory_due_index' option set, the card queries used by the
+    scheduler to build its queue are answered from a 'DueIndex', which gets
+    loaded the first time it is needed. Changes to a single card are applied
+    to it directly, other changes to the cards table, like applying a
+    criterion or syncing repetitions, throw it away, to be loaded again
+    when needed.
+
+    The next repetitions of the sister cards used by the scheduler to spread
+    out the cards of a fact are kept in memory in the same way, but
+    regardless of that option, as this only requires fetching the cards of
+    a fact once.
+
+    Finally, the scheduler can have the data for its next queue read in the
+    background through a 'QueueSnapshot', see 'start_queue_snapshot'. As the
+    connection used for that does not see the uncommitted changes, we keep
+    track of the cards which changed since the last save, the same way.
+
+    """
+
+    _due_index = None
+    _sister_card_next_reps = None
+    _queue_snapshot = None
+    # Cards changed since the last save, None for deleted ones, and the
+    # generation of the card cache at that time. None if we are not keeping
+    # track, or lost track, e.g. because a criterion got applied.
+    _card_for_uncommitted__card_id = None
+    _committed_card_cache_generation = None
+
+    # Number of extra cards we fetch for the queue snapshot, i.e. the number
+    # of changed cards it can cope with.
+    queue_snapshot_margin = 25
+
+    def _use_due_index(self, sort_key):
+        return self.config()["in_memory_due_index"] and \
+            sort_key in DueIndex.sort_keys
+
+    def due_index(self):
+        if self._due_index is None:
+            self._due_index = DueIndex(self.con.execute("""select _id,
+                _fact_id, grade, next_rep, last_rep, lapses, easiness,
+                acq_reps, ret_reps_since_lapse from cards where active=1"""))
+        return self._due_index
+
+    def sister_card_next_reps(self, card):
+
+        """The next repetitions of the active sister cards of 'card' which
+        are in the retention phase.
+
+        """
+
+        if self._sister_card_next_reps is None:
+            self._sister_card_next_reps = SisterCardNextReps()
+        _fact_id = card.fact._id
+        if _fact_id not in self._sister_card_next_reps:
+            self._sister_card_next_reps.add_fact(_fact_id,
+                self.con.execute("""select _id, active, grade, next_rep from
+                cards where _fact_id=?""", (_fact_id, )).fetchall())
+        return self._sister_card_next_reps.next_reps(_fact_id,
+            exclude__card_id=card._id)
+
+    def _update_due_index(self, cards):
+        if self._due_index is None and self._sister_card_next_reps is None \
+            and self._queue_snapshot is None and \
+            self._card_for_uncommitted__card_id is None:
+            return
+        for card in cards:
+            if self._due_index is not None:
+                self._due_index.update(card)
+            if self._sister_card_next_reps is not None:
+                self._sister_card_next_reps.update(card)
+            if self._queue_snapshot is not None:
+                self._queue_snapshot.card_changed(card)
+            if self._card_for_uncommitted__card_id is not None:
+                self._card_for_uncommitted__card_id[card._id] = card
+
+    def _discard_from_due_index(self, _card_ids):
+        for _card_id in _card_ids:
+            if self._due_index is not None:
+                self._due_index.discard(_card_id)
+            if self._sister_card_next_reps is not None:
+                self._sister_card_next_reps.discard(_card_id)
+            if self._queue_snapshot is not None:
+                self._queue_snapshot.card_deleted(_card_id)
+            if self._card_for_uncommitted__card_id is not None:
+                self._card_for_uncommitted__card_id[_card_id] = None
+
+    def _invalidate_due_index(self):
+        self._due_index = None
+        self._sister_card_next_reps = None
+        if self._queue_snapshot is not None:
+            self._queue_snapshot.is_valid = False
+        self._card_for_uncommitted__card_id = None
+
+    def _track_uncommitted_changes(self):
+
+        """To be called right after committing, i.e. when there are no
+        uncommitted changes.
+
+        """
+
+        if self.config()["background_queue_rebuild"] and \
+            self.allows_concurrent_reads():
+            self._card_for_uncommitted__card_id = {}
+            self._committed_card_cache_generation = \
+                self._card_cache.generation
+        else:
+            self._card_for_uncommitted__card_id = None
+
+    def start_queue_snapshot(self, timestamp, start_of_day, end_of_day,
+                             limit=50):
+
+        """Start reading the data for the next queue of the scheduler in a
+        worker thread, through a read-only connection. 'timestamp' is the
+        adjusted time the queries will be run for, 'start_of_day' and
+        'end_of_day' delimit today for 'has_already_warned_today'.
+
+        That connection does not see the uncommitted changes, so these get
+        applied to the snapshot together with the changes made after
+        starting. If we lost track of them, we don't start, nor do we when a
+        snapshot which is still usable is already available or being read.
+        Returns whether a new snapshot was started.
+
+        """
+
+        if not self.allows_concurrent_reads():
+            return False
+        card_for_uncommitted__card_id = {}
+        card_cache_generation = self._card_cache.generation
+        if self.con.connection.in_transaction:
+            card_for_uncommitted__card_id = \
+                self._card_for_uncommitted__card_id
+            if card_for_uncommitted__card_id is None:
+                return False
+            # If e.g. a fact got edited, the rows we read are out of date,
+            # so the cards should not be constructed from them.
+            if card_cache_generation != \
+                self._committed_card_cache_generation:
+                card_cache_generation = None
+        snapshot = self._queue_snapshot
+        if snapshot is not None:
+            if snapshot.thread.is_alive() or snapshot.is_usable(timestamp,
+                start_of_day, self.config()["max_ret_reps_since_lapse"]):
+                return False
+            snapshot.thread.join()
+        snapshot = QueueSnapshot(timestamp, start_of_day, end_of_day,
+            self.config()["max_ret_reps_since_lapse"], limit,
+            self.queue_snapshot_margin + len(card_for_uncommitted__card_id))
+        snapshot.card_for_changed__card_id.update(\
+            card_for_uncommitted__card_id)
+        snapshot.card_cache_generation = card_cache_generation
+        snapshot.thread = threading.Thread(target=self._read_queue_snapshot,
+            args=(snapshot, self.con))
+        self._queue_snapshot = snapshot
+        snapshot.thread.start()
+        return True
+
+    def _read_queue_snapshot(self, snapshot, connection):
+        try:
+            con = connection.read_connection()
+            # All the queries need to see the same state of the database, as
+            # e.g. a card which got reviewed and saved in between could end
+            # up in the index twice.
+            con.execute("begin")
+            columns = """select _id, _fact_id, grade, next_rep, last_rep,
+                lapses, easiness, acq_reps, ret_reps_since_lapse from cards
+                where active=1 and """
+            limit = snapshot.limit + snapshot.margin
+            max_ret_reps_since_lapse = snapshot.max_ret_reps_since_lapse
+            rows = con.execute(columns + "grade in (0, 1)").fetchall()
+            rows += con.execute(columns + """grade>=2 and ?>=next_rep and
+                ret_reps_since_lapse<=? order by next_rep - last_rep, _id
+                limit ?""", (snapshot.timestamp, max_ret_reps_since_lapse,
+                limit)).fetchall()
+            # Same order as in 'DueIndex'.
+            learn_ahead_rows = con.execute(columns + """grade>=2 and
+                ?<next_rep and ret_reps_since_lapse<=? order by next_rep,
+                ret_reps_since_lapse, _fact_id, _id limit ?""",
+                (snapshot.timestamp, max_ret_reps_since_lapse,
+                limit)).fetchall()
+            # Before this, no other cards can become due.
+            if learn_ahead_rows:
+                snapshot.next_rep_boundary = learn_ahead_rows[0][3]
+            rows += learn_ahead_rows
+            rows += con.execute(columns + "grade=-1 order by _id limit ?",
+                (limit, )).fetchall()
+            snapshot._active_count = con.execute(\
+                "select count() from cards where active=1").fetchone()[0]
+            snapshot.already_warned_today = self.has_already_warned_today(\
+                snapshot.start_of_day, snapshot.end_of_day, con)
+            index = DueIndex(rows)
+            # The cards that will likely end up in the queue.
+            _card_ids = set()
+            for result in [index.cards_due_for_ret_rep(snapshot.timestamp,
+                max_ret_reps_since_lapse, "interval", snapshot.limit),
+                index.cards_to_relearn(1, "-interval", snapshot.limit),
+                index.cards_to_relearn(0, "-interval", snapshot.limit),
+                index.cards_new_memorising(1, "", snapshot.limit),
+                index.cards_new_memorising(0, "", snapshot.limit),
+                index.cards_unseen("", snapshot.limit),
+                index.cards_learn_ahead(snapshot.timestamp,
+                max_ret_reps_since_lapse, "next_rep", snapshot.limit)]:
+                _card_ids.update(_card_id for _card_id, _fact_id in result)
+            snapshot.card_rows, snapshot.tag_rows = \
+                self._card_rows_with_internal_ids(_card_ids, con)
+            snapshot.fact_rows, snapshot.fact_data_rows = \
+                self._fact_rows_with_internal_ids(set(sql_res[3] for \
+                sql_res in snapshot.card_rows), con)
+            con.execute("commit")
+            snapshot.index = index
+        except Exception:
+            # E.g. because the connection got closed.
+            snapshot.is_valid = False
+        finally:
+            connection.release_read_connection()
+
+    def wait_for_queue_snapshot(self):
+        if self._queue_snapshot is not None:
+            self._queue_snapshot.thread.join()
+
+    def queue_snapshot(self, timestamp, start_of_day):
+
+        """Return the snapshot started by 'start_queue_snapshot', with the
+        changes made since then applied to it, if it is ready and still
+        usable to build a queue for 'timestamp', or None otherwise. We don't
+        wait for the worker thread, and a snapshot can only be used once.
+
+        """
+
+        snapshot = self._queue_snapshot
+        if snapshot is None or snapshot.thread.is_alive():
+            return None
+        self._queue_snapshot = None
+        if not snapshot.is_usable(timestamp, start_of_day,
+            self.config()["max_ret_reps_since_lapse"]):
+            return None
+        snapshot.apply_changes()
+        return snapshot
+
+    def hand_over_cards(self, snapshot, _card_ids):
+
+        """Construct the cards with _ids '_card_ids' from the rows fetched by
+        'snapshot', and add them to the card cache, such that the scheduler
+        does not need to go to the database when it shows them. Cards which
+        got changed since the snapshot was started don't qualify, nor do
+        any cards if the card cache has been cleared in the mean time, e.g.
+        because a fact or a tag got edited.
+
+        """
+
+        if snapshot.card_cache_generation != self._card_cache.generation:
+            return
+        _card_ids = set(_card_id for _card_id in _card_ids if _card_id not \
+            in snapshot.card_for_changed__card_id and _card_id not in \
+            self._card_cache)
+        card_rows = [sql_res for sql_res in snapshot.card_rows \
+            if sql_res[0] in _card_ids]
+        fact_for__fact_id = {}
+        for sql_res in card_rows:
+            fact = self._fact_cache.get(sql_res[3])
+            if fact is not None:
+                fact_for__fact_id[fact._id] = fact
+        _fact_ids = set(sql_res[3] for sql_res in card_rows)
+        fact_for__fact_id.update(self._facts_from_rows(\
+            [sql_res for sql_res in snapshot.fact_rows if sql_res[0] in \
+            _fact_ids and sql_res[0] not in fact_for__fact_id],
+            snapshot.fact_data_rows))
+        for fact in fact_for__fact_id.values():
+            self._fact_cache.add(fact)
+        for card in self._cards_from_rows(card_rows, snapshot.tag_rows,
+            fact_for__fact_id).values():
+            self._card_cache.add(card)
@@ -0,0 +1,367 @@
+#
+# SQLite_log_database.py <Peter.Bienstman@gmail.com>
+#
+
+import re
+import os
+import string
+import sqlite3
+
+from openSM2sync.log_entry import EventTypes
+from mnemosyne.libmnemosyne.gui_translator import _
+
+# The log can be kept in a separate database file next to the main one, which
+# gets attached to each connection under the following name. Since SQLite
+# looks up unqualified table names in the main database first and in the
+# attached ones next, all the queries on 'log' keep working unmodified, as
+# long as the main database has no 'log' table itself.
+
+LOG_DATABASE = "log_database"
+LOG_DATABASE_SUFFIX = "-log"
+
+_CREATE = re.compile(\
+    r"^(create\s+(?:unique\s+)?(?:table|index|view|trigger)\s+)",
+    re.IGNORECASE)
+
+# The log can also refer to the objects through integers instead of through
+# their 22 character ids, which makes the log and its indices a lot smaller
+# and turns joins and grouping on objects into integer comparisons. A mapping
+# table keeps the ids, also of objects which have been deleted since. The
+# table 'log' gets replaced by a view which looks up the ids again, so that
+# all the queries on 'log' keep working unmodified, and what we send across
+# during sync or to the science server still contains the ids.
+
+_LOG_TABLES = ("log", "interned_log", "log_object_ids")
+
+# Order in which to create the objects making up the log.
+_LOG_OBJECT_TYPES = ("table", "index", "view", "trigger")
+
+_INTERN_LOG = string.Template("""
+    create table $schema.log_object_ids(
+        _id integer primary key,
+        id text unique
+    );
+    create table $schema.interned_log(
+        _id integer primary key autoincrement,
+        event_type integer,
+        timestamp integer,
+        _object_id integer,
+        grade integer,
+        easiness real,
+        acq_reps integer,
+        ret_reps integer,
+        lapses integer,
+        acq_reps_since_lapse integer,
+        ret_reps_since_lapse integer,
+        scheduled_interval integer,
+        actual_interval integer,
+        thinking_time integer,
+        next_rep integer,
+        scheduler_data integer
+    );
+    insert into $schema.log_object_ids(id) select distinct object_id
+        from $schema.log where object_id is not null;
+    insert into $schema.interned_log select log._id, event_type, timestamp,
+        log_object_ids._id, grade, easiness, acq_reps, ret_reps, lapses,
+        acq_reps_since_lapse, ret_reps_since_lapse, scheduled_interval,
+        actual_interval, thinking_time, next_rep, scheduler_data
+        from $schema.log left join $schema.log_object_ids
+        on log_object_ids.id=log.object_id;
+    delete from $schema.sqlite_sequence where name='interned_log';
+    insert into $schema.sqlite_sequence(name, seq) select 'interned_log', seq
+        from $schema.sqlite_sequence where name='log';
+    drop table $schema.log;
+    create index $schema.i_interned_log_timestamp on interned_log (timestamp);
+    create index $schema.i_interned_log_object_id on interned_log (_object_id);
+    create view $schema.log as select interned_log._id as _id, event_type,
+        timestamp, log_object_ids.id as object_id, grade, easiness, acq_reps,
+        ret_reps, lapses, acq_reps_since_lapse, ret_reps_since_lapse,
+        scheduled_interval, actual_interval, thinking_time, next_rep,
+        scheduler_data from interned_log left join log_object_ids
+        on log_object_ids._id=interned_log._object_id;
+    create trigger $schema.log_insert instead of insert on log
+    begin
+        insert or ignore into log_object_ids(id) select new.object_id
+            where new.object_id is not null;
+        insert into interned_log(_id, event_type, timestamp, _object_id,
+            grade, easiness, acq_reps, ret_reps, lapses, acq_reps_since_lapse,
+            ret_reps_since_lapse, scheduled_interval, actual_interval,
+            thinking_time, next_rep, scheduler_data) values(new._id,
+            new.event_type, new.timestamp, (select _id from log_object_ids
+            where id=new.object_id), new.grade, new.easiness, new.acq_reps,
+            new.ret_reps, new.lapses, new.acq_reps_since_lapse,
+            new.ret_reps_since_lapse, new.scheduled_interval,
+            new.actual_interval, new.thinking_time, new.next_rep,
+            new.scheduler_data);
+    end;
+    create trigger $schema.log_delete instead of delete on log
+    begin
+        delete from interned_log where _id=old._id;
+    end;
+""")
+
+_UNINTERN_LOG = string.Template("""
+    create table $schema.uninterned_log(
+        _id integer primary key autoincrement,
+        event_type integer,
+        timestamp integer,
+        object_id text,
+        grade integer,
+        easiness real,
+        acq_reps integer,
+        ret_reps integer,
+        lapses integer,
+        acq_reps_since_lapse integer,
+        ret_reps_since_lapse integer,
+        scheduled_interval integer,
+        actual_interval integer,
+        thinking_time integer,
+        next_rep integer,
+        scheduler_data integer
+    );
+    insert into $schema.uninterned_log select * from $schema.log $where;
+    delete from $schema.sqlite_sequence where name='uninterned_log';
+    insert into $schema.sqlite_sequence(name, seq) select 'uninterned_log',
+        seq from $schema.sqlite_sequence where name='interned_log';
+    drop view $schema.log;
+    drop table $schema.interned_log;
+    drop table $schema.log_object_ids;
+    alter table $schema.uninterned_log rename to log;
+    create index $schema.i_log_timestamp on log (timestamp);
+    create index $schema.i_log_object_id on log (object_id);
+""")
+
+
+class SQLiteLogDatabase(object):
+
+    """Code to be injected into the SQLite database class through inheritance,
+    so that SQLite.py does not becomes too large.
+
+    The log only ever grows, and after some years of reviewing, it makes up
+    most of the database file. Keeping it in a file of its own means that
+    operations on the main database, like vacuuming or sending it across to
+    a mobile client which is not interested in old repetitions, no longer
+    need to process all of this history, and that incremental backups don't
+    see pages with cards and log entries change together.
+
+    Whether the log is kept separately is set through the
+    'separate_log_database' option, and whether it refers to objects through
+    integers through the 'intern_log_object_ids' option. The layout is
+    converted when the database is loaded.
+
+    """
+
+    def log_database_path(self):
+        return self._path + LOG_DATABASE_SUFFIX
+
+    def has_separate_log_database(self):
+        return self._path is not None and \
+            os.path.exists(self.log_database_path())
+
+    def _attach_log_database(self):
+        if self.has_separate_log_database():
+            self._connection.attach(self.log_database_path(), LOG_DATABASE)
+
+    def _log_schema(self):
+
+        """Name of the schema holding the log, e.g. for vacuuming."""
+
+        if self.has_separate_log_database():
+            return LOG_DATABASE
+        return "main"
+
+    def _log_objects(self, con, schema):
+
+        """Returns (type, name, sql) for the tables, view, indices and
+        triggers which make up the log in 'schema', in the order in which
+        they need to be created.
+
+        """
+
+        objects = con.execute(\
+            """select type, name, sql from %s.sqlite_master where tbl_name in
+            (%s) and sql is not null""" % (schema, ",".join(\
+            "'%s'" % table for table in _LOG_TABLES))).fetchall()
+        objects.sort(key=lambda object: _LOG_OBJECT_TYPES.index(object[0]))
+        return objects
+
+    def _drop_log_script(self, con, schema):
+        # Dropping the view also drops its triggers, and dropping the tables
+        # their indices.
+        return "".join("drop %s %s.%s;\n" % (type, schema, name) for \
+            type, name, sql in self._log_objects(con, schema) \
+            if type in ("table", "view"))
+
+    def _copy_log_table_script(self, con, source, destination, where=""):
+
+        """Returns a script which creates the log tables with their indices
+        in schema 'destination' and fills them with the log entries from
+        schema 'source', optionally restricted by a 'where' clause. Any
+        existing log in 'destination' gets replaced.
+
+        """
+
+        objects = self._log_objects(con, source)
+        if not objects:
+            raise RuntimeError(_("Unable to find the log in") + " " + source)
+        script = self._drop_log_script(con, destination)
+        for type, name, sql in objects:
+            if type != "table":
+                continue
+            script += _CREATE.sub(r"\1%s." % destination, sql) + ";\n"
+            if name == "log_object_ids":
+                # Don't leave out the objects which old log entries refer to.
+                script += "insert into %s.%s select * from %s.%s;\n" % \
+                    (destination, name, source, name)
+                continue
+            script += "insert into %s.%s select * from %s.%s %s;\n" % \
+                (destination, name, source, name, where)
+            script += """delete from %(destination)s.sqlite_sequence
+                where name='%(name)s';
+            insert into %(destination)s.sqlite_sequence(name, seq)
+                select name, seq from %(source)s.sqlite_sequence
+                where name='%(name)s';\n""" % {"source": source,
+                "destination": destination, "name": name}
+        # Creating the indices after inserting is faster.
+        for type, name, sql in objects:
+            if type != "table":
+                script += _CREATE.sub(r"\1%s." % destination, sql) + ";\n"
+        return script
+
+    def _main_has_log(self):
+        return self.con.execute("""select count() from main.sqlite_master
+            where type in ('table', 'view') and name='log'""").fetchone()[0]\
+            != 0
+
+    def has_interned_log(self):
+        return self.con.execute("""select count() from %s.sqlite_master
+            where type='table' and name='interned_log'""" % \
+            self._log_schema()).fetchone()[0] != 0
+
+    def _log_table(self):
+
+        """The table to use for queries on the log which don't need the
+        object ids. Going through the view would look them up for each log
+        entry.
+
+        """
+
+        if self._interned_log:
+            return "interned_log"
+        return "log"
+
+    def _log_indices(self):
+
+        """Returns (name, table, column) for the indices on the log."""
+
+        if self.has_interned_log():
+            return [("i_interned_log_timestamp", "interned_log", "timestamp"),
+                    ("i_interned_log_object_id", "interned_log", "_object_id")]
+        return [("i_log_timestamp", "log", "timestamp"),
+                ("i_log_object_id", "log", "object_id")]
+
+    def _update_log_database_layout(self):
+
+        """Move the log to or from its own file, according to the
+        'separate_log_database' option, and (un)intern the object ids
+        according to the 'intern_log_object_ids' option.
+
+        If the main database has a log, it is always the one to use, and a
+        separate log database left over next to it is out of date, e.g.
+        because the main database got replaced during a sync.
+
+        """
+
+        if self._main_has_log():
+            if self.config()["separate_log_database"]:
+                self.move_log_to_separate_database()
+            elif self.has_separate_log_database():
+                self.release_connection()
+                self._remove_log_database()
+        elif not self.has_separate_log_database():
+            raise RuntimeError(_("Unable to find the log for") + " " + \
+                self._path)
+        elif not self.config()["separate_log_database"]:
+            self.move_log_to_main_database()
+        if self.config()["intern_log_object_ids"]:
+            self.intern_log_object_ids()
+        else:
+            self.unintern_log_object_ids()
+        self._interned_log = self.has_interned_log()
+
+    def move_log_to_separate_database(self):
+        if self.has_separate_log_database() and not self._main_has_log():
+            return
+        self.con.attach(self.log_database_path(), LOG_DATABASE)
+        # With a write-ahead log, a transaction spanning both databases is
+        # not atomic, so we only drop the log from the main database once
+        # the copy has been committed. Should we get interrupted in between,
+        # the log in the main database wins the next time we load.
+        self.con.executescript("begin;" + self._copy_log_table_script(\
+            self.con, "main", LOG_DATABASE) + "commit;")
+        self.con.executescript("begin;" + self._drop_log_script(\
+            self.con, "main") + "commit;")
+        # Give the space back to the file system.
+        self.con.executescript("vacuum main;")
+        # Let all connections attach the log database from the start.
+        self.release_connection()
+
+    def move_log_to_main_database(self):
+        if not self.has_separate_log_database():
+            return
+        self.con.executescript("begin;" + self._copy_log_table_script(\
+            self.con, LOG_DATABASE, "main") + "commit;")
+        self.release_connection()
+        self._remove_log_database()
+
+    def intern_log_object_ids(self):
+        if self.has_interned_log():
+            return
+        schema = self._log_schema()
+        self.con.executescript("begin;" + _INTERN_LOG.substitute(\
+            schema=schema) + "commit; vacuum %s;" % schema)
+        self._interned_log = True
+
+    def unintern_log_object_ids(self):
+        if not self.has_interned_log():
+            return
+        schema = self._log_schema()
+        self.con.executescript("begin;" + _UNINTERN_LOG.substitute(\
+            schema=schema, where="") + "commit; vacuum %s;" % schema)
+        self._interned_log = False
+
+    def _remove_log_database(self, path=None):
+        if path is None:
+            path = self.log_database_path()
+        for suffix in ["", "-wal", "-shm", "-journal"]:
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def copy_log_into(self, path, interested_in_old_reps=True):
+
+        """Give the copy of the main database at 'path' a self-contained log
+        in the standard layout, e.g. for sending it across to a sync partner,
+        who might not know about the other layouts.
+
+        """
+
+        where = ""
+        if not interested_in_old_reps:
+            where = "where event_type!=%d" % EventTypes.REPETITION
+        con = sqlite3.connect(path)
+        try:
+            if self.has_separate_log_database():
+                con.execute("attach database ? as %s" % LOG_DATABASE,
+                    (self.log_database_path(), ))
+                con.executescript("begin;" + self._copy_log_table_script(\
+                    con, LOG_DATABASE, "main", where) + "commit;")
+                where = ""
+            if con.execute("""select count() from main.sqlite_master
+                where type='table' and name='interned_log'""").fetchone()[0]:
+                con.executescript("begin;" + _UNINTERN_LOG.substitute(\
+                    schema="main", where=where) + "commit; vacuum;")
+            elif where:
+                con.executescript("begin; delete from log %s; commit; vacuum;"
+                    % where)
+        finally:
+            con.close()
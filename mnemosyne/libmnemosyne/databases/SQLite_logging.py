@@ -9,6 +9,8 @@ import datetime
 
 from openSM2sync.log_entry import EventTypes
 from mnemosyne.libmnemosyne.gui_translator import _
+from mnemosyne.libmnemosyne.databases.SQLite_log_database import \
+     LOG_DATABASE_SUFFIX
 
 HOUR = 60 * 60 # Seconds in an hour.
 DAY = 24 * HOUR # Seconds in a day.
@@ -85,6 +87,12 @@ class SQLiteLogging(object):
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
             (EventTypes.ADDED_CARD, int(timestamp), card_id))
 
+    def log_added_cards(self, timestamp, card_ids):
+        self.con.executemany(\
+            "insert into log(event_type, timestamp, object_id) values(?,?,?)",
+            ((EventTypes.ADDED_CARD, int(timestamp), card_id)
+            for card_id in card_ids))
+
     def log_edited_card(self, timestamp, card_id):
         self.con.execute(\
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
@@ -95,6 +103,12 @@ class SQLiteLogging(object):
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
             (EventTypes.DELETED_CARD, int(timestamp), card_id))
 
+    def log_deleted_cards(self, timestamp, card_ids):
+        self.con.executemany(\
+            "insert into log(event_type, timestamp, object_id) values(?,?,?)",
+            ((EventTypes.DELETED_CARD, int(timestamp), card_id)
+            for card_id in card_ids))
+
     def log_repetition(self, timestamp, card_id, grade, easiness, acq_reps,
         ret_reps, lapses, acq_reps_since_lapse, ret_reps_since_lapse,
         scheduled_interval, actual_interval, thinking_time, next_rep,
@@ -110,6 +124,28 @@ class SQLiteLogging(object):
             ret_reps_since_lapse, scheduled_interval, actual_interval,
             int(thinking_time), next_rep, scheduler_data))
 
+    def log_repetitions(self, repetitions):
+
+        """'repetitions' is a list of tuples with the arguments of
+        'log_repetition', i.e. each repetition has a timestamp of its own.
+
+        """
+
+        self.con.executemany(\
+            """insert into log(event_type, timestamp, object_id, grade,
+            easiness, acq_reps, ret_reps, lapses, acq_reps_since_lapse,
+            ret_reps_since_lapse, scheduled_interval, actual_interval,
+            thinking_time, next_rep, scheduler_data)
+            values(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+            ((EventTypes.REPETITION, int(timestamp), card_id, grade, easiness,
+            acq_reps, ret_reps, lapses, acq_reps_since_lapse,
+            ret_reps_since_lapse, scheduled_interval, actual_interval,
+            int(thinking_time), next_rep, scheduler_data) for (timestamp,
+            card_id, grade, easiness, acq_reps, ret_reps, lapses,
+            acq_reps_since_lapse, ret_reps_since_lapse, scheduled_interval,
+            actual_interval, thinking_time, next_rep, scheduler_data) \
+            in repetitions))
+
     def log_added_tag(self, timestamp, tag_id):
         self.con.execute(\
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
@@ -125,6 +161,12 @@ class SQLiteLogging(object):
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
             (EventTypes.DELETED_TAG, int(timestamp), tag_id))
 
+    def log_deleted_tags(self, timestamp, tag_ids):
+        self.con.executemany(\
+            "insert into log(event_type, timestamp, object_id) values(?,?,?)",
+            ((EventTypes.DELETED_TAG, int(timestamp), tag_id)
+            for tag_id in tag_ids))
+
     def log_added_media_file(self, timestamp, filename):
         self.con.execute(\
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
@@ -145,6 +187,12 @@ class SQLiteLogging(object):
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
             (EventTypes.ADDED_FACT, int(timestamp), fact_id))
 
+    def log_added_facts(self, timestamp, fact_ids):
+        self.con.executemany(\
+            "insert into log(event_type, timestamp, object_id) values(?,?,?)",
+            ((EventTypes.ADDED_FACT, int(timestamp), fact_id)
+            for fact_id in fact_ids))
+
     def log_edited_fact(self, timestamp, fact_id):
         self.con.execute(\
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
@@ -155,6 +203,12 @@ class SQLiteLogging(object):
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
             (EventTypes.DELETED_FACT, int(timestamp), fact_id))
 
+    def log_deleted_facts(self, timestamp, fact_ids):
+        self.con.executemany(\
+            "insert into log(event_type, timestamp, object_id) values(?,?,?)",
+            ((EventTypes.DELETED_FACT, int(timestamp), fact_id)
+            for fact_id in fact_ids))
+
     def log_added_fact_view(self, timestamp, fact_view_id):
         self.con.execute(\
             "insert into log(event_type, timestamp, object_id) values(?,?,?)",
@@ -291,14 +345,17 @@ class SQLiteLogging(object):
                 offset int,
                 last_rep int);""")
         # Having these indexes in place while importing takes too long.
-        self.con.execute("drop index if exists i_log_timestamp;")
-        self.con.execute("drop index if exists i_log_object_id;")
+        schema = self._log_schema()
+        for index, table, column in self._log_indices():
+            self.con.execute("drop index if exists %s.%s;" % (schema, index))
 
     def after_1x_log_import(self):
         self.con.execute("drop table _cards")
         # Restore index situation.
-        self.con.execute("create index i_log_timestamp on log (timestamp);")
-        self.con.execute("create index i_log_object_id on log (object_id);")
+        schema = self._log_schema()
+        for index, table, column in self._log_indices():
+            self.con.execute("create index %s.%s on %s (%s);" \
+                % (schema, index, table, column))
 
     def set_offset_last_rep(self, card_id, offset, last_rep):
         self.con.execute(\
@@ -311,6 +368,7 @@ class SQLiteLogging(object):
         return sql_res[0], sql_res[1]
 
     def change_card_id(self, card, new_id):
+        self._card_cache.discard(card._id)
         self.con.execute("update cards set id=? where _id=?",
             (new_id, card._id))
 
@@ -318,6 +376,7 @@ class SQLiteLogging(object):
         sql_res = self.con.execute("""select _id, acq_reps, lapses,
             acq_reps_since_lapse from cards where id=?""",
             (id, )).fetchone()
+        self._card_cache.discard(sql_res[0])
         acq_reps = sql_res[1] + offset
         acq_reps_since_lapse = sql_res[3]
         if sql_res[2] == 0:
@@ -353,11 +412,14 @@ class SQLiteLogging(object):
 
         w = self.main_widget()
         w.set_progress_text(_("Merging logs..."))
+        # The other database could keep its log in a separate file.
+        if os.path.exists(filename + LOG_DATABASE_SUFFIX):
+            filename += LOG_DATABASE_SUFFIX
         script = string.Template("""
             begin;
             delete from log where _id>$_id;
             end;
-            vacuum;
+            vacuum $log_schema;
             attach "$filename" as to_merge;
             begin;
             insert into log(event_type, timestamp, object_id, grade,
@@ -369,7 +431,8 @@ class SQLiteLogging(object):
                 ret_reps_since_lapse, scheduled_interval, actual_interval,
                 thinking_time, next_rep, scheduler_data from to_merge.log;
             commit;
-        """).substitute(_id=insertion_log_index, filename=filename)
+        """).substitute(_id=insertion_log_index, filename=filename,
+            log_schema=self._log_schema())
         self.con.executescript(script)
         w.close_progress()
 
@@ -425,8 +488,9 @@ class SQLiteLogging(object):
             begin;
             delete from log where timestamp<$one_year_ago;
             end;
-            vacuum;
-        """).substitute(archive_path=archive_path, one_year_ago=one_year_ago)
+            vacuum $log_schema;
+        """).substitute(archive_path=archive_path, one_year_ago=one_year_ago,
+            log_schema=self._log_schema())
         self.con.executescript(script)
         self.main_widget().close_progress()
 
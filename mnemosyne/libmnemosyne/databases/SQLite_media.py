@@ -168,6 +168,9 @@ _("Filename contains '#', which could cause problems on some operating systems."
                 self.con.execute("""update data_for_fact set value=? where
                     _fact_id=? and key=?""",
                     (fact.data[fact_key], fact._id, fact_key))
+                self.con.execute("""update data_hashes_for_fact set hash=?
+                    where _fact_id=? and key=?""", (self._data_hash(fact_key,
+                    fact.data[fact_key]), fact._id, fact_key))
             if self.con.execute("select 1 from media where filename=? limit 1",
                                 (filename, )).fetchone() is None:
                 self.con.execute("""insert into media(filename, _hash)
@@ -0,0 +1,146 @@
+#
+# SQLite_object_cache.py <Peter.Bienstman@gmail.com>
+#
+
+from collections import OrderedDict
+
+
+class ObjectCache(object):
+
+    """Identity map for objects coming from the database, keyed on their
+    internal _id, with a secondary index on their (external) id.
+
+    When the number of objects exceeds 'max_size', the least recently used
+    ones are evicted. A 'max_size' of 0 disables the cache.
+
+    """
+
+    def __init__(self, max_size=0):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # Goes up each time the cache gets cleared, such that objects which
+        # were constructed elsewhere can tell whether they are still current.
+        self.generation = 0
+        self._object_for__id = OrderedDict()
+        self._id_for_id = {}
+
+    def __len__(self):
+        return len(self._object_for__id)
+
+    def __contains__(self, _id):
+        return _id in self._object_for__id
+
+    def get(self, _id):
+        if not self.max_size:
+            return None
+        obj = self._object_for__id.get(_id)
+        if obj is None:
+            self.misses += 1
+            return None
+        self._object_for__id.move_to_end(_id)
+        self.hits += 1
+        return obj
+
+    def get_with_id(self, id):
+        if not self.max_size:
+            return None
+        _id = self._id_for_id.get(id)
+        if _id is None:
+            self.misses += 1
+            return None
+        return self.get(_id)
+
+    def add(self, obj):
+        if not self.max_size or obj._id is None:
+            return
+        self.discard(obj._id)
+        self._object_for__id[obj._id] = obj
+        self._id_for_id[obj.id] = obj._id
+        while len(self._object_for__id) > self.max_size:
+            _id, evicted = self._object_for__id.popitem(last=False)
+            if self._id_for_id.get(evicted.id) == _id:
+                del self._id_for_id[evicted.id]
+
+    def discard(self, _id):
+        obj = self._object_for__id.pop(_id, None)
+        if obj is not None and self._id_for_id.get(obj.id) == _id:
+            del self._id_for_id[obj.id]
+
+    def discard_with_id(self, id):
+        _id = self._id_for_id.get(id)
+        if _id is not None:
+            self.discard(_id)
+
+    def clear(self):
+        self.generation += 1
+        self._object_for__id.clear()
+        self._id_for_id.clear()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+
+class SQLiteObjectCache(object):
+
+    """Code to be injected into the SQLite database class through inheritance,
+    so that SQLite.py does not becomes too large.
+
+    Keeps identity maps of the cards, facts and tags, so that repeated lookups
+    during review, rendering and sync don't need to go through SQL and
+    reconstruct the objects each time. Note that this means that the objects
+    returned by the database are shared, so they should only be modified in
+    order to be stored through the 'update_*' functions, which, together with
+    the other functions modifying the database, take care of invalidating the
+    relevant part of the cache.
+
+    """
+
+    def __init__(self):
+        self._card_cache = ObjectCache()
+        self._fact_cache = ObjectCache()
+        self._tag_cache = ObjectCache()
+
+    def reset_object_caches(self):
+
+        """Empty the caches, reset the counters and (re)read the size of the
+        caches from the config.
+
+        """
+
+        for cache in self._object_caches():
+            cache.clear()
+            cache.reset_counters()
+            cache.max_size = self.config()["object_cache_size"]
+
+    def clear_object_caches(self):
+        for cache in self._object_caches():
+            cache.clear()
+
+    def invalidate_objects_with_id(self, id):
+
+        """Remove any card, fact or tag with (external) id 'id' from the
+        caches.
+
+        """
+
+        for cache in self._object_caches():
+            cache.discard_with_id(id)
+
+    def object_cache_statistics(self):
+
+        """Returns a dictionary with per object type a tuple of number of
+        cached objects, hits and misses.
+
+        """
+
+        return {"card": (len(self._card_cache), self._card_cache.hits,
+                    self._card_cache.misses),
+                "fact": (len(self._fact_cache), self._fact_cache.hits,
+                    self._fact_cache.misses),
+                "tag": (len(self._tag_cache), self._tag_cache.hits,
+                    self._tag_cache.misses)}
+
+    def _object_caches(self):
+        return (self._card_cache, self._fact_cache, self._tag_cache)
@@ -0,0 +1,80 @@
+#
+# SQLite_pregenerated_data.py <Peter.Bienstman@gmail.com>
+#
+
+# The cards whose question, answer and tag strings still need to be
+# generated. Keeping track of them in a table of their own means we don't
+# need to touch the cards themselves, nor the full-text index on these
+# strings, until the new strings are known, and that the information survives
+# when we don't get to the end of the session.
+
+STALE_TABLE = """create table if not exists stale_pregenerated_data(
+    _card_id integer primary key
+)"""
+
+
+class SQLitePregeneratedData(object):
+
+    """Code to be injected into the SQLite database class through inheritance,
+    so that SQLite.py does not becomes too large.
+
+    Rendering the plain text question and answer of a card through the entire
+    render chain is by far the most expensive part of adding or updating it.
+    With the 'defer_pregenerated_data' option set, this gets postponed: the
+    card is only marked as stale, and the strings get generated in batches,
+    a few at a time from the controller's heartbeat, and all at once before
+    anything reads them, i.e. searching, the card browser, sending the
+    database to a sync partner and unloading.
+
+    """
+
+    _stale_pregenerated_data = False
+
+    def _defer_pregenerated_data(self):
+        return self.store_pregenerated_data and \
+            self.config()["defer_pregenerated_data"]
+
+    def _create_stale_pregenerated_data_table(self):
+        if not self.store_pregenerated_data:
+            return
+        self.con.execute(STALE_TABLE)
+        # Left over from a previous session.
+        self._stale_pregenerated_data = self.con.execute(\
+            "select 1 from stale_pregenerated_data limit 1").\
+            fetchone() is not None
+
+    def _mark_pregenerated_data_stale(self, _card_ids):
+        self.con.executemany("""insert or ignore into
+            stale_pregenerated_data(_card_id) values(?)""",
+            ((_card_id, ) for _card_id in _card_ids))
+        self._stale_pregenerated_data = True
+
+    def has_stale_pregenerated_data(self):
+        return self._stale_pregenerated_data
+
+    def regenerate_pregenerated_data(self, limit=-1, chunk_size=500):
+
+        """Generate the question, answer and tag strings for at most 'limit'
+        stale cards. Returns the number of cards which were dealt with.
+
+        """
+
+        if not self._stale_pregenerated_data:
+            return 0
+        _card_ids = [cursor[0] for cursor in self.con.execute(\
+            "select _card_id from stale_pregenerated_data limit ?",
+            (limit, ))]
+        for i in range(0, len(_card_ids), chunk_size):
+            chunk = _card_ids[i:i+chunk_size]
+            # Cards which have been deleted in the mean time get skipped.
+            cards = self.cards_with_internal_ids(chunk)
+            self.con.executemany(\
+                "update cards set question=?, answer=?, tags=? where _id=?",
+                ((card.question("plain_text"), card.answer("plain_text"),
+                card.tag_string(), card._id) for card in cards))
+            self.con.execute(\
+                "delete from stale_pregenerated_data where _card_id in (%s)"
+                % self._internal_id_list(chunk))
+        if limit < 0 or len(_card_ids) < limit:
+            self._stale_pregenerated_data = False
+        return len(_card_ids)
@@ -0,0 +1,122 @@
+#
+# SQLite_search.py <Peter.Bienstman@gmail.com>
+#
+
+from mnemosyne.libmnemosyne.utils import MnemosyneError
+
+# The index uses the pregenerated question, answer and tags of the cards table
+# as external content, so it does not store a second copy of the text. The
+# trigram tokenizer allows matching arbitrary substrings (also for languages
+# which don't separate words by spaces), just like the 'like' queries it
+# replaces. The triggers make sure that every write to these columns,
+# including the ones done through raw SQL like '_update_tag_strings', keeps
+# the index up to date.
+
+SEARCH_INDEX = """create virtual table if not exists cards_fts using
+    fts5(question, answer, tags, content='cards', content_rowid='_id',
+    tokenize='trigram')"""
+
+SEARCH_TRIGGERS = {
+    "cards_fts_insert": """create trigger if not exists cards_fts_insert
+        after insert on cards begin
+            insert into cards_fts(rowid, question, answer, tags)
+                values(new._id, new.question, new.answer, new.tags);
+        end""",
+    "cards_fts_delete": """create trigger if not exists cards_fts_delete
+        after delete on cards begin
+            insert into cards_fts(cards_fts, rowid, question, answer, tags)
+                values('delete', old._id, old.question, old.answer, old.tags);
+        end""",
+    "cards_fts_update": """create trigger if not exists cards_fts_update
+        after update of question, answer, tags on cards begin
+            insert into cards_fts(cards_fts, rowid, question, answer, tags)
+                values('delete', old._id, old.question, old.answer, old.tags);
+            insert into cards_fts(rowid, question, answer, tags)
+                values(new._id, new.question, new.answer, new.tags);
+        end"""}
+
+# The trigram tokenizer cannot match strings shorter than this.
+MIN_QUERY_LENGTH = 3
+
+
+class SQLiteSearch(object):
+
+    """Code to be injected into the SQLite database class through inheritance,
+    so that SQLite.py does not becomes too large.
+
+    Full-text index on the pregenerated question, answer and tag strings. If
+    the SQLite library does not have FTS5 (with the trigram tokenizer, i.e.
+    version 3.34 or later), or if no pregenerated data is stored, we fall back
+    on a plain 'like' query.
+
+    """
+
+    _search_index_available = False
+
+    def _create_search_index(self):
+
+        """Make sure the index and its triggers exist. Databases from older
+        versions get their index built here, lazily, the first time they are
+        opened.
+
+        """
+
+        self._search_index_available = False
+        if not self.store_pregenerated_data:
+            return
+        existing_triggers = [cursor[0] for cursor in self.con.execute(\
+            "select name from sqlite_master where type='trigger'")]
+        try:
+            self.con.execute(SEARCH_INDEX)
+            # Creating the table is a no-op if it exists, so also make sure
+            # we can actually access it.
+            self.con.execute("select rowid from cards_fts limit 0")
+        except MnemosyneError:
+            # Don't let the triggers from an index created with a different
+            # SQLite library block all writes to the cards table. The index
+            # will be rebuilt when FTS5 becomes available again.
+            for name in SEARCH_TRIGGERS:
+                if name in existing_triggers:
+                    self.con.execute("drop trigger %s" % name)
+            return
+        self._search_index_available = True
+        if any(name not in existing_triggers for name in SEARCH_TRIGGERS):
+            for sql in SEARCH_TRIGGERS.values():
+                self.con.execute(sql)
+            self.rebuild_search_index()
+
+    def has_search_index(self):
+        return self._search_index_available
+
+    def rebuild_search_index(self):
+
+        """Rebuild the index from scratch, e.g. if it got out of sync."""
+
+        if self._search_index_available:
+            self.con.execute(\
+                "insert into cards_fts(cards_fts) values('rebuild')")
+
+    def search_cards(self, query, limit=-1, offset=0):
+
+        """Return a list of the internal _ids of the cards whose question or
+        answer contains 'query' (case-insensitive). SQL wildcards like % and _
+        are supported as well, but cannot make use of the index.
+
+        """
+
+        self.regenerate_pregenerated_data()
+        if self._search_index_available and \
+            len(query) >= MIN_QUERY_LENGTH and \
+            "%" not in query and "_" not in query:
+            # Search for the entire string as a single phrase, so that we
+            # match the same substrings as 'like' does.
+            phrase = "{question answer} : \"%s\"" % query.replace('"', '""')
+            return [cursor[0] for cursor in self.read_con.execute(\
+                """select rowid from cards_fts where cards_fts match ?
+                order by rowid limit ? offset ?""", (phrase, limit, offset))]
+        # The query is too short for the index or uses SQL wildcards.
+        pattern = "%" + query + "%"
+        return [cursor[0] for cursor in self.read_con.execute(\
+            """select _id from cards where question like ? or answer like ?
+            order by _id limit ? offset ?""",
+            (pattern, pattern, limit, offset))]
@@ -3,6 +3,7 @@
 #
 
 import time
+import bisect
 import datetime
 
 from openSM2sync.log_entry import EventTypes
@@ -19,34 +20,38 @@ class SQLiteStatistics(object):
     """
 
     def tag_count(self):
-        return self.con.execute("select count() from tags").fetchone()[0]
+        return self.read_con.execute("select count() from tags").fetchone()[0]
 
     def fact_count(self):
-        return self.con.execute("select count() from facts").fetchone()[0]
+        return self.read_con.execute("select count() from facts").fetchone()[0]
 
     def card_count(self):
-        return self.con.execute("""select count() from cards""").fetchone()[0]
+        return self.read_con.execute("""select count() from cards""").fetchone()[0]
 
     def non_memorised_count(self):
-        return self.con.execute("""select count() from cards
+        return self.read_con.execute("""select count() from cards
             where active=1 and grade<2""").fetchone()[0]
 
     def scheduled_count(self, timestamp):
-        count = self.con.execute("""select count() from cards
+        count = self.read_con.execute("""select count() from cards
             where active=1 and grade>=2 and ?>=next_rep
             and ret_reps_since_lapse<=?""", (timestamp,
             self.config()["max_ret_reps_since_lapse"])).fetchone()[0]
         return count
 
     def active_count(self):
-        return self.con.execute("""select count() from cards
+        # The scheduler asks for this each time it rebuilds its queue.
+        if self._due_index is not None and \
+            self.config()["in_memory_due_index"]:
+            return len(self._due_index)
+        return self.read_con.execute("""select count() from cards
             where active=1""").fetchone()[0]
 
     def easinesses(self, active_only):
         query = "select easiness from cards where grade>=0"
         if active_only:
             query += " and active=1"
-        return [cursor[0] for cursor in self.con.execute(query)]
+        return [cursor[0] for cursor in self.read_con.execute(query)]
 
     def easinesses_for_tag(self, tag, active_only):
         query = """select cards.easiness from cards, tags_for_card where
@@ -54,20 +59,20 @@ class SQLiteStatistics(object):
             tags_for_card._tag_id=?"""
         if active_only:
             query += " and cards.active=1"
-        return [cursor[0] for cursor in self.con.execute(query,
+        return [cursor[0] for cursor in self.read_con.execute(query,
             (tag._id, ))]
 
     def card_count_for_fact_view(self, fact_view, active_only):
         query = "select count() from cards where fact_view_id=?"
         if active_only:
             query += " and active=1"
-        return self.con.execute(query, (fact_view.id, )).fetchone()[0]
+        return self.read_con.execute(query, (fact_view.id, )).fetchone()[0]
 
     def card_count_for_grade(self, grade, active_only):
         query = "select count() from cards where grade=?"
         if active_only:
             query += " and active=1"
-        return self.con.execute(query, (grade, )).fetchone()[0]
+        return self.read_con.execute(query, (grade, )).fetchone()[0]
 
     def card_count_for_tags(self, tags, active_only):
 
@@ -88,7 +93,7 @@ class SQLiteStatistics(object):
             query += "_tag_id=? or "
             args.append(tag._id)
         query = query.rsplit("or ", 1)[0]
-        return self.con.execute(query, args).fetchone()[0]
+        return self.read_con.execute(query, args).fetchone()[0]
 
     def card_count_for_grade_and_tag(self, grade, tag, active_only):
         query = """select count() from cards, tags_for_card where
@@ -96,7 +101,7 @@ class SQLiteStatistics(object):
             and grade=?"""
         if active_only:
             query += " and cards.active=1"
-        return self.con.execute(query, (tag._id, grade)).fetchone()[0]
+        return self.read_con.execute(query, (tag._id, grade)).fetchone()[0]
 
     def sister_card_count_scheduled_between(self, card, start, stop):
 
@@ -105,50 +110,35 @@ class SQLiteStatistics(object):
 
         """
 
-        # TODO: profile to determine the most efficient version
-
-        #return self.con.execute("""select count() from cards where active=1
-        #    and grade>=2 and ?<=next_rep and next_rep<? and _id<>? and _id in
-        #    (select _id from cards where _fact_id=?)""",
-        #    (start, stop, card._id, card.fact._id)).fetchone()[0]
-
-        #return self.con.execute("""select count() from cards where _id in
-        #    (select _id from cards where _fact_id=?) and active=1
-        #    and grade>=2 and ?<=next_rep and next_rep<? and _id<>?""",
-        #    (card.fact._id, start, stop, card._id)).fetchone()[0]
-
-        #_card_ids = [cursor[0] for cursor in self.con.execute(\
-        #    "select _id from cards where _fact_id=?", (card.fact._id, ))]
-        #query = "select count() from cards where _id in ("
-        #for _card_id in _card_ids:
-        #    query += str(_card_id) + ","
-        #query = query[:-1] + """) and active=1 and grade>=2 and
-        #    ?<=next_rep and next_rep<? and _id<>?"""
-        #return self.con.execute(query, (start, stop, card._id)).fetchone()[0]
-
-        _card_ids = [cursor[0] for cursor in self.con.execute(\
-            "select _id from cards where _fact_id=?", (card.fact._id, ))]
-        if len(_card_ids) == 1: # No sister cards
-            return 0
-        query = "select active, grade, next_rep from cards where _id in ("
-        for _card_id in _card_ids:
-            if _card_id != card._id:
-                query += str(_card_id) + ","
-        query = query[:-1] + """)"""
-        count = 0
-        for cursor in self.con.execute(query):
-            if cursor[0] == True and cursor[1] >= 2 \
-                and start <= cursor[2] < stop:
-                count += 1
-        return count
+        return len([next_rep for next_rep in \
+            self.sister_card_next_reps(card) if start <= next_rep < stop])
 
     def card_count_scheduled_between(self, start, stop):
-        return self.con.execute(\
+        return self.read_con.execute(\
             """select count() from cards where grade>=2 and ?<=next_rep and
             next_rep<? and ret_reps_since_lapse<=? and active='1'""",
             (start, stop,
              self.config()["max_ret_reps_since_lapse"])).fetchone()[0]
 
+    def card_counts_scheduled_per_day(self, start, days):
+
+        """Return a list with the number of cards scheduled on each of the
+        'days' days starting at 'start', i.e. between 'start' + i * DAY
+        (included) and 'start' + (i + 1) * DAY (excluded), using a single
+        query.
+
+        """
+
+        counts = [0] * days
+        for cursor in self.read_con.execute(\
+            """select cast((next_rep - ?) / ? as integer) as day, count()
+            from cards where active=1 and grade>=2 and ?<=next_rep and
+            next_rep<? and ret_reps_since_lapse<=? group by day""",
+            (start, DAY, start, start + days * DAY,
+             self.config()["max_ret_reps_since_lapse"])):
+            counts[cursor[0]] = cursor[1]
+        return counts
+
     def start_of_day_n_days_ago(self, n):
         timestamp = time.time() - n * DAY \
                     - self.config()["day_starts_at"] * HOUR
@@ -160,7 +150,35 @@ class SQLiteStatistics(object):
         return start_of_day
 
     def card_count_scheduled_n_days_ago(self, n):
-        start_of_day = self.start_of_day_n_days_ago(n)
+        return self.card_counts_scheduled_n_days_ago(n, n + 1)[0]
+
+    def card_counts_scheduled_n_days_ago(self, start, stop):
+
+        """Return a list with 'card_count_scheduled_n_days_ago(n)' for n in
+        range('start', 'stop'), using a single query.
+
+        """
+
+        starts_of_day = [self.start_of_day_n_days_ago(n) \
+            for n in range(start, stop)]
+        if not starts_of_day:
+            return []
+        # Because of daylight saving time, the days are not necessarily
+        # exactly DAY apart, so we look up each day in the sorted entries.
+        entries = self.read_con.execute("""select timestamp, acq_reps,
+            object_id from log where ?<=timestamp and timestamp<? and
+            (event_type=? or event_type=?) order by timestamp""",
+            (min(starts_of_day), max(starts_of_day) + DAY,
+            EventTypes.LOADED_DATABASE, EventTypes.SAVED_DATABASE)).fetchall()
+        timestamps = [entry[0] for entry in entries]
+        counts = []
+        for start_of_day in starts_of_day:
+            counts.append(self._scheduled_count_from_log_entries(\
+                entries[bisect.bisect_left(timestamps, start_of_day):
+                bisect.bisect_left(timestamps, start_of_day + DAY)]))
+        return counts
+
+    def _scheduled_count_from_log_entries(self, entries):
         actual_counts_for_machine = {}
         projected_counts_for_machine = {}
         # For each machine id, get the number of cards that were scheduled
@@ -168,12 +186,7 @@ class SQLiteStatistics(object):
         # scheduled that was projected in the future during database load
         # events. For each machine, we take the largest number in the logs,
         # i.e. those at the start of the day.
-        for cursor in self.con.execute("""select acq_reps, object_id from log
-            where ?<=timestamp and timestamp<? and (event_type=? or
-            event_type=?)""", (start_of_day, start_of_day + DAY,
-            EventTypes.LOADED_DATABASE, EventTypes.SAVED_DATABASE)):
-            count = cursor[0]
-            machine = cursor[1]
+        for timestamp, count, machine in entries:
             # Future projected schedule. Check if machine exists to deal with
             # Mnemosyne versions before 201203.
             if machine and machine.endswith(".fut"):
@@ -206,38 +219,41 @@ class SQLiteStatistics(object):
 
     def card_count_added_n_days_ago(self, n):
         start_of_day = self.start_of_day_n_days_ago(n)
-        return self.con.execute(\
-            """select count() from log where ?<=timestamp and timestamp<?
-            and event_type=?""",
+        return self.read_con.execute(\
+            """select count() from %s where ?<=timestamp and timestamp<?
+            and event_type=?""" % self._log_table(),
             (start_of_day, start_of_day + DAY, EventTypes.ADDED_CARD)).\
             fetchone()[0]
 
     def card_count_learned_n_days_ago(self, n):
         start_of_day = self.start_of_day_n_days_ago(n)
-        return self.con.execute(\
-            """select count() from log where ?<=timestamp and timestamp<?
-            and event_type=? and grade>=2 and ret_reps==0""",
+        return self.read_con.execute(\
+            """select count() from %s where ?<=timestamp and timestamp<?
+            and event_type=? and grade>=2 and ret_reps==0""" % \
+            self._log_table(),
             (start_of_day, start_of_day + DAY, EventTypes.REPETITION)).\
             fetchone()[0]
 
     def retention_score_n_days_ago(self, n):
         start_of_day = self.start_of_day_n_days_ago(n)
-        scheduled_cards_seen = self.con.execute(\
-            """select count() from log where ?<=timestamp and timestamp<?
-            and event_type=? and scheduled_interval!=0""",
+        scheduled_cards_seen = self.read_con.execute(\
+            """select count() from %s where ?<=timestamp and timestamp<?
+            and event_type=? and scheduled_interval!=0""" % \
+            self._log_table(),
             (start_of_day, start_of_day + DAY, EventTypes.REPETITION)).\
             fetchone()[0]
         if scheduled_cards_seen == 0:
             return 0
-        scheduled_cards_correct = self.con.execute(\
-            """select count() from log where ?<=timestamp and timestamp<?
-            and event_type=? and scheduled_interval!=0 and grade>=2""",
+        scheduled_cards_correct = self.read_con.execute(\
+            """select count() from %s where ?<=timestamp and timestamp<?
+            and event_type=? and scheduled_interval!=0 and grade>=2""" % \
+            self._log_table(),
             (start_of_day, start_of_day + DAY, EventTypes.REPETITION)).\
             fetchone()[0]
         return 100.0 * scheduled_cards_correct / scheduled_cards_seen
 
     def average_thinking_time(self, card):
-        result = self.con.execute(\
+        result = self.read_con.execute(\
             """select avg(thinking_time) from log where object_id=?
             and event_type=?""",
             (card.id, EventTypes.REPETITION)).fetchone()[0]
@@ -247,7 +263,7 @@ class SQLiteStatistics(object):
             return 0
 
     def total_thinking_time(self, card):
-        result = self.con.execute(\
+        result = self.read_con.execute(\
             """select sum(thinking_time) from log where object_id=?
             and event_type=?""",
             (card.id, EventTypes.REPETITION)).fetchone()[0]
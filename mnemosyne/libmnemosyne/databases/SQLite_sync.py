@@ -8,6 +8,7 @@ import os
 import re
 import time
 import sqlite3
+import itertools
 
 from openSM2sync.log_entry import LogEntry
 from openSM2sync.log_entry import EventTypes
@@ -18,7 +19,7 @@ from mnemosyne.libmnemosyne.card import Card
 from mnemosyne.libmnemosyne.gui_translator import _
 from mnemosyne.libmnemosyne.card_type import CardType
 from mnemosyne.libmnemosyne.fact_view import FactView
-from mnemosyne.libmnemosyne.utils import MnemosyneError
+from mnemosyne.libmnemosyne.utils import MnemosyneError, decode_data
 from mnemosyne.libmnemosyne.utils import normalise_path, expand_path
 
 
@@ -123,10 +124,7 @@ class SQLiteSync(object):
             raise RuntimeError(_("Missing plugins for card types."))
         # See if we need to reapply the default criterion.
         if self.reapply_default_criterion_needed:
-            criterion = self.current_criterion()
-            applier = self.component_manager.current("criterion_applier",
-                used_for=criterion.__class__)
-            applier.apply_to_database(criterion)
+            self._apply_criterion(self.current_criterion())
         # Now we can update the last log index.
         self.con.execute(\
             "update partnerships set _last_log_id=? where partner=?",
@@ -158,22 +156,43 @@ class SQLiteSync(object):
 
         _id = self.last_log_index_synced_for(partner)
         if interested_in_old_reps:
-            return (self._log_entry(cursor) for cursor in self.con.execute(\
+            return self._log_entries(self.read_con.execute(\
                 "select * from log where _id>?", (_id, )))
         else:
-            return (self._log_entry(cursor) for cursor in self.con.execute(\
+            return self._log_entries(self.read_con.execute(\
                 "select * from log where _id>? and event_type!=?",
                 (_id, EventTypes.REPETITION)))
 
     def all_log_entries(self, interested_in_old_reps=True):
         if interested_in_old_reps:
-            return (self._log_entry(cursor) for cursor in self.con.execute(\
-                "select * from log"))
+            return self._log_entries(self.read_con.execute("select * from log"))
         else:
-            return (self._log_entry(cursor) for cursor in self.con.execute(\
+            return self._log_entries(self.read_con.execute(\
                 "select * from log where event_type!=?",
                 (EventTypes.REPETITION, )))
 
+    def _log_entries(self, cursor, chunk_size=500):
+
+        """Turn the log rows from 'cursor' into log entries. To avoid issuing
+        several queries for each card event, we read the rows in chunks and
+        fetch all the cards referred to in a chunk in one go.
+
+        """
+
+        while True:
+            rows = list(itertools.islice(cursor, chunk_size))
+            if not rows:
+                break
+            card_ids = set(row[3] for row in rows if row[3] and row[1] in \
+                (EventTypes.ADDED_CARD, EventTypes.EDITED_CARD))
+            self._prefetched_cards = dict((card.id, card) for card in \
+                self.cards_with_ids(card_ids))
+            try:
+                for row in rows:
+                    yield self._log_entry(row)
+            finally:
+                self._prefetched_cards = None
+
     def media_filenames_to_sync_for(self, partner):
 
         """Determine which media files need to be sent across during the sync.
@@ -260,7 +279,7 @@ class SQLiteSync(object):
         # Fact views.
         active_objects["fact_view_ids"] = []
         for card_type_id in active_objects["card_type_ids"]:
-            active_objects["fact_view_ids"] += eval(self.con.execute(\
+            active_objects["fact_view_ids"] += decode_data(self.con.execute(\
                 "select fact_view_ids from card_types where id=?",
                 (card_type_id, )).fetchone()[0])
         # Media files for active cards.
@@ -277,7 +296,13 @@ class SQLiteSync(object):
 
     def _log_entry(self, sql_res):
 
-        """Create log entry object in the format openSM2sync expects."""
+        """Create log entry object in the format openSM2sync expects.
+
+        Note that we keep sending the data structures like extra_data as
+        repr() strings, as older sync partners eval() them. When receiving,
+        we accept both this and the format of 'utils.encode_data'.
+
+        """
 
         log_entry = LogEntry()
         log_entry["type"] = sql_res[1]
@@ -292,7 +317,13 @@ class SQLiteSync(object):
             log_entry["n_mem"] = sql_res[7]
             log_entry["act"] = sql_res[8]
         elif event_type in (EventTypes.ADDED_CARD, EventTypes.EDITED_CARD):
-            if self.has_card_with_id(log_entry["o_id"]):
+            if self._prefetched_cards is not None:
+                card = self._prefetched_cards.get(log_entry["o_id"])
+            elif self.has_card_with_id(log_entry["o_id"]):
+                card = self.card(log_entry["o_id"], is_id_internal=False)
+            else:
+                card = None
+            if card is not None:
                 # Note that some of these values (e.g. the repetition count) we
                 # could in theory calculate from the previous state and the
                 # grade. However, we send the entire state of the card across
@@ -300,7 +331,6 @@ class SQLiteSync(object):
                 # because of conflict resolution.
                 # Note that we deliberately do not send across 'active', as
                 # this is controlled by the remote client.
-                card = self.card(log_entry["o_id"], is_id_internal=False)
                 if self.sync_partner_info.get("capabilities") == "cards":
                     log_entry["f"] = card.question("sync_to_card_only_client")
                     log_entry["b"] = card.answer("sync_to_card_only_client")
@@ -454,7 +484,7 @@ class SQLiteSync(object):
         # Create tag object.
         tag = Tag(log_entry["name"], log_entry["o_id"])
         if "extra" in log_entry:
-            tag.extra_data = eval(log_entry["extra"])
+            tag.extra_data = decode_data(log_entry["extra"])
         # Make sure to create _id fields as well, otherwise database
         # operations or their side effects could fail.
         if log_entry["type"] != EventTypes.ADDED_TAG:
@@ -512,7 +542,7 @@ class SQLiteSync(object):
                 card.last_rep = orig_card.last_rep
                 card.modification_time = int(time.time())
                 if "extra" in log_entry:
-                    card.extra_data = eval(log_entry["extra"])
+                    card.extra_data = decode_data(log_entry["extra"])
                 card.tags = orig_card.tags
                 for tag_id in log_entry["tags"].split(","):
                     card.tags.add(self.tag(tag_id, is_id_internal=False))
@@ -633,7 +663,7 @@ class SQLiteSync(object):
         if "sch_data" in log_entry:
             card.scheduler_data = log_entry["sch_data"]
         if "extra" in log_entry:
-            card.extra_data = eval(log_entry["extra"])
+            card.extra_data = decode_data(log_entry["extra"])
         return card
 
     def apply_repetition(self, log_entry):
@@ -654,6 +684,9 @@ class SQLiteSync(object):
             card.ret_reps, card.lapses, card.acq_reps_since_lapse,
             card.ret_reps_since_lapse, card.last_rep, card.next_rep,
             card.scheduler_data, card.id))
+        # Only the id of the card is known here, so the due index can't be
+        # updated in place.
+        self._invalidate_due_index()
 
     def add_media_file(self, log_entry):
 
@@ -721,14 +754,16 @@ class SQLiteSync(object):
             return FactView("irrelevant", log_entry["o_id"])
         # Create fact view object.
         fact_view = FactView(log_entry["name"], log_entry["o_id"])
-        fact_view.q_fact_keys = eval(log_entry["q_fact_keys"])
-        fact_view.a_fact_keys = eval(log_entry["a_fact_keys"])
-        fact_view.q_fact_key_decorators = eval(log_entry["q_fact_key_decorators"])
-        fact_view.a_fact_key_decorators = eval(log_entry["a_fact_key_decorators"])
-        fact_view.a_on_top_of_q = bool(eval(log_entry["a_on_top_of_q"]))
-        fact_view.type_answer = bool(eval(log_entry["type_answer"]))
+        fact_view.q_fact_keys = decode_data(log_entry["q_fact_keys"])
+        fact_view.a_fact_keys = decode_data(log_entry["a_fact_keys"])
+        fact_view.q_fact_key_decorators = \
+            decode_data(log_entry["q_fact_key_decorators"])
+        fact_view.a_fact_key_decorators = \
+            decode_data(log_entry["a_fact_key_decorators"])
+        fact_view.a_on_top_of_q = bool(decode_data(log_entry["a_on_top_of_q"]))
+        fact_view.type_answer = bool(decode_data(log_entry["type_answer"]))
         if "extra" in log_entry:
-            fact_view.extra_data = eval(log_entry["extra"])
+            fact_view.extra_data = decode_data(log_entry["extra"])
         return fact_view
 
     def add_card_type_from_log_entry(self, log_entry):
@@ -778,16 +813,19 @@ class SQLiteSync(object):
         card_type = CardType(self.component_manager)
         card_type.id = log_entry["o_id"]
         card_type.name = log_entry["name"]
-        card_type.fact_keys_and_names = eval(log_entry["fact_keys_and_names"])
+        card_type.fact_keys_and_names = \
+            decode_data(log_entry["fact_keys_and_names"])
         card_type.fact_views = []
-        for fact_view_id in eval(log_entry["fact_views"]):
+        for fact_view_id in decode_data(log_entry["fact_views"]):
             card_type.fact_views.append(self.fact_view(fact_view_id,
                 is_id_internal=False))
-        card_type.unique_fact_keys = eval(log_entry["unique_fact_keys"])
-        card_type.required_fact_keys = eval(log_entry["required_fact_keys"])
-        card_type.keyboard_shortcuts = eval(log_entry["keyboard_shortcuts"])
+        card_type.unique_fact_keys = decode_data(log_entry["unique_fact_keys"])
+        card_type.required_fact_keys = \
+            decode_data(log_entry["required_fact_keys"])
+        card_type.keyboard_shortcuts = \
+            decode_data(log_entry["keyboard_shortcuts"])
         if "extra" in log_entry:
-            card_type.extra_data = eval(log_entry["extra"])
+            card_type.extra_data = decode_data(log_entry["extra"])
         return card_type
 
     def criterion_from_log_entry(self, log_entry):
@@ -831,6 +869,9 @@ class SQLiteSync(object):
         # machine ids for LOADED_DATABASE and SAVED_DATABASE.
         if not "o_id" in log_entry:
             log_entry["o_id"] = ""
+        # The object could be updated behind the back of the cached version,
+        # e.g. by 'apply_repetition'.
+        self.invalidate_objects_with_id(log_entry["o_id"])
         try:
             if event_type == EventTypes.STARTED_PROGRAM:
                 self.log().started_program(log_entry["o_id"])
@@ -893,7 +934,7 @@ class SQLiteSync(object):
             elif event_type == EventTypes.DELETED_CRITERION:
                 self.delete_criterion(self.criterion_from_log_entry(log_entry))
             elif event_type == EventTypes.EDITED_SETTING:
-                key, value = log_entry["o_id"], eval(log_entry["value"])
+                key, value = log_entry["o_id"], decode_data(log_entry["value"])
                 if key in self.config().keys_to_sync:
                     self.config()[key] = value
                     for card_type in self.card_types():
@@ -14,6 +14,7 @@ import apsw
 
 from mnemosyne.libmnemosyne.gui_translator import _
 from mnemosyne.libmnemosyne.component import Component
+from mnemosyne.libmnemosyne.utils import traceback_string, MnemosyneError
 
 
 class _APSWCursor(object):
@@ -28,10 +29,10 @@ class _APSWCursor(object):
             return None
 
     def fetchall(self):
-        return self.cursor.fetchall()
+        return list(self.cursor)
 
     def __iter__(self):
-        return self.cursor
+        return self
 
     def __next__(self):
         return next(self.cursor)
@@ -42,6 +43,9 @@ class _APSW(Component):
     # We don't need debug and tracing statements, since APSW provides tools
     # like apswtrace.
 
+    journal_mode = "persist"
+    concurrent_reads = False
+
     def __init__(self, component_manager, path):
         Component.__init__(self, component_manager)
         # Make sure we don't put a database on a network drive under Windows:
@@ -55,37 +59,92 @@ class _APSW(Component):
                 sys.exit(-1)
         self.connection = apsw.Connection(path)
         self.connection.setbusytimeout(250)
+        self.attached = [] # [(path, name)]
         cursor = self.connection.cursor()
         # http://www.mail-archive.com/sqlite-users@sqlite.org/msg34453.html
-        cursor.execute("pragma journal_mode = persist;")
+        cursor.execute("pragma journal_mode = %s;" % self.journal_mode)
         # Should only be used to speed up the test suite.
         if self.config()["asynchronous_database"] == True:
             cursor.execute("pragma synchronous = off;")
-        # Always start a transaction and only commit when 'commit' is called
-        # explicitly.
+        # Contrary to sqlite3, APSW does not open transactions behind our
+        # back, so we always start one ourselves and only commit when 'commit'
+        # is called explicitly.
         cursor.execute("begin;")
 
+    def attach(self, path, name):
+        if name in [attached_name for attached_path, attached_name in \
+            self.attached]:
+            return
+        cursor = self.connection.cursor()
+        # Cannot attach inside a transaction.
+        cursor.execute("commit;")
+        try:
+            cursor.execute("attach database ? as %s" % name, (path, ))
+            cursor.execute("pragma %s.journal_mode = %s;" \
+                % (name, self.journal_mode))
+            if self.config()["asynchronous_database"] == True:
+                cursor.execute("pragma %s.synchronous = off;" % name)
+        finally:
+            cursor.execute("begin;")
+        self.attached.append((path, name))
+
     def executescript(self, script):
-        self.connection.cursor().execute(script)
+        # Like sqlite3, commit first and run the script outside of our
+        # transaction, such that it can contain its own transactions, or
+        # statements like 'vacuum'.
+        cursor = self.connection.cursor()
+        if not self.connection.getautocommit():
+            cursor.execute("commit;")
+        try:
+            cursor.execute(script)
+        except apsw.Error:
+            raise MnemosyneError("SQL error: " + script
+                + "\n" + traceback_string())
+        finally:
+            # A script which failed halfway could have left its own
+            # transaction open, which then takes the place of ours.
+            if self.connection.getautocommit():
+                cursor.execute("begin;")
 
     def execute(self, sql, *args):
-        return _APSWCursor(self.connection.cursor().execute(sql, *args))
+        # 'vacuum' cannot run inside a transaction.
+        outside_transaction = sql.strip().lower().startswith("vacuum")
+        if outside_transaction:
+            self.connection.cursor().execute("commit;")
+        try:
+            cursor = self.connection.cursor().execute(sql, *args)
+        except apsw.Error:
+            raise MnemosyneError("SQL error: " + sql + " " + str(*args)
+                + "\n" + traceback_string())
+        finally:
+            if outside_transaction:
+                self.connection.cursor().execute("begin;")
+        return _APSWCursor(cursor)
 
     def executemany(self, sql, *args):
-        return _APSWCursor(self.connection.cursor().executemany(sql, *args))
+        try:
+            cursor = self.connection.cursor().executemany(sql, *args)
+        except apsw.Error:
+            raise MnemosyneError("SQL error: " + sql
+                + "\n" + traceback_string())
+        return _APSWCursor(cursor)
 
     def last_insert_rowid(self):
         return self.connection.last_insert_rowid()
 
     def commit(self):
         try:
-            return self.connection.cursor().execute("commit;")
+            self.connection.cursor().execute("commit;")
         except apsw.SQLError as e:
-            if "cannot commit - no transaction is active" in str(e):
-                pass
-            else:
+            if "cannot commit - no transaction is active" not in str(e):
                 raise e
         self.connection.cursor().execute("begin;")
 
+    def read_connection(self):
+        return self
+
+    def checkpoint(self, mode="PASSIVE"):
+        pass
+
     def close(self):
-        self.connection.close()
\ No newline at end of file
+        self.connection.close()
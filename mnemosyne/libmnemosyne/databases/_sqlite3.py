@@ -38,6 +38,11 @@ class _Sqlite3Cursor(object):
 class _Sqlite3(Component):
 
     DEBUG = False
+    journal_mode = "persist"
+    concurrent_reads = False
+    # Set to a StatementStatistics object to time all statements, see
+    # 'SQLite.con'.
+    statement_statistics = None
 
     def __init__(self, component_manager, path):
         Component.__init__(self, component_manager)
@@ -52,17 +57,45 @@ class _Sqlite3(Component):
 ("Putting a database on a network drive is forbidden under Windows to avoid data corruption. Mnemosyne will now close."))
                 sys.exit(-1)
         self.connection = sqlite3.connect(path)
+        self.attached = [] # [(path, name)]
         # http://www.mail-archive.com/sqlite-users@sqlite.org/msg34453.html
-        self.connection.execute("pragma journal_mode = persist;")
+        self.connection.execute("pragma journal_mode = %s;" \
+            % self.journal_mode)
         # Should only be used to speed up the test suite.
         if self.config()["asynchronous_database"] == True:
             self.connection.execute("pragma synchronous = off;")
 
+    def attach(self, path, name):
+
+        """Attach the database at 'path' as schema 'name'. It uses the same
+        journal mode as the main database, such that a transaction spanning
+        both is still atomic (except when using a write-ahead log).
+
+        """
+
+        if name in [attached_name for attached_path, attached_name in \
+            self.attached]:
+            return
+        self.connection.commit()  # Cannot attach inside a transaction.
+        self.connection.execute("attach database ? as %s" % name, (path, ))
+        # Fetching the result finishes the statement, which would otherwise
+        # keep the attached database locked.
+        self.connection.execute("pragma %s.journal_mode = %s;" \
+            % (name, self.journal_mode)).fetchall()
+        if self.config()["asynchronous_database"] == True:
+            self.connection.execute("pragma %s.synchronous = off;" % name)
+        self.attached.append((path, name))
+
     def executescript(self, script):
         if self.DEBUG:
             print(script)
             t = time.time()
+        statistics = self.statement_statistics
+        if statistics is not None:
+            start = time.perf_counter()
         self.connection.executescript(script)
+        if statistics is not None:
+            statistics.record(script, time.perf_counter() - start)
         if self.DEBUG:
             print(("took %.3f secs" % (time.time() - t)))
 
@@ -70,11 +103,19 @@ class _Sqlite3(Component):
         if self.DEBUG:
             print((sql, args))
             t = time.time()
+        # Note that for queries, this only includes the time needed to fetch
+        # the first row.
+        statistics = self.statement_statistics
+        if statistics is not None:
+            start = time.perf_counter()
         try:
             self._cursor = self.connection.execute(sql, *args)
         except:
             raise MnemosyneError("SQL error: " + sql + " " + str(*args)
                 + "\n" + traceback_string())
+        if statistics is not None:
+            statistics.record(sql, time.perf_counter() - start,
+                args[0] if args else (), self.connection)
         if self.DEBUG:
             print(("took %.3f secs" % (time.time() - t)))
         return _Sqlite3Cursor(self._cursor)
@@ -83,7 +124,14 @@ class _Sqlite3(Component):
         if self.DEBUG:
             print((sql, args))
             t = time.time()
+        statistics = self.statement_statistics
+        if statistics is not None:
+            start = time.perf_counter()
         self._cursor = self.connection.executemany(sql, *args)
+        if statistics is not None:
+            # The arguments could have been a generator, so we cannot use
+            # them to explain the statement.
+            statistics.record(sql, time.perf_counter() - start)
         if self.DEBUG:
             print(("took %.3f secs" % (time.time() - t)))
         return _Sqlite3Cursor(self._cursor)
@@ -94,6 +142,19 @@ class _Sqlite3(Component):
     def commit(self):
         return self.connection.commit()
 
+    def read_connection(self):
+
+        """Connection to be used for read-only queries. Without a write-ahead
+        log, readers and writers block each other anyway, so we simply return
+        ourselves.
+
+        """
+
+        return self
+
+    def checkpoint(self, mode="PASSIVE"):
+        pass
+
     def close(self):
         del self._cursor
         return self.connection.close()
@@ -0,0 +1,135 @@
+#
+# _sqlite3_wal.py <Peter.Bienstman@gmail.com>
+#
+
+#
+# sqlite3 backend using a write-ahead log, such that threads other than the
+# one doing the writing (web server, sync server, statistics, card browser)
+# can read concurrently without having to release the main connection.
+#
+
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+from mnemosyne.libmnemosyne.component import Component
+from mnemosyne.libmnemosyne.databases._sqlite3 import _Sqlite3
+
+
+class _Sqlite3ReadOnly(_Sqlite3):
+
+    """Read-only connection, to be used by a single thread."""
+
+    def __init__(self, component_manager, path):
+        Component.__init__(self, component_manager)
+        self._cursor = None
+        # We open the connection in the thread that uses it, but close it from
+        # the writer thread.
+        self.connection = sqlite3.connect("file:%s?mode=ro" % \
+            pathname2url(os.path.abspath(path)), uri=True,
+            check_same_thread=False)
+        self.attached = []
+
+    def attach(self, path, name):
+        self.connection.execute("attach database ? as %s" % name,
+            ("file:%s?mode=ro" % pathname2url(os.path.abspath(path)), ))
+        self.attached.append((path, name))
+
+    def commit(self):
+        pass
+
+
+class _Sqlite3WAL(_Sqlite3):
+
+    """One connection which does all the writing, together with a pool of
+    per-thread read-only connections. As long as a thread has not committed
+    its changes, it needs to use the writer connection to see them, so the
+    thread which created the writer connection always reads through it.
+
+    """
+
+    journal_mode = "wal"
+    concurrent_reads = True
+
+    # Size of the log in bytes above which we checkpoint on commit.
+    checkpoint_threshold = 4 * 1024 * 1024
+
+    def __init__(self, component_manager, path):
+        _Sqlite3.__init__(self, component_manager, path)
+        self.path = path
+        self.writer_thread_id = threading.get_ident()
+        self._read_connection_for_thread_id = {}
+        self._lock = threading.Lock()
+        # We do the checkpointing ourselves, at moments which don't get in the
+        # way of the user, see 'checkpoint'. Once checkpointed, the log gets
+        # truncated when it's being reused.
+        self.connection.execute("pragma wal_autocheckpoint = 0;")
+        self.connection.execute("pragma journal_size_limit = %d;" \
+            % (self.checkpoint_threshold // 4))
+
+    def read_connection(self):
+        thread_id = threading.get_ident()
+        if thread_id == self.writer_thread_id:
+            return self
+        with self._lock:
+            connection = self._read_connection_for_thread_id.get(thread_id)
+            if connection is None:
+                connection = _Sqlite3ReadOnly(self.component_manager,
+                    self.path)
+                connection.statement_statistics = self.statement_statistics
+                for path, name in self.attached:
+                    connection.attach(path, name)
+                self._read_connection_for_thread_id[thread_id] = connection
+        return connection
+
+    def release_read_connection(self):
+
+        """Close the read-only connection of the current thread, e.g. when a
+        server thread finishes.
+
+        """
+
+        with self._lock:
+            connection = self._read_connection_for_thread_id.pop(\
+                threading.get_ident(), None)
+        if connection is not None:
+            connection.close()
+
+    def commit(self):
+        _Sqlite3.commit(self)
+        for path in [self.path] + [path for path, name in self.attached]:
+            wal_path = path + "-wal"
+            if os.path.exists(wal_path) and \
+                os.path.getsize(wal_path) > self.checkpoint_threshold:
+                self.checkpoint()
+                break
+
+    def checkpoint(self, mode="PASSIVE"):
+
+        """Transfer the changes in the log to the database. 'PASSIVE' does
+        not wait for readers, 'TRUNCATE' waits for them and empties the log,
+        which is needed before copying the database file.
+
+        """
+
+        # Checkpoint each of the attached databases separately, as doing
+        # them all at once fails right after one got switched to a
+        # write-ahead log.
+        checkpointed = True
+        for name in ["main"] + [name for path, name in self.attached]:
+            busy, pages_in_log, pages_checkpointed = self.connection.execute(\
+                "pragma %s.wal_checkpoint(%s);" % (name, mode)).fetchone()
+            checkpointed = checkpointed and not busy and \
+                pages_checkpointed == pages_in_log
+        return checkpointed
+
+    def close(self):
+        with self._lock:
+            connections = list(self._read_connection_for_thread_id.values())
+            self._read_connection_for_thread_id = {}
+        for connection in connections:
+            connection.close()
+        if not self.connection.in_transaction:
+            self.checkpoint("TRUNCATE")
+        _Sqlite3.close(self)
@@ -0,0 +1,160 @@
+#
+# _statement_statistics.py <Peter.Bienstman@gmail.com>
+#
+
+#
+# Instrumentation for the sqlite3 backend: latency histograms per statement
+# and a log of the slowest ones, to find out which queries need work on
+# databases we don't have access to ourselves.
+#
+
+import os
+import re
+import json
+import time
+import threading
+import collections
+
+# Upper bounds in seconds of the buckets of the latency histograms. The last
+# bucket collects everything slower.
+LATENCY_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+
+# Patterns used to strip the literals from a statement, such that statements
+# which only differ in e.g. the ids they inline get aggregated together.
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+# Longer arguments get truncated in the log of slow statements.
+MAX_ARGS_LENGTH = 200
+
+# Maximum number of distinct statements for which we remember the normalised
+# text.
+MAX_NORMALISED_CACHE_SIZE = 10000
+
+# Only these statements can be explained.
+_EXPLAINABLE = ("select", "insert", "update", "delete", "replace", "with")
+
+
+class StatementStatistics(object):
+
+    """Collects the time each statement took, aggregated per normalised SQL
+    text, together with a ring buffer of the statements slower than
+    'slow_threshold' seconds and their query plan.
+
+    Statements can be recorded from several threads at once, e.g. by the
+    read-only connections of a write-ahead log database.
+
+    """
+
+    def __init__(self, slow_threshold=0.1, max_slow_statements=100):
+        self.slow_threshold = slow_threshold
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow_statements = collections.deque(maxlen=max_slow_statements)
+        self._start = time.time()
+        self._normalised = {}
+
+    @staticmethod
+    def normalise(sql):
+
+        """Replace the literals in 'sql' by '?', collapse 'in' lists and
+        whitespace.
+
+        """
+
+        sql = _STRING.sub("?", sql)
+        sql = _NUMBER.sub("?", sql)
+        sql = _IN_LIST.sub("in (...)", sql)
+        return _WHITESPACE.sub(" ", sql).strip()
+
+    def record(self, sql, elapsed, args=(), connection=None):
+
+        """Add a statement which took 'elapsed' seconds. If the statement was
+        slow and 'connection' is given, it is used to obtain the query plan.
+
+        """
+
+        # Most statements use parameters, so the same text comes back over
+        # and over again.
+        key = self._normalised.get(sql)
+        if key is None:
+            if len(self._normalised) >= MAX_NORMALISED_CACHE_SIZE:
+                self._normalised = {}
+            key = self._normalised[sql] = self.normalise(sql)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and \
+            elapsed > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                entry = self._statements[key] = {"count": 0, "total": 0.0,
+                    "max": 0.0, "histogram": [0] * (len(LATENCY_BUCKETS) + 1)}
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+            entry["histogram"][bucket] += 1
+        if elapsed < self.slow_threshold:
+            return
+        plan = None
+        if connection is not None:
+            plan = self.query_plan(connection, sql, args)
+        with self._lock:
+            self._slow_statements.append({"sql": sql,
+                "args": repr(args)[:MAX_ARGS_LENGTH], "time": elapsed,
+                "timestamp": time.time(), "plan": plan})
+
+    def query_plan(self, connection, sql, args=()):
+
+        """Returns the output of 'explain query plan' as a list of lines,
+        indented according to the nesting of the plan, or None if the
+        statement cannot be explained.
+
+        """
+
+        if not sql.lstrip().lower().startswith(_EXPLAINABLE):
+            return None
+        try:
+            rows = connection.execute("explain query plan " + sql,
+                args).fetchall()
+        except Exception:
+            return None
+        depth = {0: 0}
+        plan = []
+        for id, parent, notused, detail in rows:
+            depth[id] = depth.get(parent, 0) + 1
+            plan.append("  " * (depth[id] - 1) + detail)
+        return plan
+
+    def report(self):
+
+        """Returns a dictionary with the aggregated statements, sorted by
+        decreasing total time, and the slow statements, oldest first.
+
+        """
+
+        with self._lock:
+            statements = [dict(entry, sql=sql, histogram=list(\
+                entry["histogram"])) for sql, entry in \
+                self._statements.items()]
+            slow_statements = [dict(entry) for entry in self._slow_statements]
+        statements.sort(key=lambda entry: entry["total"], reverse=True)
+        for entry in statements:
+            entry["mean"] = entry["total"] / entry["count"]
+        return {"since": self._start, "buckets": list(LATENCY_BUCKETS),
+                "slow_threshold": self.slow_threshold,
+                "statements": statements, "slow_statements": slow_statements}
+
+    def dump(self, path):
+        tmpfile = path + ".tmp"
+        with open(tmpfile, "w") as f:
+            json.dump(self.report(), f, indent=1)
+        os.replace(tmpfile, path)
+
+    def reset(self):
+        with self._lock:
+            self._statements = {}
+            self._slow_statements.clear()
+            self._start = time.time()
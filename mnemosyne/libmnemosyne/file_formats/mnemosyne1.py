@@ -47,11 +47,25 @@ class Mnemosyne1(MediaPreprocessor):
             while item.id in self.items_by_id:
                 item.id = "dup" + item.id
             self.items_by_id[item.id] = item
+        # The cards are only stored in the database at the end, in bulk, so
+        # we can give them their final ids and learning data straight away.
+        self.new_facts, self.new_cards = [], []
+        self.tags_for_tag_names = {}
         for item in self.items:
             w.increase_progress(1)
             self.create_card_from_item(item, extra_tag_names)
+        self.database().add_facts_and_cards_bulk(\
+            self.new_facts, self.new_cards)
+        self.new_facts, self.new_cards = [], []
         w.set_progress_value(len(self.items))
 
+    def create_new_cards(self, fact_data, card_type, tag_names):
+        facts, sister_cards = self.controller().new_cards_bulk(\
+            [(fact_data, card_type, tag_names)], self.tags_for_tag_names)
+        self.new_facts.extend(facts)
+        self.new_cards.extend(sister_cards[0])
+        return sister_cards[0]
+
     def create_card_from_item(self, item, extra_tag_names):
         # Create tag names.
         if item.cat.name == "<default>" or \
@@ -75,9 +89,8 @@ class Mnemosyne1(MediaPreprocessor):
                     fact_data["f"] = "(blank)"
                 tag_names = [item.cat.name]
                 self.preprocess_media(fact_data, tag_names)
-                card = self.controller().create_new_cards(fact_data,
-                    card_type, grade=-1, tag_names=tag_names,
-                    check_for_duplicates=False, save=False)[0]
+                card = self.create_new_cards(fact_data,
+                    card_type, tag_names)[0]
                 self.set_card_attributes(card, item)
             return
         # Map.
@@ -101,9 +114,8 @@ class Mnemosyne1(MediaPreprocessor):
             if not fact_data["blank"]:
                 fact_data["blank"] = "(blank)"
             self.preprocess_media(fact_data, tag_names)
-            card_1, card_2 = self.controller().create_new_cards(fact_data,
-                card_type, grade=-1, tag_names=tag_names,
-                check_for_duplicates=False, save=False)
+            card_1, card_2 = self.create_new_cards(fact_data,
+                card_type, tag_names)
             self.set_card_attributes(card_2, item)
             self.set_card_attributes(card_1, item_2)
         # Front-to-back.
@@ -114,9 +126,8 @@ class Mnemosyne1(MediaPreprocessor):
             if not fact_data["f"]:
                 fact_data["f"] = "(blank)"
             self.preprocess_media(fact_data, tag_names)
-            card = self.controller().create_new_cards(fact_data,
-                card_type, grade=-1, tag_names=tag_names,
-                check_for_duplicates=False, save=False)[0]
+            card = self.create_new_cards(fact_data,
+                card_type, tag_names)[0]
             self.set_card_attributes(card, item)
         # Front-to-back and back-to-front.
         elif item.id + ".inv" in self.items_by_id:
@@ -127,9 +138,8 @@ class Mnemosyne1(MediaPreprocessor):
             if not fact_data["b"]:
                 fact_data["b"] = "(blank)"
             self.preprocess_media(fact_data, tag_names)
-            card_1, card_2 = self.controller().create_new_cards(fact_data,
-                card_type, grade=-1, tag_names=tag_names,
-                check_for_duplicates=False, save=False)
+            card_1, card_2 = self.create_new_cards(fact_data,
+                card_type, tag_names)
             self.set_card_attributes(card_1, item)
             self.set_card_attributes\
                 (card_2, self.items_by_id[item.id + ".inv"])
@@ -146,9 +156,8 @@ class Mnemosyne1(MediaPreprocessor):
                 fact_data["f"] = "(blank)"
             if not fact_data["m_1"]:
                 fact_data["m_1"] = "(blank)"
-            card_1, card_2 = self.controller().create_new_cards(fact_data,
-                card_type, grade=-1, tag_names=tag_names,
-                check_for_duplicates=False, save=False)
+            card_1, card_2 = self.create_new_cards(fact_data,
+                card_type, tag_names)
             self.set_card_attributes(card_1, item)
             self.set_card_attributes\
                 (card_2, self.items_by_id[item.id + ".tr.1"])
@@ -156,7 +165,6 @@ class Mnemosyne1(MediaPreprocessor):
     def set_card_attributes(self, card, item):
         # Note that we cannot give cards a new id, otherwise the log server
         # would not know it was the same card.
-        self.database().change_card_id(card, item.id)
         for attr in ["id", "grade", "easiness", "acq_reps", "ret_reps",
             "lapses", "acq_reps_since_lapse", "ret_reps_since_lapse"]:
             setattr(card, attr, getattr(item, attr))
@@ -173,7 +181,6 @@ class Mnemosyne1(MediaPreprocessor):
             card.acq_reps_since_lapse = 0
             card.last_rep = -1
             card.next_rep = -1
-        self.database().update_card(card)
 
     def activate_map_plugin(self):
         for plugin in self.plugins():
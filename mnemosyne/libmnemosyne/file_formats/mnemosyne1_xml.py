@@ -42,9 +42,8 @@ class Mnemosyne1XML(FileFormat, Mnemosyne1):
             return
         db.remove_card_log_entries_since(log_index)
         # We now generate 'added card' events with the proper ids.
-        timestamp = int(time.time())
-        for item in self.items:
-            db.log_added_card(timestamp, item.id)
+        db.log_added_cards(int(time.time()),
+            [item.id for item in self.items])
         self.database().link_inverse_cards()
         w.close_progress()
         self.warned_about_missing_media = False
@@ -113,50 +113,53 @@ class Mnemosyne2Cards(FileFormat):
             log_entry["fname"] = media_filename
             xml_file.write(str(xml_format.repr_log_entry(log_entry)))
             w.increase_progress(1)
-        for _fact_id in active_objects["_fact_ids"]:
-            fact = db.fact(_fact_id, is_id_internal=True)
-            log_entry = LogEntry()
-            log_entry["type"] = EventTypes.ADDED_FACT
-            log_entry["o_id"] = fact.id
-            for fact_key, value in fact.data.items():
-                log_entry[fact_key] = value
-            xml_file.write(xml_format.repr_log_entry(log_entry))
-            w.increase_progress(1)
-        for _card_id in active_objects["_card_ids"]:
-            card = db.card(_card_id, is_id_internal=True)
-            log_entry = LogEntry()
-            log_entry["type"] = EventTypes.ADDED_CARD
-            log_entry["o_id"] = card.id
-            log_entry["card_t"] = card.card_type.id
-            log_entry["fact"] = card.fact.id
-            log_entry["fact_v"] = card.fact_view.id
-            log_entry["tags"] = ",".join([tag.id for tag in card.tags])
-            if used_for_merging_dbs:
-                log_entry["c_time"] = card.creation_time
-                log_entry["m_time"] = card.modification_time
-                log_entry["gr"] = card.grade
-                log_entry["e"] = card.easiness
-                log_entry["ac_rp"] = card.acq_reps
-                log_entry["rt_rp"] = card.ret_reps
-                log_entry["lps"] = card.lapses
-                log_entry["ac_rp_l"] = card.acq_reps_since_lapse
-                log_entry["rt_rp_l"] = card.ret_reps_since_lapse
-                log_entry["l_rp"] = card.last_rep
-                log_entry["n_rp"] = card.next_rep
-            else:
-                log_entry["gr"] = -1
-                log_entry["e"] = 2.5
-                log_entry["ac_rp"] = 0
-                log_entry["rt_rp"] = 0
-                log_entry["lps"] = 0
-                log_entry["ac_rp_l"] = 0
-                log_entry["rt_rp_l"] = 0
-                log_entry["l_rp"] = -1
-                log_entry["n_rp"] = -1
-            if card.extra_data:
-                log_entry["extra"] = repr(card.extra_data)
-            xml_file.write(xml_format.repr_log_entry(log_entry))
-            w.increase_progress(1)
+        # Fetch facts and cards in bulk, but in chunks to limit memory use.
+        _fact_ids = active_objects["_fact_ids"]
+        for i in range(0, len(_fact_ids), 1000):
+            for fact in db.facts_with_internal_ids(_fact_ids[i:i+1000]):
+                log_entry = LogEntry()
+                log_entry["type"] = EventTypes.ADDED_FACT
+                log_entry["o_id"] = fact.id
+                for fact_key, value in fact.data.items():
+                    log_entry[fact_key] = value
+                xml_file.write(xml_format.repr_log_entry(log_entry))
+                w.increase_progress(1)
+        _card_ids = active_objects["_card_ids"]
+        for i in range(0, len(_card_ids), 1000):
+            for card in db.cards_with_internal_ids(_card_ids[i:i+1000]):
+                log_entry = LogEntry()
+                log_entry["type"] = EventTypes.ADDED_CARD
+                log_entry["o_id"] = card.id
+                log_entry["card_t"] = card.card_type.id
+                log_entry["fact"] = card.fact.id
+                log_entry["fact_v"] = card.fact_view.id
+                log_entry["tags"] = ",".join([tag.id for tag in card.tags])
+                if used_for_merging_dbs:
+                    log_entry["c_time"] = card.creation_time
+                    log_entry["m_time"] = card.modification_time
+                    log_entry["gr"] = card.grade
+                    log_entry["e"] = card.easiness
+                    log_entry["ac_rp"] = card.acq_reps
+                    log_entry["rt_rp"] = card.ret_reps
+                    log_entry["lps"] = card.lapses
+                    log_entry["ac_rp_l"] = card.acq_reps_since_lapse
+                    log_entry["rt_rp_l"] = card.ret_reps_since_lapse
+                    log_entry["l_rp"] = card.last_rep
+                    log_entry["n_rp"] = card.next_rep
+                else:
+                    log_entry["gr"] = -1
+                    log_entry["e"] = 2.5
+                    log_entry["ac_rp"] = 0
+                    log_entry["rt_rp"] = 0
+                    log_entry["lps"] = 0
+                    log_entry["ac_rp_l"] = 0
+                    log_entry["rt_rp_l"] = 0
+                    log_entry["l_rp"] = -1
+                    log_entry["n_rp"] = -1
+                if card.extra_data:
+                    log_entry["extra"] = repr(card.extra_data)
+                xml_file.write(xml_format.repr_log_entry(log_entry))
+                w.increase_progress(1)
         xml_file.write(xml_format.log_entries_footer())
         xml_file.close()
         # Make archive (Zipfile requires a .zip extension).
@@ -86,16 +86,18 @@ class Tsv(FileFormat, MediaPreprocessor):
         # Now that we know all the data is well-formed, create the cards.
         tag_names = [tag_name.strip() for \
             tag_name in extra_tag_names.split(",") if tag_name.strip()]
+        new_cards = []
         for fact_data in facts_data:
             if len(list(fact_data.keys())) == 2:
                 card_type = self.card_type_with_id("1")
             else:
                 card_type = self.card_type_with_id("3")
             self.preprocess_media(fact_data, tag_names)
-            self.controller().create_new_cards(fact_data, card_type, grade=-1,
-                tag_names=tag_names, check_for_duplicates=False, save=False)
+            new_cards.append((fact_data, card_type, list(tag_names)))
             if _("MISSING_MEDIA") in tag_names:
                 tag_names.remove(_("MISSING_MEDIA"))
+        self.controller().create_new_cards_bulk(new_cards, grade=-1,
+            save=False)
         self.warned_about_missing_media = False
 
     def process_string_for_text_export(self, text):
@@ -114,13 +116,15 @@ class Tsv(FileFormat, MediaPreprocessor):
         w.set_progress_range(number_of_cards)
         w.set_progress_update_interval(number_of_cards/50)
         outfile = open(filename, "w", encoding="utf-8")
-        for _card_id, _fact_id in db.active_cards():
-            card = db.card(_card_id, is_id_internal=True)
-            q = self.process_string_for_text_export(\
-                card.question(render_chain="plain_text"))
-            a = self.process_string_for_text_export(\
-                card.answer(render_chain="plain_text"))
-            outfile.write("%s\t%s\n" % (q, a))
-            w.increase_progress(1)
+        # Fetch the cards in bulk, but in chunks to limit memory use.
+        _card_ids = [_card_id for _card_id, _fact_id in db.active_cards()]
+        for i in range(0, len(_card_ids), 1000):
+            for card in db.cards_with_internal_ids(_card_ids[i:i+1000]):
+                q = self.process_string_for_text_export(\
+                    card.question(render_chain="plain_text"))
+                a = self.process_string_for_text_export(\
+                    card.answer(render_chain="plain_text"))
+                outfile.write("%s\t%s\n" % (q, a))
+                w.increase_progress(1)
         w.close_progress()
 
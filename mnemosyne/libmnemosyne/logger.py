@@ -70,16 +70,39 @@ class Logger(Component):
     def added_card(self, card):
         pass
 
+    def added_cards(self, cards):
+        for card in cards:
+            self.added_card(card)
+
     def edited_card(self, card):
         pass
 
     def deleted_card(self, card):
         pass
 
+    def deleted_cards(self, cards):
+        for card in cards:
+            self.deleted_card(card)
+
     def repetition(self, card, scheduled_interval, actual_interval,
         thinking_time):
         pass
 
+    def repetitions(self, repetitions):
+
+        """'repetitions' is a list of (timestamp, card, scheduled_interval,
+        actual_interval, thinking_time) tuples.
+
+        """
+
+        previous_timestamp = self._timestamp
+        for timestamp, card, scheduled_interval, actual_interval, \
+            thinking_time in repetitions:
+            self.timestamp = timestamp
+            self.repetition(card, scheduled_interval, actual_interval,
+                thinking_time)
+        self.timestamp = previous_timestamp
+
     def added_tag(self, tag):
         pass
 
@@ -89,6 +112,10 @@ class Logger(Component):
     def deleted_tag(self, tag):
         pass
 
+    def deleted_tags(self, tags):
+        for tag in tags:
+            self.deleted_tag(tag)
+
     def added_media_file(self, filename):
         pass
 
@@ -101,12 +128,20 @@ class Logger(Component):
     def added_fact(self, fact):
         pass
 
+    def added_facts(self, facts):
+        for fact in facts:
+            self.added_fact(fact)
+
     def edited_fact(self, fact):
         pass
 
     def deleted_fact(self, fact):
         pass
 
+    def deleted_facts(self, facts):
+        for fact in facts:
+            self.deleted_fact(fact)
+
     def added_fact_view(self, fact_view):
         pass
 
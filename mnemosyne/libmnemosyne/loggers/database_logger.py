@@ -62,12 +62,20 @@ class DatabaseLogger(Logger):
     def added_card(self, card):
         self.database().log_added_card(self.timestamp, card.id)
 
+    def added_cards(self, cards):
+        self.database().log_added_cards(self.timestamp,
+            [card.id for card in cards])
+
     def edited_card(self, card):
         self.database().log_edited_card(self.timestamp, card.id)
 
     def deleted_card(self, card):
         self.database().log_deleted_card(self.timestamp, card.id)
 
+    def deleted_cards(self, cards):
+        self.database().log_deleted_cards(self.timestamp,
+            [card.id for card in cards])
+
     def repetition(self, card, scheduled_interval, actual_interval,
                    thinking_time):
         self.database().log_repetition(self.timestamp, card.id, card.grade,
@@ -76,6 +84,15 @@ class DatabaseLogger(Logger):
             scheduled_interval, actual_interval, thinking_time,
             card.next_rep, card.scheduler_data)
 
+    def repetitions(self, repetitions):
+        self.database().log_repetitions([(timestamp, card.id, card.grade,
+            card.easiness, card.acq_reps, card.ret_reps, card.lapses,
+            card.acq_reps_since_lapse, card.ret_reps_since_lapse,
+            scheduled_interval, actual_interval, thinking_time,
+            card.next_rep, card.scheduler_data) for (timestamp, card,
+            scheduled_interval, actual_interval, thinking_time) \
+            in repetitions])
+
     def added_tag(self, tag):
         self.database().log_added_tag(self.timestamp, tag.id)
 
@@ -85,6 +102,10 @@ class DatabaseLogger(Logger):
     def deleted_tag(self, tag):
         self.database().log_deleted_tag(self.timestamp, tag.id)
 
+    def deleted_tags(self, tags):
+        self.database().log_deleted_tags(self.timestamp,
+            [tag.id for tag in tags])
+
     def added_media_file(self, filename):
         self.database().log_added_media_file(self.timestamp, filename)
 
@@ -97,12 +118,20 @@ class DatabaseLogger(Logger):
     def added_fact(self, fact):
         self.database().log_added_fact(self.timestamp, fact.id)
 
+    def added_facts(self, facts):
+        self.database().log_added_facts(self.timestamp,
+            [fact.id for fact in facts])
+
     def edited_fact(self, fact):
         self.database().log_edited_fact(self.timestamp, fact.id)
 
     def deleted_fact(self, fact):
         self.database().log_deleted_fact(self.timestamp, fact.id)
 
+    def deleted_facts(self, facts):
+        self.database().log_deleted_facts(self.timestamp,
+            [fact.id for fact in facts])
+
     def added_fact_view(self, fact_view):
         self.database().log_added_fact_view(self.timestamp, fact_view.id)
 
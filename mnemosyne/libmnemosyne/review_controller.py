@@ -66,6 +66,16 @@ class ReviewController(Component):
 
         raise NotImplementedError
 
+    def grade_answers(self, batch):
+
+        """Grade a batch of (card, grade, timestamp, thinking_time)
+        repetitions which happened elsewhere, e.g. in a client which reviewed
+        offline, and continue reviewing from there.
+
+        """
+
+        raise NotImplementedError
+
     def counters(self):
 
         """Returns tuple (scheduled_count, non_memorised_count, active_count)."""
@@ -163,6 +163,19 @@ _("You have finished your scheduled reviews. Now, learn as many failed or new ca
             self.main_widget().set_status_bar_message(_("Returns in") + \
                 " " + str(days) + _(" day(s)."))
 
+    def grade_answers(self, batch):
+        self.flush_sync_server()
+        if not batch:
+            return
+        self.scheduler().grade_answers(batch)
+        n = self.config()["save_after_n_reps"]
+        if (self.rep_count + len(batch)) // n != self.rep_count // n:
+            self.database().save()
+        self.rep_count += len(batch)
+        # The queue and the counters only get updated once for the entire
+        # batch.
+        self.reset_but_try_to_keep_current_card()
+
     def next_rep_string(self, days):
         if days == 0:
             return '\n' + _("Next repetition: today.")
@@ -96,9 +96,35 @@ class Scheduler(Component):
 
         raise NotImplementedError
 
-    def grade_answer(self, card, new_grade, dry_run=False):
+    def grade_answer(self, card, new_grade, dry_run=False, timestamp=None,
+                     thinking_time=None):
+
+        """'timestamp' and 'thinking_time' default to the current time and
+        the time on the stopwatch.
+
+        """
+
         raise NotImplementedError
 
+    def grade_answers(self, batch):
+
+        """Grade a batch of repetitions which happened elsewhere, e.g. in a
+        mobile or web client which reviewed offline. 'batch' is a list of
+        (card, grade, timestamp, thinking_time) tuples. The result should be
+        the same as calling 'grade_answer' and updating the card for each of
+        them in turn, but the cards and log entries can be written in bulk.
+        Returns the list of scheduled intervals.
+
+        """
+
+        db = self.database()
+        intervals = []
+        for card, new_grade, timestamp, thinking_time in batch:
+            intervals.append(self.grade_answer(card, new_grade,
+                timestamp=timestamp, thinking_time=thinking_time))
+            db.update_card(card, repetition_only=True)
+        return intervals
+
     def scheduled_count(self):
         raise NotImplementedError
 
@@ -118,6 +144,17 @@ class Scheduler(Component):
 
         raise NotImplementedError
 
+    def card_counts_scheduled_n_days_from_now(self, start, stop):
+
+        """Return a list with 'card_count_scheduled_n_days_from_now(n)' for
+        n in range('start', 'stop'). Schedulers can override this to
+        calculate all the days at once.
+
+        """
+
+        return [self.card_count_scheduled_n_days_from_now(n) \
+            for n in range(start, stop)]
+
     def next_rep_to_interval_string(self, next_rep, now=None):
 
         """Converts next_rep to a string like 'tomorrow', 'in 2 weeks', ...
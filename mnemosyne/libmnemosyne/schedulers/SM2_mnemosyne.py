@@ -35,6 +35,13 @@ class SM2Mnemosyne(Scheduler):
     name = "SM2 Mnemosyne"
     _warned_about_too_many_cards = False
 
+    # With the 'background_queue_rebuild' option set, we start reading the
+    # data for the next queue once fewer cards than this are left.
+    queue_low_water_mark = 10
+
+    # While grading a batch, the log entries are collected here.
+    _repetitions_to_log = None
+
     def true_scheduled_interval(self, card):
 
         """Since 'next_rep' is always midnight UTC for retention reps, we need
@@ -148,17 +155,43 @@ class SM2Mnemosyne(Scheduler):
 
         """
 
-        while self.database().sister_card_count_scheduled_between\
-            (card, card.next_rep, card.next_rep + DAY):
+        next_reps = self.database().sister_card_next_reps(card)
+        while any(card.next_rep <= next_rep < card.next_rep + DAY \
+            for next_rep in next_reps):
             card.next_rep += DAY
 
+    def _rebuilds_queue_in_background(self):
+        return self.config()["background_queue_rebuild"] and \
+            not self.config()["randomise_scheduled_cards"] and \
+            not self.config()["randomise_new_cards"]
+
     def rebuild_queue(self, learn_ahead=False):
         db = self.database()
-        if not db.is_loaded() or not db.active_count():
+        if not db.is_loaded():
+            return
+        # Use the data read in the background while reviewing the previous
+        # queue if it's still usable, and the cards constructed from it.
+        snapshot = None
+        if self._rebuilds_queue_in_background():
+            snapshot = db.queue_snapshot(self.adjusted_now(),
+                self._today_start_and_end_timestamp()[0])
+        if snapshot is None:
+            self._rebuild_queue(db, learn_ahead)
+        else:
+            self._rebuild_queue(snapshot, learn_ahead)
+            db.hand_over_cards(snapshot, self._card_ids_in_queue)
+
+    def _rebuild_queue(self, queries, learn_ahead):
+
+        """'queries' is either the database or a 'QueueSnapshot' of it."""
+
+        db = self.database()
+        if not queries.active_count():
             return
         self._card_ids_in_queue = []
         self._fact_ids_in_queue = []
-        self._warned_about_too_many_cards = self._already_warned_today()
+        self._warned_about_too_many_cards = \
+            self._already_warned_today(queries)
 
         # Stage 1
         #
@@ -178,7 +211,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
                 sort_key = "random"
             else:
                 sort_key = "interval"
-            for _card_id, _fact_id in db.cards_due_for_ret_rep(\
+            for _card_id, _fact_id in queries.cards_due_for_ret_rep(\
                 self.adjusted_now(), sort_key=sort_key, limit=50):
                 self._card_ids_in_queue.append(_card_id)
                 self._fact_ids_in_queue.append(_fact_id)
@@ -194,7 +227,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         limit = self.config()["non_memorised_cards_in_hand"]
         non_memorised_in_queue = 0
         if self.stage == 2:
-            for _card_id, _fact_id in db.cards_to_relearn(grade=1,
+            for _card_id, _fact_id in queries.cards_to_relearn(grade=1,
                 sort_key="-interval"):
                 if _fact_id not in self._fact_ids_in_queue:
                     if non_memorised_in_queue < limit:
@@ -203,7 +236,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
                         non_memorised_in_queue += 1
                     if non_memorised_in_queue == limit:
                         break
-            for _card_id, _fact_id in db.cards_to_relearn(grade=0,
+            for _card_id, _fact_id in queries.cards_to_relearn(grade=0,
                 sort_key="-interval"):
                 if _fact_id not in self._fact_ids_in_queue:
                     if non_memorised_in_queue < limit:
@@ -229,7 +262,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         # Use <= in the stage check, such that earlier stages can use
         # cards from this stage to increase the hand.
         if self.stage <= 3:
-            for _card_id, _fact_id in db.cards_new_memorising(grade=1):
+            for _card_id, _fact_id in queries.cards_new_memorising(grade=1):
                 if _fact_id not in self._fact_ids_in_queue:
                     if non_memorised_in_queue < limit:
                         self._card_ids_in_queue.append(_card_id)
@@ -237,7 +270,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
                         non_memorised_in_queue += 1
                     if non_memorised_in_queue == limit:
                         break
-            for _card_id, _fact_id in db.cards_new_memorising(grade=0):
+            for _card_id, _fact_id in queries.cards_new_memorising(grade=0):
                 if _fact_id not in self._fact_ids_in_queue:
                     if non_memorised_in_queue < limit:
                         self._card_ids_in_queue.append(_card_id)
@@ -267,7 +300,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
                 sort_key = ""
             # Preferentially keep away from sister cards for as long as
             # possible.
-            for _card_id, _fact_id in db.cards_unseen(\
+            for _card_id, _fact_id in queries.cards_unseen(\
                     sort_key=sort_key, limit=min(limit, 50)):
                 if _fact_id not in self._fact_ids_in_queue \
                     and _fact_id not in self._fact_ids_memorised:
@@ -282,7 +315,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
                         return
             # If our hand is not full enough, start pulling in sister cards.
             if non_memorised_in_queue < limit:
-                for _card_id, _fact_id in db.cards_unseen(\
+                for _card_id, _fact_id in queries.cards_unseen(\
                         sort_key=sort_key, limit=min(limit, 50)):
                     if _fact_id not in self._fact_ids_in_queue:
                         self._card_ids_in_queue.append(_card_id)
@@ -312,8 +345,8 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
             else:
                 self.stage = 3
             return
-        for _card_id, _fact_id in db.cards_learn_ahead(self.adjusted_now(),
-            sort_key="next_rep", limit=50):
+        for _card_id, _fact_id in queries.cards_learn_ahead(\
+            self.adjusted_now(), sort_key="next_rep", limit=50):
             self._card_ids_in_queue.append(_card_id)
         # Relearn cards which we got wrong during learn ahead.
         self.stage = 2
@@ -349,6 +382,11 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
                         return db.card(_card_id, is_id_internal=True)
                 _card_id = self._card_ids_in_queue.pop(0)
         self._card_id_last = _card_id
+        if len(self._card_ids_in_queue) < self.queue_low_water_mark and \
+            self._rebuilds_queue_in_background():
+            start_of_day, end_of_day = self._today_start_and_end_timestamp()
+            db.start_queue_snapshot(self.adjusted_now(), start_of_day,
+                end_of_day)
         return db.card(_card_id, is_id_internal=True)
 
     def is_prefetch_allowed(self, card_to_grade):
@@ -374,7 +412,8 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
 
         return 1.0
 
-    def grade_answer(self, card, new_grade, dry_run=False):
+    def grade_answer(self, card, new_grade, dry_run=False, timestamp=None,
+                     thinking_time=None):
         # The dry run mode is typically used to determine the intervals
         # for the different grades, so we don't want any side effects
         # from hooks running then.
@@ -386,12 +425,23 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         if dry_run:
             import copy
             card = copy.copy(card)
+        # Normally, the card was shown when the stopwatch got started and is
+        # graded now, but 'timestamp' and 'thinking_time' allow grading a
+        # repetition which happened earlier, e.g. in a client which was
+        # offline.
+        if thinking_time is None:
+            thinking_time = self.stopwatch().time()
+        if timestamp is None:
+            timestamp = time.time()
+            start_time = self.stopwatch().start_time
+        else:
+            start_time = timestamp - thinking_time
         # Determine whether we learned on time or not (only relevant for
         # grades 2 or higher).
-        if self.adjusted_now() - DAY >= card.next_rep: # Already due yesterday.
-            timing = "LATE"
+        if self.adjusted_now(timestamp) - DAY >= card.next_rep:
+            timing = "LATE" # Already due yesterday.
         else:
-            if self.adjusted_now() < card.next_rep: # Not due today.
+            if self.adjusted_now(timestamp) < card.next_rep: # Not due today.
                 timing = "EARLY"
             else:
                 timing = "ON TIME"
@@ -405,7 +455,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         if card.grade == -1: # Unseen card.
             actual_interval = 0
         else:
-            actual_interval = int(self.stopwatch().start_time) - card.last_rep
+            actual_interval = int(start_time) - card.last_rep
         if card.grade == -1:
             # The card has not yet been given its initial grade.
             card.easiness = 2.5
@@ -499,7 +549,7 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         # Update card properties. 'last_rep' is the time the card was graded,
         # not when it was shown.
         card.grade = new_grade
-        card.last_rep = int(time.time())
+        card.last_rep = int(timestamp)
         if new_grade >= 2:
             card.next_rep = self.midnight_UTC(card.last_rep + new_interval)
             self.avoid_sister_cards(card)
@@ -513,10 +563,46 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         for f in self.component_manager.all("hook", "after_repetition"):
             f.run(card)
         # Create log entry.
-        self.log().repetition(card, scheduled_interval, actual_interval,
-            thinking_time=self.stopwatch().time())
+        repetition = (timestamp, card, scheduled_interval, actual_interval,
+            thinking_time)
+        if self._repetitions_to_log is not None:
+            self._repetitions_to_log.append(repetition)
+        else:
+            self.log().repetitions([repetition])
         return new_interval
 
+    def grade_answers(self, batch):
+        _fact_ids = set()
+        card_for__card_id = {}
+        cards = []
+        intervals = []
+        self._repetitions_to_log = []
+        try:
+            for card, new_grade, timestamp, thinking_time in batch:
+                # A card which is graded several times needs to continue from
+                # the state of its previous repetition.
+                card = card_for__card_id.setdefault(card._id, card)
+                # Sister cards are kept away from each other's next
+                # repetition, so if a sister card (or the card itself) was
+                # graded earlier in the batch, that needs to be written first.
+                if card.fact._id in _fact_ids:
+                    self._write_graded_cards(cards)
+                    _fact_ids.clear()
+                intervals.append(self.grade_answer(card, new_grade,
+                    timestamp=timestamp, thinking_time=thinking_time))
+                cards.append(card)
+                _fact_ids.add(card.fact._id)
+        finally:
+            self._write_graded_cards(cards)
+            self._repetitions_to_log = None
+        return intervals
+
+    def _write_graded_cards(self, cards):
+        self.database().update_cards(cards, repetition_only=True)
+        self.log().repetitions(self._repetitions_to_log)
+        cards[:] = []
+        self._repetitions_to_log = []
+
     def scheduled_count(self):
         return self.database().scheduled_count(self.adjusted_now())
 
@@ -541,6 +627,19 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         else:
             return self.database().card_count_scheduled_n_days_ago(-n)
 
+    def card_counts_scheduled_n_days_from_now(self, start, stop):
+        db = self.database()
+        # The past, n <= 0.
+        counts = db.card_counts_scheduled_n_days_ago(1 - min(stop, 1),
+            1 - start)
+        counts.reverse()
+        # The future, n > 0.
+        start = max(start, 1)
+        if stop > start:
+            counts += db.card_counts_scheduled_per_day(\
+                self.adjusted_now() + (start - 1) * DAY, stop - start)
+        return counts
+
     def _fact_ids_learned_today(self):
         """It loads the learned _fact_ids back from the logs in order not
         to forget the learned cards when the app is closed and re-opened.
@@ -578,13 +677,13 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
         start_of_day += self.config()["day_starts_at"] * HOUR
         return start_of_day, start_of_day + DAY
 
-    def _already_warned_today(self):
+    def _already_warned_today(self, queries=None):
         """From the current session or from the database it checks if
         there was a warning about learning too many cards or not.
 
         If it is already set in the current session, return with that,
         otherwise query the database (log table) for the warn event for
-        today.
+        today, or a snapshot of it.
 
         """
 
@@ -593,4 +692,6 @@ _("You appear to have missed some reviews. Don't worry too much about this backl
 
         start_of_day, end_of_day = self._today_start_and_end_timestamp()
 
-        return self.database().has_already_warned_today(start_of_day, end_of_day)
+        if queries is None:
+            queries = self.database()
+        return queries.has_already_warned_today(start_of_day, end_of_day)
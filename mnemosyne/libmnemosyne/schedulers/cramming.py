@@ -29,6 +29,10 @@ class Cramming(SM2Mnemosyne):
         SM2Mnemosyne.reset(self, new_only)
         self.stage = 1
 
+    def _rebuilds_queue_in_background(self):
+        # Our queries are not part of a 'QueueSnapshot'.
+        return False
+
     def rebuild_queue(self, learn_ahead=False):
         db = self.database()
         if not db.is_loaded() or not db.active_count():
@@ -73,7 +77,8 @@ class Cramming(SM2Mnemosyne):
         self.stage = 1
         self.rebuild_queue()
 
-    def grade_answer(self, card, new_grade, dry_run=False):
+    def grade_answer(self, card, new_grade, dry_run=False, timestamp=None,
+                     thinking_time=None):
         # The dry run mode is typically used to determine the intervals
         # for the different grades, so we don't want any side effects
         # from hooks running then.
@@ -0,0 +1,23 @@
+#
+# upgrade3.py <Peter.Bienstman@gmail.com>
+#
+
+from mnemosyne.libmnemosyne.component import Component
+
+
+class Upgrade3(Component):
+
+    """Upgrade to SQL format 5, adding the indices used by the scheduler
+    queries.
+
+    """
+
+    def run(self):
+        self.database().con.executescript("""
+            create index if not exists i_cards_4 on cards (grade, lapses)
+                where active=1;
+            create index if not exists i_cards_5 on cards
+                (next_rep, ret_reps_since_lapse, _fact_id)
+                where active=1 and grade>=2;
+        """)
+        self.database().save()
\ No newline at end of file
@@ -0,0 +1,42 @@
+#
+# upgrade4.py <Peter.Bienstman@gmail.com>
+#
+
+from mnemosyne.libmnemosyne.component import Component
+
+
+class Upgrade4(Component):
+
+    """Upgrade to SQL format 6, adding the hashes of the fact data used to
+    look for duplicates.
+
+    """
+
+    def run(self, chunk_size=10000):
+        db = self.database()
+        db.con.executescript("""
+            create table if not exists data_hashes_for_fact(
+                _fact_id integer,
+                key text,
+                hash integer
+            );
+            create index if not exists i_data_hashes_for_fact on
+                data_hashes_for_fact (hash);
+            create index if not exists i_data_hashes_for_fact_2 on
+                data_hashes_for_fact (_fact_id);
+            delete from data_hashes_for_fact;
+        """)
+        # Work in chunks, to keep the memory use bounded for large databases.
+        last_rowid = 0
+        while True:
+            rows = db.con.execute("""select rowid, _fact_id, key, value from
+                data_for_fact where rowid>? order by rowid limit ?""",
+                (last_rowid, chunk_size)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            db.con.executemany("""insert into data_hashes_for_fact(_fact_id,
+                key, hash) values(?,?,?)""", ((_fact_id, key,
+                db._data_hash(key, value)) for rowid, _fact_id, key, value \
+                in rows if value))
+        db.save()
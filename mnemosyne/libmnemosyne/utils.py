@@ -5,6 +5,9 @@
 
 import os
 import re
+import ast
+import json
+import base64
 import sys
 import stat
 import html
@@ -273,6 +276,98 @@ def rand_uuid():
 
 
 
+# Codec for the small Python data structures (like extra_data or the lists of
+# fact keys of a card type) which we store as text in the database.
+#
+# Version 1 is JSON, with tuples, sets, bytes and dictionaries with
+# non-string keys wrapped in a single key dictionary tagging their type, so
+# that they survive the round trip.
+#
+# Version 0 is the legacy repr() format, which we can still read, but using
+# 'ast.literal_eval' instead of 'eval', as this data can also come from a
+# sync partner.
+
+DATA_CODEC_VERSION = 1
+
+def _tag_data(obj):
+    if obj is None or isinstance(obj, (str, bool, int, float)):
+        return obj
+    if isinstance(obj, list):
+        return [_tag_data(x) for x in obj]
+    if isinstance(obj, dict):
+        if all(isinstance(key, str) for key in obj):
+            return {key: _tag_data(value) for key, value in obj.items()}
+        return {"__items__": [[_tag_data(key), _tag_data(value)] \
+            for key, value in obj.items()]}
+    if isinstance(obj, tuple):
+        return {"__tuple__": [_tag_data(x) for x in obj]}
+    if isinstance(obj, (set, frozenset)):
+        # Sort to get the same string for the same set each time.
+        return {"__set__": [_tag_data(x) for x in sorted(obj, key=repr)]}
+    if isinstance(obj, bytes):
+        return {"__bytes__": base64.b64encode(obj).decode("ascii")}
+    raise TypeError("Cannot encode object of type " + type(obj).__name__)
+
+
+def _untag_data(dictionary):
+    if len(dictionary) == 1:
+        key, value = next(iter(dictionary.items()))
+        if key == "__tuple__":
+            return tuple(value)
+        if key == "__set__":
+            return set(value)
+        if key == "__items__":
+            return dict((item_key, item_value) \
+                for item_key, item_value in value)
+        if key == "__bytes__":
+            return base64.b64decode(value)
+    return dictionary
+
+
+class _Python2Sets(ast.NodeTransformer):
+
+    """Python 2 wrote sets as 'set([...])', which 'literal_eval' does not
+    accept.
+
+    """
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id == "set" \
+            and not node.keywords and len(node.args) <= 1:
+            if not node.args:
+                return ast.Set(elts=[])
+            if isinstance(node.args[0], (ast.List, ast.Tuple, ast.Set)):
+                return ast.Set(elts=node.args[0].elts)
+        return node
+
+
+def encode_data(obj):
+    return json.dumps(_tag_data(obj), ensure_ascii=False,
+        separators=(",", ":"))
+
+
+def decode_data_with_version(text):
+
+    """Returns a tuple of the decoded data and the version of the codec
+    which was used to encode it.
+
+    """
+
+    try:
+        return json.loads(text, object_hook=_untag_data), DATA_CODEC_VERSION
+    except ValueError:
+        # Note that everything repr() could write that is also valid JSON
+        # decodes to the same object.
+        return ast.literal_eval(\
+            _Python2Sets().visit(ast.parse(text.strip(), mode="eval"))), 0
+
+
+def decode_data(text):
+    return decode_data_with_version(text)[0]
+
+
+
 class CompareOnId(object):
 
     """When pulling the same object twice from an SQL database, the resulting
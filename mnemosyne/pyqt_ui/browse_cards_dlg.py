@@ -11,6 +11,7 @@ from PyQt6 import QtCore, QtGui, QtSql, QtWidgets
 from mnemosyne.libmnemosyne.tag import Tag
 from mnemosyne.libmnemosyne.fact import Fact
 from mnemosyne.libmnemosyne.card import Card
+from mnemosyne.libmnemosyne.utils import decode_data
 from mnemosyne.libmnemosyne.gui_translator import _
 from mnemosyne.pyqt_ui.qwebengineview2 import QWebEngineView2
 from mnemosyne.libmnemosyne.component import Component
@@ -213,7 +214,7 @@ class QA_Delegate(QtWidgets.QStyledItemDelegate, Component):
                 if extra_data == "":
                     card.extra_data = {}
                 else:
-                    card.extra_data = eval(extra_data)
+                    card.extra_data = decode_data(extra_data)
                 break
 
         # Let's not add tags to speed things up, they don't affect the card
@@ -508,10 +509,7 @@ class BrowseCardsDlg(QtWidgets.QDialog, BrowseCardsDialog,
                 index.row(), _FACT_ID, index.parent())
             _fact_id = index.model().data(_fact_id_index)
             _fact_ids.add(_fact_id)
-        facts = []
-        for _fact_id in _fact_ids:
-            facts.append(self.database().fact(_fact_id, is_id_internal=True))
-        return facts
+        return self.database().facts_with_internal_ids(_fact_ids)
 
     def _card_ids_from_selection(self):
         _card_ids = set()
@@ -739,7 +737,14 @@ class BrowseCardsDlg(QtWidgets.QDialog, BrowseCardsDialog,
         self.display_card_table()
 
     def load_qt_database(self):        
-        self.database().release_connection()
+        # The card list shows the pregenerated question and answer.
+        self.database().regenerate_pregenerated_data()
+        if self.database().allows_concurrent_reads():
+            # No need to give up our connection, just make sure the Qt
+            # connection sees all our changes.
+            self.database().save()
+        else:
+            self.database().release_connection()
         qt_db = QtSql.QSqlDatabase.addDatabase("QSQLITE")
         qt_db.setDatabaseName(self.database().path())
         if not qt_db.open():
@@ -882,14 +887,17 @@ class BrowseCardsDlg(QtWidgets.QDialog, BrowseCardsDialog,
                     ",".join(all__card_ids - active__card_ids) + ")"
             else:
                 filter += "_id in (" + ",".join(active__card_ids) + ")"
-        # Search string.
-        search_string = self.search_box.text().replace("'", "''")
-        self.card_model.search_string = search_string
+        # Search string. Use the full-text index of the database, instead of
+        # having the Qt model scan all the cards.
+        search_string = self.search_box.text()
+        self.card_model.search_string = search_string.replace("'", "''")
         if search_string:
             if filter:
                 filter += " and "
-            filter += "(question like '%%%s%%' or answer like '%%%s%%')" \
-                % (search_string, search_string)
+            _card_ids = self.database().search_cards(search_string)
+            if not self.database().allows_concurrent_reads():
+                self.database().release_connection()
+            filter += "_id in (" + ",".join(map(str, _card_ids)) + ")"
         self.card_model.setFilter(filter)
         self.card_model.select()
         self.update_card_counters()
@@ -4,6 +4,7 @@
 
 import os
 import cgi
+import json
 import time
 import urllib
 import http.client
@@ -202,6 +203,11 @@ class WebServer(Component):
             response_headers = [("Content-type", "text/plain")]
             start_response("200 OK", response_headers)
             return [str(active_count).encode(encoding='UTF-8')]
+        elif filename == "/api/statement_statistics":
+            statistics = self.mnemosyne.database().statement_statistics()
+            response_headers = [("Content-type", "application/json")]
+            start_response("200 OK", response_headers)
+            return [json.dumps(statistics).encode(encoding='UTF-8')]
         elif filename == "/release_database":
             self.unload_mnemosyne()
             response_headers = [("Content-type", "text/html")]
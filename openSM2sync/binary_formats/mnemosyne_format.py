@@ -6,7 +6,6 @@ import os
 import sqlite3
 import tempfile
 
-from openSM2sync.log_entry import EventTypes
 from mnemosyne.libmnemosyne.utils import copy
 
 
@@ -20,19 +19,16 @@ class MnemosyneFormat(object):
             database_version == self.database.version
 
     def binary_filename(self, store_pregenerated_data, interested_in_old_reps):
+        if store_pregenerated_data:
+            self.database.regenerate_pregenerated_data()
         self.database.release_connection()
         # Copy the database to a temporary file.
         self.tmp_name = os.path.join(os.path.dirname(self.database._path),
             "__FORSTREAMING__.db")
         copy(self.database._path, self.tmp_name)
-        # Delete old reps if needed.
-        if not interested_in_old_reps:
-            con = sqlite3.connect(self.tmp_name)
-            con.execute("delete from log where event_type=?",
-                (EventTypes.REPETITION, ))
-            con.commit()
-            con.execute("vacuum")
-            con.close()
+        # Give the copy a log in the standard layout, leaving out the old reps
+        # if needed.
+        self.database.copy_log_into(self.tmp_name, interested_in_old_reps)
         # Delete pregerated data if needed.
         if not store_pregenerated_data:
             con = sqlite3.connect(self.tmp_name)
@@ -196,7 +196,13 @@ class Client(Partner):
                 self.ui.show_error(\
                     "Sync failed, the next sync will be a full sync.")
                 if backup_file:
-                    self.database.restore(backup_file)
+                    try:
+                        self.database.restore(backup_file)
+                    except Exception:
+                        # E.g. a damaged backup, in which case the current
+                        # database is left untouched.
+                        self.ui.show_error("Could not restore from backup:\n"\
+                            + traceback_string())
         finally:
 
             # TMP: preparation for future fix
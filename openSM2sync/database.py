@@ -131,6 +131,13 @@ class Database(object):
         raise NotImplementedError
 
     def backup(self):
+
+        """Returns the name of the backup, to be passed to 'restore'. This
+        does not need to be a copy of the database file, e.g. for incremental
+        backups.
+
+        """
+
         raise NotImplementedError
 
     def restore(self, path):
@@ -218,3 +225,14 @@ class Database(object):
 
     def skip_science_log(self):
         pass
+
+    # Diagnostics. Optional as well.
+
+    def statement_statistics(self):
+
+        """Returns a JSON-serialisable dictionary with timing information on
+        the database statements, or None if not available.
+
+        """
+
+        return None
@@ -5,6 +5,7 @@
 
 import os
 import sys
+import json
 import time
 import types
 import select
@@ -663,6 +664,20 @@ class Server(Partner):
         except:
             return self.handle_error(session, traceback_string())
 
+    def get_server_statement_statistics(self, environ, session_token):
+
+        """Diagnostics on the server database in JSON format, or 'null' if
+        not available.
+
+        """
+
+        try:
+            session = self.sessions[session_token]
+            return json.dumps(\
+                session.database.statement_statistics()).encode("utf-8")
+        except:
+            return self.handle_error(session, traceback_string())
+
     def get_sync_cancel(self, environ, session_token):
         try:
             self.ui.set_progress_text("Sync cancelled!")
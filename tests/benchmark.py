@@ -10,6 +10,9 @@ from mnemosyne.libmnemosyne import Mnemosyne
 
 number_of_calls = 15 # Number of calls to display in profile
 number_of_facts = 6000
+# Each test is run for each of these database drivers.
+database_drivers = ["sqlite3", "apsw"]
+database_driver = None
 
 mnemosyne = None
 
@@ -34,6 +37,8 @@ def startup():
         automatic_upgrades=False)
     #mnemosyne.initialise(data_dir="\SDMMC\.mnemosyne",
     #automatic_upgrades=False)
+    mnemosyne.config()["database_driver"] = database_driver
+    mnemosyne.database().release_connection()
 
     mnemosyne.start_review()
 
@@ -146,12 +151,19 @@ tests = ["startup()", "create_database()", "queue()", "new_question()", "display
 #tests = ["startup()", "finalise()"]
 #tests = ["test_setup()", "test_run()"]
 
-for test in tests:
-    cProfile.run(test, "mnemosyne_profile." + test.replace("()", ""))
-    print()
-    print(("*** ", test, " ***"))
-    print()
-    p = pstats.Stats('mnemosyne_profile.' + test.replace("()", ""))
-    p.strip_dirs().sort_stats('cumulative').print_stats(number_of_calls)
+for database_driver in database_drivers:
+    for test in tests:
+        profile = "mnemosyne_profile." + database_driver + "." + \
+            test.replace("()", "")
+        cProfile.run(test, profile)
+        print()
+        print(("*** ", database_driver, test, " ***"))
+        if test == "startup()":
+            print(("connection:",
+                type(mnemosyne.database().con).__name__))
+        print()
+        p = pstats.Stats(profile)
+        p.strip_dirs().sort_stats('cumulative').print_stats(number_of_calls)
+    finalise()
 
 # 5.2 0.92
\ No newline at end of file
@@ -0,0 +1,641 @@
+#!/usr/bin/env python
+
+import os
+import time
+import shutil
+import sqlite3
+import threading
+
+from mnemosyne.libmnemosyne import Mnemosyne
+
+number_of_facts = 5000  # Front-to-back and back-to-front: 10000 cards.
+
+mnemosyne = None
+
+def startup():
+
+    global mnemosyne
+
+    shutil.rmtree("dot_benchmark_database", ignore_errors=True)
+    mnemosyne = Mnemosyne(upload_science_logs=False,
+        interested_in_old_reps=True)
+    mnemosyne.components.insert(0,
+        ("mnemosyne.libmnemosyne.gui_translators.no_gui_translator",
+         "NoGuiTranslator"))
+    mnemosyne.components.append(
+        ("mnemosyne.libmnemosyne.ui_components.main_widget",
+         "MainWidget"))
+    mnemosyne.gui_for_component["ScheduledForgottenNew"] = \
+        [("mnemosyne_test", "TestReviewWidget")]
+    mnemosyne.initialise(data_dir=os.path.abspath("dot_benchmark_database"),
+        automatic_upgrades=False)
+
+def create_database():
+    card_type = mnemosyne.card_type_with_id("2")
+    for i in range(number_of_facts):
+        fact_data = {"f": "question" + str(i),
+                     "b": "answer" + str(i)}
+        mnemosyne.controller().create_new_cards(\
+            fact_data, card_type, grade=-1, tag_names=["default"],
+            check_for_duplicates=False, save=False)
+    mnemosyne.database().save()
+
+def count_queries(function):
+
+    """Returns the number of statements executed by 'function', together
+    with the elapsed time. Note that 'executemany' counts once per row.
+
+    """
+
+    statements = []
+    connection = mnemosyne.database().con.connection
+    connection.set_trace_callback(statements.append)
+    start = time.time()
+    try:
+        function()
+    finally:
+        connection.set_trace_callback(None)
+    return len(statements), time.time() - start
+
+def set_object_cache_size(size):
+    mnemosyne.config()["object_cache_size"] = size
+    mnemosyne.database().reset_object_caches()
+
+def hydrate_one_by_one():
+    set_object_cache_size(0)
+    db = mnemosyne.database()
+    _card_ids = [cursor[0] for cursor in \
+        db.con.execute("select _id from cards")]
+    for _card_id in _card_ids:
+        db.card(_card_id, is_id_internal=True)
+
+def hydrate_in_bulk():
+    set_object_cache_size(0)
+    db = mnemosyne.database()
+    _card_ids = [cursor[0] for cursor in \
+        db.con.execute("select _id from cards")]
+    db.cards_with_internal_ids(_card_ids)
+
+def repeated_lookups():
+    set_object_cache_size(1000)
+    db = mnemosyne.database()
+    _card_ids = [cursor[0] for cursor in \
+        db.con.execute("select _id from cards limit 1000")]
+    for i in range(10):
+        for _card_id in _card_ids:
+            db.card(_card_id, is_id_internal=True)
+    print(db.object_cache_statistics())
+
+def add_cards_one_by_one():
+    card_type = mnemosyne.card_type_with_id("2")
+    for i in range(1000):
+        fact_data = {"f": "serial question" + str(i),
+                     "b": "serial answer" + str(i)}
+        mnemosyne.controller().create_new_cards(fact_data, card_type,
+            grade=-1, tag_names=["serial"], check_for_duplicates=False,
+            save=False)
+    mnemosyne.database().save()
+
+def add_cards_in_bulk():
+    card_type = mnemosyne.card_type_with_id("2")
+    new_cards = [({"f": "bulk question" + str(i),
+                   "b": "bulk answer" + str(i)}, card_type, ["bulk"])
+                 for i in range(1000)]
+    mnemosyne.controller().create_new_cards_bulk(new_cards, grade=-1)
+
+def rename_tag():
+    db = mnemosyne.database()
+    tag = db.get_or_create_tag_with_name("default")
+    tag.name = "renamed"
+    db.update_tag(tag)
+    db.save()
+
+def tag_few_cards():
+    db = mnemosyne.database()
+    tag = db.get_or_create_tag_with_name("few")
+    _card_ids = [cursor[0] for cursor in \
+        db.con.execute("select _id from cards limit 10")]
+    db.add_tag_to_cards_with_internal_ids(tag, _card_ids)
+    db.save()
+
+def search_cards_like():
+    db = mnemosyne.database()
+    for query in ["4321", "swer99", "nothing"]:
+        db.con.execute("""select _id from cards where question like ? or
+            answer like ?""", ("%" + query + "%", ) * 2).fetchall()
+
+def search_cards_index():
+    db = mnemosyne.database()
+    for query in ["4321", "swer99", "nothing"]:
+        db.search_cards(query)
+
+def delete_facts_bulk():
+    db = mnemosyne.database()
+    _fact_ids = [cursor[0] for cursor in \
+        db.con.execute("select _id from facts limit 1000")]
+    mnemosyne.controller().delete_facts_and_their_cards(\
+        db.facts_with_internal_ids(_fact_ids), progress_bar=False)
+
+def tag_all_duplicates():
+    mnemosyne.database().tag_all_duplicates()
+
+def hydrate_extra_data():
+
+    """Hydrate cards with extra data, like cloze cards have, stored in the
+    legacy repr() format and after migration to the current codec.
+
+    """
+
+    from mnemosyne.libmnemosyne.utils import encode_data, decode_data
+    set_object_cache_size(0)
+    db = mnemosyne.database()
+    extra_data = {"cloze": "question <b>[answer]</b>", "index": 1}
+    text = repr(extra_data)
+    start = time.time()
+    for i in range(card_count):
+        eval(text)
+    print(("eval (s):", round(time.time() - start, 3)))
+    for text in [repr(extra_data), encode_data(extra_data)]:
+        start = time.time()
+        for i in range(card_count):
+            decode_data(text)
+        print(("decode_data", text, "(s):", round(time.time() - start, 3)))
+    db.con.execute("update cards set extra_data=?", (repr(extra_data), ))
+    _card_ids = [cursor[0] for cursor in \
+        db.con.execute("select _id from cards")]
+    for label in ["legacy", "migrated"]:
+        start = time.time()
+        db.cards_with_internal_ids(_card_ids)
+        print(("hydrate", label, "(s):", round(time.time() - start, 3)))
+        db.save()  # Migrates.
+
+def backup_in_background():
+    db = mnemosyne.database()
+    start = time.time()
+    db.backup()
+    print(("blocking backup (s):", round(time.time() - start, 3)))
+    start = time.time()
+    db.backup(background=True)
+    print(("starting background backup (s):", round(time.time() - start, 3)))
+    db.wait_for_backup()
+    print(db.backup_statistics())
+
+def incremental_backups():
+
+    """Daily backups with a couple of reviews in between, as full copies and
+    in the chunk store.
+
+    """
+
+    db = mnemosyne.database()
+    for incremental in [False, True]:
+        mnemosyne.config()["incremental_backups"] = incremental
+        written = 0
+        start = time.time()
+        for day in range(3):
+            db.con.execute("""update cards set grade=4 where _id in (select
+                _id from cards order by random() limit 100)""")
+            backupfile = db.backup()
+            if incremental:
+                written += db.backup_statistics()["bytes_written"]
+            else:
+                written += os.path.getsize(backupfile)
+            time.sleep(1)  # Backups are named by the second.
+        print(("incremental:", incremental, "MB written:",
+               round(written / 1e6, 2), "time (s):",
+               round(time.time() - start - 3, 3)))
+    mnemosyne.config()["incremental_backups"] = False
+
+def duplicate_checks(sizes=(1000, 10000, 100000, 1000000), adds=100):
+
+    """Time adding a card with a duplicate check in databases of increasing
+    size, which should not depend on the size.
+
+    """
+
+    card_type = mnemosyne.card_type_with_id("1")
+    db = mnemosyne.database()
+    fact_count = db.con.execute("select count() from facts").fetchone()[0]
+    for size in sizes:
+        if size > fact_count:
+            new_cards = [({"f": "filler question" + str(i),
+                           "b": "filler answer" + str(i)}, card_type,
+                          ["filler"]) for i in range(fact_count, size)]
+            mnemosyne.controller().create_new_cards_bulk(new_cards, grade=-1)
+            fact_count = size
+        start = time.time()
+        for i in range(adds):
+            mnemosyne.controller().create_new_cards({"f": "unique question" + \
+                str(size + i), "b": "answer"}, card_type, grade=-1,
+                tag_names=["duplicate checks"], check_for_duplicates=True,
+                save=False)
+        db.save()
+        fact_count += adds
+        print(("facts:", fact_count, "ms per add:",
+               round(1000 * (time.time() - start) / adds, 3)))
+
+def reads_under_write_load(write_ahead_log, duration=3):
+
+    """Simulate reviews in the main thread, while another thread (e.g. the
+    web server or a statistics page) is reading.
+
+    """
+
+    mnemosyne.config()["write_ahead_log"] = write_ahead_log
+    db = mnemosyne.database()
+    db.release_connection()
+    _card_ids = [cursor[0] for cursor in \
+        db.con.execute("select _id from cards")]
+    stop = threading.Event()
+    reads = []
+    def read():
+        if db.allows_concurrent_reads():
+            con = db.read_con
+        else: # Needs its own connection.
+            con = sqlite3.connect(db.path())
+        count = 0
+        while not stop.is_set():
+            con.execute("""select count() from cards where active=1 and
+                grade>=2 and next_rep<=?""", (time.time(), )).fetchone()
+            count += 1
+        reads.append(count)
+    thread = threading.Thread(target=read)
+    thread.start()
+    writes = 0
+    start = time.time()
+    while time.time() - start < duration:
+        card = db.card(_card_ids[writes % len(_card_ids)], is_id_internal=True)
+        card.grade = 4
+        card.next_rep = int(time.time())
+        db.update_card(card, repetition_only=True)
+        writes += 1
+        if writes % mnemosyne.config()["save_after_n_reps"] == 0:
+            db.save()
+    stop.set()
+    thread.join()
+    db.save()
+    print(("write_ahead_log:", write_ahead_log,
+           "reads/sec:", int(reads[0] / duration),
+           "writes/sec:", int(writes / duration)))
+
+def reads_under_write_load_journal():
+    reads_under_write_load(write_ahead_log=False)
+
+def reads_under_write_load_wal():
+    reads_under_write_load(write_ahead_log=True)
+
+def log_database_layout(log_entries=1000000):
+
+    """Backups and preparing the entire database for a sync partner, with
+    the log in the main database and in a separate one.
+
+    """
+
+    from openSM2sync.log_entry import EventTypes
+    from openSM2sync.binary_formats.mnemosyne_format import MnemosyneFormat
+    db = mnemosyne.database()
+    # Years worth of reviews.
+    db.con.execute("""insert into log(event_type, timestamp, object_id,
+        grade, easiness, acq_reps, ret_reps, lapses, acq_reps_since_lapse,
+        ret_reps_since_lapse, scheduled_interval, actual_interval,
+        thinking_time, next_rep, scheduler_data) select ?, 1e9 + _id * 60,
+        id, 4, 2.5, 1, _id % 20, 0, 1, _id % 20, 86400, 86400, 5,
+        1e9 + _id * 86400, 0 from cards, (with recursive n(i) as (select 1
+        union all select i + 1 from n where i < ?) select i from n)""",
+        (EventTypes.REPETITION, log_entries // db.card_count()))
+    db.save()
+    for separate in [False, True]:
+        mnemosyne.config()["separate_log_database"] = separate
+        start = time.time()
+        db.load(db.path())
+        print(("separate_log_database:", separate, "conversion (s):",
+               round(time.time() - start, 3)))
+        for incremental in [False, True]:
+            mnemosyne.config()["incremental_backups"] = incremental
+            for day in range(2):
+                db.con.execute("""update cards set grade=4 where _id in
+                    (select _id from cards order by random() limit 100)""")
+                for i in range(100):
+                    db.log_warn_about_too_many_cards(time.time())
+                start = time.time()
+                backupfile = db.backup()
+                elapsed = time.time() - start
+                if incremental:
+                    written = db.backup_statistics()["bytes_written"]
+                else:
+                    written = sum(os.path.getsize(backupfile + suffix) for \
+                        suffix in ["", "-log"] if \
+                        os.path.exists(backupfile + suffix))
+                time.sleep(1)  # Backups are named by the second.
+            # Only report the second day, i.e. with a filled chunk store.
+            print(("incremental:", incremental, "MB written:",
+                   round(written / 1e6, 2), "time (s):", round(elapsed, 3)))
+        mnemosyne.config()["incremental_backups"] = False
+        for interested_in_old_reps in [True, False]:
+            binary_format = MnemosyneFormat(db)
+            start = time.time()
+            filename = binary_format.binary_filename(True,
+                interested_in_old_reps)
+            print(("binary sync, interested_in_old_reps:",
+                   interested_in_old_reps, "MB:",
+                   round(os.path.getsize(filename) / 1e6, 2), "time (s):",
+                   round(time.time() - start, 3)))
+            binary_format.clean_up()
+    mnemosyne.config()["separate_log_database"] = False
+    db.load(db.path())
+
+def statement_statistics():
+
+    """Overhead of the statement instrumentation, for a lot of cheap
+    statements.
+
+    """
+
+    db = mnemosyne.database()
+    for profile in [False, True]:
+        mnemosyne.config()["profile_database_statements"] = profile
+        db.release_connection()
+        start = time.time()
+        hydrate_one_by_one()
+        print(("profile_database_statements:", profile,
+               "time (s):", round(time.time() - start, 3)))
+    report = db.statement_statistics()
+    for entry in report["statements"][:5]:
+        print((entry["count"], round(entry["total"], 3), entry["sql"]))
+    mnemosyne.config()["profile_database_statements"] = False
+    db.release_connection()
+
+def interned_log_object_ids(log_entries=5000000):
+
+    """The statistics pages and the queries used to build the queue, on a log
+    with the object ids stored as text and as integers.
+
+    """
+
+    from openSM2sync.log_entry import EventTypes
+    db = mnemosyne.database()
+    # A couple of years worth of reviews, with the first one of each card
+    # being the one where it got learned.
+    now = int(time.time())
+    db.con.execute("""insert into log(event_type, timestamp, object_id,
+        grade, easiness, acq_reps, ret_reps, lapses, acq_reps_since_lapse,
+        ret_reps_since_lapse, scheduled_interval, actual_interval,
+        thinking_time, next_rep, scheduler_data) select ?,
+        ? - (_id * 7919 + i * 104729) % (730 * 86400), id, (_id + i) % 6,
+        2.5, 1, i - 1, 0, 1, i - 1, 86400 * (i > 1), 86400, 5, 0, 0
+        from cards, (with recursive n(i) as (select 1 union all
+        select i + 1 from n where i < ?) select i from n)""",
+        (EventTypes.REPETITION, now, log_entries // db.card_count()))
+    db.save()
+    cards = [db.card(_id, is_id_internal=True) for _id in range(1, 101)]
+    for interned in [False, True]:
+        mnemosyne.config()["intern_log_object_ids"] = interned
+        start = time.time()
+        db.load(db.path())
+        print(("intern_log_object_ids:", interned, "conversion (s):",
+               round(time.time() - start, 3), "MB:",
+               round(os.path.getsize(db.path()) / 1e6, 2)))
+        start = time.time()
+        for n in range(366):
+            db.card_count_added_n_days_ago(n)
+            db.card_count_learned_n_days_ago(n)
+            db.retention_score_n_days_ago(n)
+        print(("statistics pages, last year (s):",
+               round(time.time() - start, 3)))
+        start = time.time()
+        for card in cards:
+            db.average_thinking_time(card)
+            db.total_thinking_time(card)
+        print(("current card page, 100 cards (s):",
+               round(time.time() - start, 3)))
+        start = time.time()
+        for n in range(30):
+            start_of_day = db.start_of_day_n_days_ago(n)
+            list(db.fact_ids_forgotten_and_learned_today(start_of_day,
+                start_of_day + 86400))
+            list(db.fact_ids_newly_learned_today(start_of_day,
+                start_of_day + 86400))
+        print(("facts learned today, 30 days (s):",
+               round(time.time() - start, 3)))
+    mnemosyne.config()["intern_log_object_ids"] = False
+    db.load(db.path())
+
+def defer_pregenerated_data():
+
+    """Updating all the cards, like a sync with a lot of edits does, with the
+    pregenerated data rendered right away and deferred.
+
+    """
+
+    db = mnemosyne.database()
+    cards = db.cards_with_internal_ids(cursor[0] for cursor in \
+        db.con.execute("select _id from cards"))
+    for defer in [False, True]:
+        mnemosyne.config()["defer_pregenerated_data"] = defer
+        start = time.time()
+        for card in cards:
+            card.modification_time = int(time.time())
+            db.update_card(card)
+        db.save()
+        print(("defer_pregenerated_data:", defer, "updating (s):",
+               round(time.time() - start, 3)))
+    start = time.time()
+    db.regenerate_pregenerated_data()
+    db.save()
+    print(("catching up afterwards (s):", round(time.time() - start, 3)))
+    mnemosyne.config()["defer_pregenerated_data"] = False
+
+def in_memory_due_index(rebuilds=200):
+
+    """Building the queue in all stages of the scheduler, with the cards
+    spread over the different stages, from SQL and from the in memory index.
+
+    """
+
+    db = mnemosyne.database()
+    scheduler = mnemosyne.scheduler()
+    now = int(time.time())
+    db.con.execute("""update cards set grade=abs(random()) % 7 - 1,
+        lapses=abs(random()) % 3, next_rep=? + random() % (30 * 86400),
+        last_rep=? - abs(random()) % (60 * 86400)""", (now, now))
+    db.con.execute("update cards set grade=-1, lapses=0 where _id % 4 = 0")
+    db.save()
+    db._invalidate_due_index()
+    mnemosyne.config()["shown_backlog_help"] = True
+    for use_index in [False, True]:
+        mnemosyne.config()["in_memory_due_index"] = use_index
+        if use_index:
+            start = time.time()
+            db.due_index()
+            print(("loading the index (s):", round(time.time() - start, 3)))
+        # The queries themselves, ...
+        start = time.time()
+        for i in range(rebuilds):
+            db.active_count()
+            list(db.cards_due_for_ret_rep(now, sort_key="interval", limit=50))
+            for grade in [1, 0]:
+                list(db.cards_to_relearn(grade, sort_key="-interval"))
+                list(db.cards_new_memorising(grade))
+            list(db.cards_unseen(limit=50))
+            list(db.cards_learn_ahead(now, sort_key="next_rep", limit=50))
+        print(("in_memory_due_index:", use_index, "queries (ms):",
+               round(1000 * (time.time() - start) / rebuilds, 3)))
+        # ... and as part of the scheduler.
+        start = time.time()
+        for i in range(rebuilds):
+            scheduler.stage = 1 + i % 5
+            scheduler.rebuild_queue(learn_ahead=True)
+        print(("in_memory_due_index:", use_index, "rebuilding queue (ms):",
+               round(1000 * (time.time() - start) / rebuilds, 3)))
+    mnemosyne.config()["in_memory_due_index"] = False
+
+def grade_sister_cards(facts=100, clozes=20):
+
+    """Grading all the cards of facts with many sister cards, which need to
+    be kept away from each other's days.
+
+    """
+
+    from mnemosyne.libmnemosyne.card_types.cloze import ClozePlugin
+    for plugin in mnemosyne.plugins():
+        if isinstance(plugin, ClozePlugin):
+            plugin.activate()
+    card_type = mnemosyne.card_type_with_id("5")
+    cards = []
+    for i in range(facts):
+        fact_data = {"text": " ".join("[cloze%d_%d]" % (i, j) \
+            for j in range(clozes))}
+        cards += mnemosyne.controller().create_new_cards(fact_data,
+            card_type, grade=-1, tag_names=["cloze"],
+            check_for_duplicates=False, save=False)
+    db = mnemosyne.database()
+    db.save()
+    scheduler = mnemosyne.scheduler()
+    def grade():
+        for card in cards:
+            scheduler.grade_answer(card, 4)
+            db.update_card(card, repetition_only=True)
+    queries, elapsed = count_queries(grade)
+    print(("grade_sister_cards:", len(cards), "cards, queries:", queries,
+           "time (s):", round(elapsed, 3)))
+
+def schedule_per_day(number_of_cards=200000):
+
+    """The schedule statistics page, calculated one day at a time and with
+    a single query, for a database with 'number_of_cards' cards.
+
+    """
+
+    from mnemosyne.libmnemosyne.statistics_pages.schedule import Schedule
+    db = mnemosyne.database()
+    scheduler = mnemosyne.scheduler()
+    max_id = db.con.execute("select max(_id) from cards").fetchone()[0]
+    columns = db._card_columns.replace("_id, id,", "")
+    for copy in range(number_of_cards // db.card_count() - 1):
+        db.con.execute("""insert into cards(id, %s) select id || '.%d', %s
+            from cards where _id<=?""" % (columns, copy, columns),
+            (max_id, ))
+    now = int(time.time())
+    db.con.execute("""update cards set grade=2 + abs(random()) % 4,
+        next_rep=? + random() % (365 * 86400), ret_reps_since_lapse=0""",
+        (now, ))
+    db.save()
+    page = Schedule(mnemosyne.component_manager)
+    for variant in [Schedule.NEXT_YEAR, Schedule.LAST_YEAR]:
+        page.prepare_statistics(variant)
+        start = time.time()
+        for n in page.x:
+            scheduler.card_count_scheduled_n_days_from_now(n)
+        print(("schedule_per_day:", db.card_count(), "cards, variant:",
+               variant, "one day at a time (s):", round(time.time() - start,
+               3)))
+        start = time.time()
+        page.prepare_statistics(variant)
+        print(("single query (s):", round(time.time() - start, 3)))
+    db.con.execute("delete from cards where _id>?", (max_id, ))
+    db.save()
+
+def background_queue_rebuild(reviews=200, number_of_cards=100000):
+
+    """The time it takes to get the next card during reviews, with the queue
+    rebuilt from the database and from the data read in the background, for
+    a database with 'number_of_cards' cards which are all due.
+
+    """
+
+    db = mnemosyne.database()
+    scheduler = mnemosyne.scheduler()
+    max_id = db.con.execute("select max(_id) from cards").fetchone()[0]
+    columns = db._card_columns.replace("_id, id,", "")
+    for copy in range(number_of_cards // db.card_count() - 1):
+        db.con.execute("""insert into cards(id, %s) select id || '.%d', %s
+            from cards where _id<=?""" % (columns, copy, columns),
+            (max_id, ))
+    now = int(time.time())
+    # As for real cards, 'next_rep' is midnight UTC.
+    db.con.execute("""update cards set grade=2 + abs(random()) % 4,
+        next_rep=(?/86400 - 1 - abs(random()) % 30) * 86400, last_rep=
+        next_rep - abs(random()) % (30 * 86400), ret_reps_since_lapse=0""",
+        (now, ))
+    db.save()
+    mnemosyne.config()["shown_backlog_help"] = True
+    for background in [False, True]:
+        mnemosyne.config()["write_ahead_log"] = background
+        mnemosyne.config()["background_queue_rebuild"] = background
+        db.release_connection()
+        assert db.allows_concurrent_reads() == background
+        scheduler.reset()
+        times = []
+        for i in range(reviews):
+            start = time.time()
+            card = scheduler.next_card()
+            times.append(time.time() - start)
+            scheduler.grade_answer(card, 4)
+            db.update_card(card, repetition_only=True)
+            if i % 10 == 0:
+                db.save()
+            # The user looking at the card, although much shorter than in
+            # reality.
+            time.sleep(0.1)
+        # The first queue is always built from the database.
+        times = times[1:]
+        print(("background_queue_rebuild:", background, "next card, mean (ms):",
+               round(1000 * sum(times) / len(times), 3), "slowest (ms):",
+               round(1000 * max(times), 3)))
+    mnemosyne.config()["write_ahead_log"] = False
+    mnemosyne.config()["background_queue_rebuild"] = False
+    db.release_connection()
+    db.con.execute("delete from cards where _id>?", (max_id, ))
+    db.save()
+
+def finalise():
+    mnemosyne.finalise()
+    shutil.rmtree("dot_benchmark_database", ignore_errors=True)
+
+# Tests for which we count the number of queries.
+tests = ["hydrate_one_by_one", "hydrate_in_bulk", "repeated_lookups",
+         "add_cards_one_by_one", "add_cards_in_bulk", "rename_tag",
+         "tag_few_cards", "search_cards_like", "search_cards_index",
+         "tag_all_duplicates", "delete_facts_bulk"]
+# Tests which do their own reporting.
+load_tests = ["hydrate_extra_data", "backup_in_background",
+              "incremental_backups",
+              "reads_under_write_load_journal",
+              "reads_under_write_load_wal", "duplicate_checks",
+              "statement_statistics", "log_database_layout",
+              "interned_log_object_ids", "defer_pregenerated_data",
+              "in_memory_due_index", "grade_sister_cards",
+              "schedule_per_day", "background_queue_rebuild"]
+
+startup()
+create_database()
+card_count = mnemosyne.database().card_count()
+for test in tests:
+    queries, elapsed = count_queries(globals()[test])
+    print(("*** ", test, " ***"))
+    print(("queries per 10k cards:", queries * 10000 // card_count,
+           "time (s):", round(elapsed, 3)))
+for test in load_tests:
+    print(("*** ", test, " ***"))
+    globals()[test]()
+finalise()
@@ -451,3 +451,77 @@ class TestActivateCards(MnemosyneTest):
         self.controller().create_new_cards(fact_data, card_type_1,
             grade=-1, tag_names=["dummy::b"])
         assert self.database().active_count() == 2
+
+    def test_apply_to_cards_with_internal_ids(self):
+        import random
+        random.seed(0)
+        db = self.database()
+        card_type_1 = self.card_type_with_id("1")
+        card_type_2 = self.card_type_with_id("2")
+        tag_names = ["a", "b", "c", "d", "a::e"]
+        for i in range(40):
+            fact_data = {"f": "question%d" % i, "b": "answer%d" % i}
+            card_type = card_type_1 if i % 2 else card_type_2
+            self.controller().create_new_cards(fact_data, card_type,
+                grade=-1, tag_names=random.sample(tag_names,
+                random.randint(0, 3)), check_for_duplicates=False)
+        _tag_id = lambda name: db.get_or_create_tag_with_name(name)._id
+        all_tag_ids = set(cursor[0] for cursor in \
+            db.con.execute("select _id from tags"))
+        criteria = []
+        for active, forbidden, deactivated in \
+            [(all_tag_ids, [], []),
+             (["a", "b"], [], []),
+             (["a", "c", "__UNTAGGED__"], ["d"], []),
+             (all_tag_ids, ["b"], [("2", "2::1")]),
+             (["a::e", "d"], [], [("1", "1::1"), ("2", "2::2")]),
+             ([], [], [])]:
+            c = DefaultCriterion(self.mnemosyne.component_manager)
+            c.deactivated_card_type_fact_view_ids = set(deactivated)
+            c._tag_ids_active = set(_tag_id(name) if isinstance(name, str) \
+                else name for name in active)
+            c._tag_ids_forbidden = set(_tag_id(name) for name in forbidden)
+            criteria.append(c)
+        applier = self.mnemosyne.component_manager.current(\
+            "criterion_applier", used_for=DefaultCriterion)
+        _card_ids = [cursor[0] for cursor in \
+            db.con.execute("select _id from cards")]
+        for c in criteria:
+            applier.apply_to_database(c)
+            expected = list(db.con.execute(\
+                "select _id, active from cards order by _id"))
+            for subset in [_card_ids, random.sample(_card_ids, 10)]:
+                for _card_id in subset:
+                    db.con.execute("update cards set active=? where _id=?",
+                        (random.randint(0, 1), _card_id))
+                # Cards outside the subset should not be touched.
+                for _card_id in set(_card_ids) - set(subset):
+                    db.con.execute("update cards set active=? where _id=?",
+                        (dict(expected)[_card_id], _card_id))
+                applier.apply_to_cards_with_internal_ids(c, subset,
+                    chunk_size=7)
+                assert list(db.con.execute(\
+                    "select _id, active from cards order by _id")) == expected
+
+    def test_tag_cards_incrementally(self):
+        db = self.database()
+        card_type = self.card_type_with_id("1")
+        cards = []
+        for i in range(5):
+            fact_data = {"f": "question%d" % i, "b": "answer%d" % i}
+            cards += self.controller().create_new_cards(fact_data, card_type,
+                grade=-1, tag_names=["a"])
+        c = DefaultCriterion(self.mnemosyne.component_manager)
+        c.deactivated_card_type_fact_view_ids = set()
+        c._tag_ids_active = set([db.get_or_create_tag_with_name("a")._id])
+        c._tag_ids_forbidden = set([db.get_or_create_tag_with_name("b")._id])
+        db.set_current_criterion(c)
+        assert db.active_count() == 5
+        tag = db.get_or_create_tag_with_name("b")
+        db.add_tag_to_cards_with_internal_ids(tag, [cards[0]._id, cards[1]._id])
+        assert db.active_count() == 3
+        assert db.card(cards[0]._id, is_id_internal=True).active == False
+        db.remove_tag_from_cards_with_internal_ids(tag, [cards[0]._id])
+        assert db.active_count() == 4
+        db.delete_tag(db.get_or_create_tag_with_name("b"))
+        assert db.active_count() == 5
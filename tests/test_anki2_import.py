@@ -8,6 +8,7 @@ import shutil
 from pytest import raises
 
 from mnemosyne_test import MnemosyneTest
+from mnemosyne.libmnemosyne.utils import decode_data
 from mnemosyne.libmnemosyne import Mnemosyne
 from mnemosyne.libmnemosyne.ui_components.dialogs import ImportDialog
 from mnemosyne.libmnemosyne.ui_components.main_widget import MainWidget
@@ -88,7 +89,7 @@ class TestAnkiImport(MnemosyneTest):
         assert card.easiness == 2.5
 
         criterion = self.database().criterion(id=2, is_id_internal=True)
-        assert criterion.data_to_string() == "(set(), {2}, set())"
+        assert decode_data(criterion.data_to_string()) == (set(), {2}, set())
         assert criterion.name == "Deck 1"
         assert len(list(self.database().criteria())) == 3
 
@@ -8,12 +8,15 @@ import sys
 import shutil
 import time
 
+from pytest import raises
 from openSM2sync.log_entry import EventTypes
 
 from mnemosyne_test import MnemosyneTest
 from mnemosyne.libmnemosyne.tag import Tag
+from mnemosyne.libmnemosyne.fact import Fact
 from mnemosyne.libmnemosyne import Mnemosyne
 from mnemosyne.libmnemosyne.utils import expand_path
+from mnemosyne.libmnemosyne.criteria.default_criterion import DefaultCriterion
 from mnemosyne.libmnemosyne.ui_components.main_widget import MainWidget
 
 HOUR = 60 * 60  # Seconds in an hour.
@@ -160,6 +163,33 @@ class TestDatabase(MnemosyneTest):
             "select count() from log where event_type=?",
             (EventTypes.EDITED_CARD, )).fetchone()[0] == 1
 
+    def test_update_tag_strings(self):
+        card_type = self.card_type_with_id("2")
+        for i in range(12):
+            fact_data = {"f": "question" + str(i),
+                         "b": "answer" + str(i)}
+            self.controller().create_new_cards(fact_data, card_type,
+                grade=-1, tag_names=["tag" + str(i % 11), "a::b", "common"])
+        fact_data = {"f": "untagged", "b": "answer"}
+        self.controller().create_new_cards(fact_data, card_type,
+            grade=-1, tag_names=[])
+        db = self.database()
+        tag = db.get_or_create_tag_with_name("common")
+        tag.name = "tag2b"
+        db.update_tag(tag)
+        _card_ids = [cursor[0] for cursor in \
+            db.con.execute("select _id from cards")]
+        # Chunks smaller than the number of cards.
+        db._update_tag_strings(_card_ids + _card_ids[:3], chunk_size=5)
+        db.clear_object_caches()
+        for card in db.cards_with_internal_ids(_card_ids):
+            assert db.con.execute("select tags from cards where _id=?",
+                (card._id, )).fetchone()[0] == card.tag_string()
+        card = db.cards_with_internal_ids(_card_ids[20:21])[0]
+        assert card.tag_string() == "a::b, tag2b, tag10"
+        assert db.cards_with_internal_ids(_card_ids[-1:])[0].tag_string() \
+            == ""
+
     def test_empty_argument(self):
         assert self.database().tags_from_cards_with_internal_ids([]) == []
 
@@ -285,6 +315,124 @@ class TestDatabase(MnemosyneTest):
         assert self.database().card_count() == 0
         assert len(self.database().tags()) == 1
 
+    def test_cards_with_internal_ids(self):
+        card_type = self.card_type_with_id("2")
+        for i in range(5):
+            fact_data = {"f": "question" + str(i),
+                         "b": "answer" + str(i)}
+            self.controller().create_new_cards(fact_data, card_type,
+                grade=-1, tag_names=["tag" + str(i), "default"])
+        _card_ids = [cursor[0] for cursor in self.database().con.execute(\
+            "select _id from cards order by _id desc")]
+        _card_ids.insert(3, -1)
+        cards = self.database().cards_with_internal_ids(_card_ids)
+        assert len(cards) == 10
+        assert [card._id for card in cards] == \
+            [_card_id for _card_id in _card_ids if _card_id != -1]
+        for card in cards:
+            ref_card = self.database().card(card._id, is_id_internal=True)
+            assert card == ref_card
+            assert card.fact == ref_card.fact
+            assert card.fact.data == ref_card.fact.data
+            assert card.fact_view.id == ref_card.fact_view.id
+            assert card.question() == ref_card.question()
+            assert card.tag_string() == ref_card.tag_string()
+            assert card.next_rep == ref_card.next_rep
+            assert card.extra_data == ref_card.extra_data
+        cards = self.database().cards_with_ids(\
+            [cards[1].id, "unknown", cards[0].id])
+        assert [card._id for card in cards] == _card_ids[1::-1]
+        assert self.database().cards_with_internal_ids([]) == []
+        facts = self.database().facts_with_internal_ids(\
+            [cards[0].fact._id, -1])
+        assert len(facts) == 1
+        assert facts[0].data == cards[0].fact.data
+
+    def test_add_facts_and_cards_bulk(self):
+        card_type_1 = self.card_type_with_id("1")
+        card_type_2 = self.card_type_with_id("2")
+        # Serial reference.
+        self.controller().create_new_cards({"f": "serial", "b": "answer"},
+            card_type_2, grade=-1, tag_names=["default"])
+        new_cards = [({"f": "question" + str(i), "b": "answer" + str(i)},
+            card_type_2 if i % 2 else card_type_1,
+            ["tag" + str(i % 3), "default"]) for i in range(10)]
+        new_cards.append(({"f": "untagged", "b": "answer"}, card_type_1, []))
+        sister_cards = self.controller().create_new_cards_bulk(new_cards,
+            grade=-1)
+        assert [len(cards) for cards in sister_cards] == \
+            [1, 2] * 5 + [1]
+        assert self.database().fact_count() == 12
+        assert self.database().card_count() == 18
+        db = self.database()
+        for cards in sister_cards:
+            for card in cards:
+                ref_card = db.card(card.id, is_id_internal=False)
+                assert ref_card._id == card._id
+                assert ref_card.fact._id == card.fact._id
+                assert ref_card.fact.data == card.fact.data
+                assert ref_card.tag_string() == card.tag_string()
+                assert db.con.execute(\
+                    "select question, answer, tags from cards where _id=?",
+                    (card._id, )).fetchone() == (card.question("plain_text"),
+                    card.answer("plain_text"), card.tag_string())
+        assert sister_cards[-1][0].tag_string() == ""
+        assert db.con.execute("select count() from log where event_type=?",
+            (EventTypes.ADDED_FACT, )).fetchone()[0] == 12
+        assert db.con.execute("select count() from log where event_type=?",
+            (EventTypes.ADDED_CARD, )).fetchone()[0] == 18
+        # Cards can also be added for existing facts.
+        fact = sister_cards[0][0].fact
+        card = card_type_1.create_sister_cards(fact)[0]
+        db.add_facts_and_cards_bulk([], [card])
+        assert len(db.cards_from_fact(fact)) == 2
+
+    def test_object_cache(self):
+        fact_data = {"f": "question",
+                     "b": "answer"}
+        card_type = self.card_type_with_id("1")
+        card = self.controller().create_new_cards(fact_data, card_type,
+            grade=-1, tag_names=["default"])[0]
+        db = self.database()
+        db.reset_object_caches()
+        card_1 = db.card(card._id, is_id_internal=True)
+        card_2 = db.card(card.id, is_id_internal=False)
+        assert card_1 is card_2
+        assert db.fact(card.fact._id, is_id_internal=True) is card_1.fact
+        assert db.object_cache_statistics()["card"] == (1, 1, 1)
+        # Updating invalidates the cache.
+        card_1.grade = 2
+        db.update_card(card_1)
+        card_3 = db.card(card._id, is_id_internal=True)
+        assert card_3 is not card_1
+        assert card_3.grade == 2
+        # As does an external update of the 'active' field.
+        self.controller().delete_facts_and_their_cards([card_3.fact])
+        assert db.object_cache_statistics()["card"][0] == 0
+        # Renaming a tag.
+        card = self.controller().create_new_cards({"f": "a", "b": "b"},
+            card_type, grade=-1, tag_names=["old"])[0]
+        card = db.card(card._id, is_id_internal=True)
+        tag = db.get_or_create_tag_with_name("old")
+        tag.name = "new"
+        db.update_tag(tag)
+        assert db.card(card._id, is_id_internal=True).tag_string() == "new"
+        # Eviction.
+        self.config()["object_cache_size"] = 2
+        db.reset_object_caches()
+        for i in range(3):
+            self.controller().create_new_cards({"f": str(i), "b": "b"},
+                card_type, grade=-1, tag_names=["default"])
+        for cursor in db.con.execute("select _id from cards"):
+            db.card(cursor[0], is_id_internal=True)
+        assert db.object_cache_statistics()["card"][0] == 2
+        # Disabling.
+        self.config()["object_cache_size"] = 0
+        db.reset_object_caches()
+        card_1 = db.card(card._id, is_id_internal=True)
+        assert db.card(card._id, is_id_internal=True) is not card_1
+        assert db.object_cache_statistics()["card"] == (0, 0, 0)
+
     def infinity(self):
         return 1/0
 
@@ -372,6 +520,61 @@ class TestDatabase(MnemosyneTest):
             grade=-1, tag_names=["default"], check_for_duplicates=False)
         assert len(self.database().duplicates_for_fact(fact, card_type)) == 1
 
+    def test_duplicates_after_edit(self):
+        db = self.database()
+        fact_data = {"f": "question",
+                     "b": "answer"}
+        card_type = self.card_type_with_id("1")
+        card = self.controller().create_new_cards(fact_data, card_type,
+            grade=-1, tag_names=["default"], check_for_duplicates=False)[0]
+        fact = card.fact
+        assert len(db.duplicates_for_fact(Fact({"f": "question"}),
+            card_type)) == 1
+        fact["f"] = "edited"
+        db.update_fact(fact)
+        assert len(db.duplicates_for_fact(Fact({"f": "question"}),
+            card_type)) == 0
+        assert len(db.duplicates_for_fact(Fact({"f": "edited"}),
+            card_type)) == 1
+        # Only the actual data counts, not just the hash.
+        db.con.execute("update data_hashes_for_fact set hash=?",
+            (db._data_hash("f", "other"), ))
+        assert len(db.duplicates_for_fact(Fact({"f": "other"}),
+            card_type)) == 0
+        db.delete_fact(fact)
+        assert db.con.execute(\
+            "select count() from data_hashes_for_fact").fetchone()[0] == 0
+
+    def test_delete_facts_bulk(self):
+        db = self.database()
+        card_type = self.card_type_with_id("2")
+        cards = []
+        for i, tag_names in enumerate([["a", "b"], ["a"], ["b"]]):
+            cards.append(self.controller().create_new_cards({"f": str(i),
+                "b": "answer"}, card_type, grade=-1, tag_names=tag_names)[0])
+        criterion = db.current_criterion()
+        tag_a = db.get_or_create_tag_with_name("a")
+        criterion._tag_ids_active.add(tag_a._id)
+        db.set_current_criterion(criterion)
+        log_count = db.con.execute("select count() from log").fetchone()[0]
+        self.controller().delete_facts_and_their_cards(\
+            [cards[0].fact, cards[1].fact])
+        assert db.fact_count() == 1
+        assert db.card_count() == 2
+        for table in ["data_for_fact", "data_hashes_for_fact"]:
+            assert db.con.execute("select count() from %s where _fact_id!=?" \
+                % table, (cards[2].fact._id, )).fetchone()[0] == 0
+        assert db.con.execute("""select count() from tags_for_card where
+            _card_id not in (select _id from cards)""").fetchone()[0] == 0
+        assert sorted(tag.name for tag in db.tags()) == ["__UNTAGGED__", "b"]
+        assert tag_a._id not in db.current_criterion()._tag_ids_active
+        event_types = [cursor[0] for cursor in db.con.execute(\
+            "select event_type from log where _id>?", (log_count, ))]
+        assert event_types.count(EventTypes.DELETED_CARD) == 4
+        assert event_types.count(EventTypes.DELETED_FACT) == 2
+        assert event_types.count(EventTypes.DELETED_TAG) == 1
+        assert db.delete_facts_bulk([]) == []
+
     def test_card_types_in_use(self):
         fact_data = {"f": "question",
                      "b": "answer"}
@@ -396,6 +599,129 @@ class TestDatabase(MnemosyneTest):
             self.database().unload()
             self.database().load(self.config()["last_database"])
 
+    def test_write_ahead_log(self):
+        import sqlite3
+        import threading
+        self.config()["write_ahead_log"] = True
+        self.database().release_connection()
+        assert self.database().con.execute(\
+            "pragma journal_mode").fetchone()[0] == "wal"
+        fact_data = {"f": "question",
+                     "b": "answer"}
+        card_type = self.card_type_with_id("1")
+        self.controller().create_new_cards(fact_data, card_type,
+            grade=-1, tag_names=["default"], save=False)
+        # Same thread: read through the writer, also uncommitted changes.
+        assert self.database().read_con is self.database().con
+        assert self.database().card_count() == 1
+        # Other thread: only committed changes are visible.
+        counts = []
+        def read():
+            counts.append(self.database().read_con.execute(\
+                "select count() from cards").fetchone()[0])
+        for i in range(2):
+            thread = threading.Thread(target=read)
+            thread.start()
+            thread.join()
+            self.database().save()
+        assert counts == [0, 1]
+        # Readers can't write.
+        def write():
+            try:
+                self.database().read_con.execute("delete from cards")
+            except Exception as e:
+                counts.append(e)
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join()
+        assert len(counts) == 3
+        # Backups contain everything, without needing the log.
+        backupfile = self.database().backup()
+        assert sqlite3.connect(backupfile).execute(\
+            "select count() from cards").fetchone()[0] == 1
+        self.database().unload()
+        self.database().load(self.config()["last_database"])
+        assert self.database().card_count() == 1
+
+    def test_database_driver(self):
+        from mnemosyne.libmnemosyne.utils import MnemosyneError
+        from mnemosyne.libmnemosyne.databases._sqlite3 import _Sqlite3
+        self.config()["database_driver"] = "apsw"
+        self.database().release_connection()
+        try:
+            from mnemosyne.libmnemosyne.databases._apsw import _APSW
+            assert isinstance(self.database().con, _APSW)
+        except ImportError:
+            assert isinstance(self.database().con, _Sqlite3)
+        fact_data = {"f": "question",
+                     "b": "answer"}
+        card_type = self.card_type_with_id("1")
+        card = self.controller().create_new_cards(fact_data, card_type,
+            grade=-1, tag_names=["default"])[0]
+        con = self.database().con
+        con.executemany("insert into tags(name, id) values(?,?)",
+            (("a", "a"), ("b", "b")))
+        con.execute("insert into tags(name, id) values(?,?)", ("c", "c"))
+        assert con.last_insert_rowid() == con.execute(\
+            "select _id from tags where id='c'").fetchone()[0]
+        assert con.execute("select _id from tags where id='d'").\
+            fetchone() is None
+        try:
+            con.execute("select * from no_such_table")
+            assert False
+        except MnemosyneError:
+            pass
+        self.database().save()
+        self.database().defragment()
+        self.database().unload()
+        self.database().load(self.config()["last_database"])
+        assert self.database().card_count() == 1
+        assert "c" in [tag.name for tag in self.database().tags()]
+        assert self.database().card(card._id, is_id_internal=True).id \
+            == card.id
+        # Changing the layout of the log runs scripts with transactions of
+        # their own.
+        log_count = self.database().con.execute(\
+            "select count() from log").fetchone()[0]
+        self.config()["separate_log_database"] = True
+        self.config()["intern_log_object_ids"] = True
+        self.database().load(self.config()["last_database"])
+        assert self.database().has_separate_log_database()
+        assert self.database().has_interned_log()
+        assert self.database().con.execute(\
+            "select count() from log").fetchone()[0] == log_count
+
+    def test_defragment(self):
+        db = self.database()
+        con = db.con
+        card_type = self.card_type_with_id("1")
+        for i in range(500):
+            card = self.controller().create_new_cards({"f": "question %d" % i,
+                "b": "answer %d" % i * 20}, card_type, grade=-1,
+                tag_names=["default"], check_for_duplicates=False,
+                save=False)[0]
+        untagged = db.tag("__UNTAGGED__", is_id_internal=False)
+        con.execute("insert into tags_for_card(_tag_id, _card_id) values(?,?)",
+            (untagged._id, card._id))
+        con.execute("delete from cards where _id<400")
+        db.save()
+        assert con.execute("pragma auto_vacuum").fetchone()[0] == 2
+        assert con.execute("pragma freelist_count").fetchone()[0] > 10
+        db.vacuum_pages_per_step = 5
+        calls = []
+        db.defragment(progress=lambda done, total: calls.append((done, total)))
+        assert con.execute("pragma freelist_count").fetchone()[0] == 0
+        assert len(calls) > 1 and calls[-1][0] == calls[-1][1]
+        assert [tag.name for tag in db.card(card._id, \
+            is_id_internal=True).tags] == ["default"]
+        # Databases created by older versions get converted.
+        con.execute("pragma auto_vacuum = none")
+        con.execute("vacuum")
+        assert con.execute("pragma auto_vacuum").fetchone()[0] == 0
+        db.defragment()
+        assert con.execute("pragma auto_vacuum").fetchone()[0] == 2
+        assert db.card_count() == 101
+
     def test_schedule_on_same_day(self):
         fact_data = {"f": "question",
                      "b": "answer"}
@@ -418,6 +744,53 @@ class TestDatabase(MnemosyneTest):
         assert self.database().sister_card_count_scheduled_between(card_3, card_1.next_rep, card_1.next_rep+DAY) == 0
         assert self.database().sister_card_count_scheduled_between(card_1, card_1.next_rep, card_1.next_rep+DAY) == 0
 
+    def test_sister_card_next_reps(self):
+        from openSM2sync.log_entry import LogEntry
+        db = self.database()
+        card_type = self.card_type_with_id("3")
+        fact_data = {"f": "foreign", "p_1": "pronunciation",
+                     "m_1": "translation"}
+        card_1, card_2 = self.controller().create_new_cards(fact_data,
+            card_type, grade=-1, tag_names=["default"])
+        assert db.sister_card_next_reps(card_1) == []
+        # Grading.
+        self.review_controller().show_new_question()
+        graded = self.review_controller().card
+        self.review_controller().grade_answer(2)
+        other = card_2 if graded == card_1 else card_1
+        graded = db.card(graded._id, is_id_internal=True)
+        assert db.sister_card_next_reps(other) == [graded.next_rep]
+        assert db.sister_card_next_reps(graded) == []
+        # The sister card does not get scheduled on the same day.
+        other.grade = 2
+        other.next_rep = graded.next_rep
+        self.scheduler().avoid_sister_cards(other)
+        assert other.next_rep == graded.next_rep + DAY
+        # Rescheduling.
+        graded.next_rep += 10 * DAY
+        db.update_card(graded, repetition_only=True)
+        assert db.sister_card_next_reps(other) == [graded.next_rep]
+        # Sync.
+        db.apply_log_entry(LogEntry(type=EventTypes.REPETITION,
+            time=int(time.time()), o_id=graded.id, gr=4, e=2.5, ac_rp=1,
+            rt_rp=1, lps=0, ac_rp_l=1, rt_rp_l=1, n_rp=graded.next_rep + DAY,
+            sch_i=0, act_i=0, th_t=0))
+        assert db.sister_card_next_reps(other) == [graded.next_rep + DAY]
+        # Criterion.
+        c = DefaultCriterion(self.mnemosyne.component_manager)
+        c.deactivated_card_type_fact_view_ids = \
+            set([(card_type.id, graded.fact_view.id)])
+        c._tag_ids_active = set([db.get_or_create_tag_with_name("default")._id])
+        c._tag_ids_forbidden = set()
+        db.set_current_criterion(c)
+        assert db.sister_card_next_reps(other) == []
+        c.deactivated_card_type_fact_view_ids = set()
+        db.set_current_criterion(c)
+        assert db.sister_card_next_reps(other) == [graded.next_rep + DAY]
+        # Deletion.
+        db.delete_card(graded)
+        assert db.sister_card_next_reps(other) == []
+
     def test_purge_backups(self):
         backup_dir = os.path.join(self.config().data_dir, "backups")
         for count in range(15):
@@ -428,6 +801,360 @@ class TestDatabase(MnemosyneTest):
         assert "default-0.db" not in backups
         self.restart()
 
+    def test_backup_while_writing(self):
+        import sqlite3
+        db = self.database()
+        card_type = self.card_type_with_id("1")
+        for i in range(200):
+            self.controller().create_new_cards({"f": "question %d" % i,
+                "b": "answer %d" % i * 20}, card_type, grade=-1,
+                tag_names=["default"], check_for_duplicates=False,
+                save=False)
+        db.backup_pages_per_step = 1
+        for write_ahead_log in [False, True]:
+            self.config()["write_ahead_log"] = write_ahead_log
+            db.release_connection()
+            db.con.execute("update cards set grade=0, next_rep=0")
+            db.save()
+            calls = []
+            def progress(remaining, total):
+                # Another connection writes once the copy has started.
+                if not calls:
+                    con = sqlite3.connect(db.path())
+                    con.execute("update cards set grade=5")
+                    con.commit()
+                    con.close()
+                calls.append((remaining, total))
+            backupfile = db.backup(background=True, progress=progress)
+            # Meanwhile, the main connection continues to write as well.
+            for next_rep in range(1, 6):
+                db.con.execute("update cards set next_rep=?", (next_rep, ))
+                db.save()
+                time.sleep(0.01)
+            assert db.wait_for_backup() == backupfile
+            assert not db.backup_in_progress()
+            con = sqlite3.connect(backupfile)
+            assert con.execute("pragma integrity_check").fetchone()[0] == "ok"
+            assert con.execute("select count() from cards").fetchone()[0] \
+                == 200
+            # Each transaction is either entirely in the backup, or not.
+            assert len(con.execute("""select distinct grade, next_rep
+                from cards""").fetchall()) == 1
+            con.close()
+            statistics = db.backup_statistics()
+            assert statistics["file"] == backupfile
+            assert statistics["pages"] == calls[-1][1]
+            if not write_ahead_log:
+                assert len(calls) > 1
+                assert statistics["restarts"] >= 1
+            time.sleep(1)  # Backups are named by the second.
+        assert not [f for f in os.listdir(os.path.dirname(backupfile)) \
+            if f.endswith(".tmp")]
+
+    def test_incremental_backup(self):
+        import sqlite3
+        db = self.database()
+        self.config()["incremental_backups"] = True
+        self.config()["max_backups"] = 2
+        backup_dir = os.path.join(self.config().data_dir, "backups")
+        card_type = self.card_type_with_id("1")
+        for i in range(200):
+            self.controller().create_new_cards({"f": "question %d" % i,
+                "b": "answer %d" % i * 20}, card_type, grade=-1,
+                tag_names=["default"], check_for_duplicates=False,
+                save=False)
+        db.backup_chunk_size = 4096
+        manifests = []
+        for write_ahead_log in [False, True]:
+            self.config()["write_ahead_log"] = write_ahead_log
+            db.release_connection()
+            manifests.append(db.backup(background=write_ahead_log))
+            db.wait_for_backup()
+            assert manifests[-1].endswith(".manifest")
+            statistics = db.backup_statistics()
+            assert statistics["chunks"] > 10
+            time.sleep(1)  # Backups are named by the second.
+        # Only the chunks which changed get written.
+        assert statistics["chunks_written"] < statistics["chunks"] // 2
+        db.con.execute("delete from cards where _id>100")
+        db.save()
+        assert db.card_count() == 100
+        db.restore(manifests[0])
+        assert db.card_count() == 200
+        con = sqlite3.connect(db.path())
+        assert con.execute("pragma integrity_check").fetchone()[0] == "ok"
+        con.close()
+        # A damaged backup leaves the current database alone.
+        db.con.execute("delete from cards where _id>100")
+        db.save()
+        chunk_dir = os.path.join(backup_dir, "chunks")
+        chunk_files = [os.path.join(root, f) for root, dirs, files in \
+            os.walk(chunk_dir) for f in files]
+        for chunk_file in chunk_files:
+            with open(chunk_file, "wb") as f:
+                f.write(b"garbage")
+        with raises(RuntimeError):
+            db.restore(manifests[1])
+        assert db.is_loaded()
+        assert db.card_count() == 100
+        # Chunks which are no longer used by any backup get removed.
+        for chunk_file in chunk_files:
+            os.remove(chunk_file)
+        db.backup()
+        time.sleep(1)
+        db.backup()
+        assert len([f for f in os.listdir(backup_dir) \
+            if f.endswith(".manifest")]) == 2
+        manifest = db.backup_statistics()["file"]
+        for key in ["00" * 32, "01" * 32, "02" * 32]:
+            os.makedirs(os.path.join(chunk_dir, key[:2]), exist_ok=True)
+            open(os.path.join(chunk_dir, key[:2], key), "wb").close()
+        assert db.collect_backup_garbage() == 3
+        assert db.collect_backup_garbage() == 0
+        db.restore(manifest)
+        assert db.card_count() == 100
+
+    def test_separate_log_database(self):
+        import sqlite3
+        import threading
+        from openSM2sync.binary_formats.mnemosyne_format import \
+             MnemosyneFormat
+        db = self.database()
+        card_type = self.card_type_with_id("1")
+        for i in range(10):
+            self.controller().create_new_cards({"f": "question %d" % i,
+                "b": "answer %d" % i}, card_type, grade=4,
+                tag_names=["default"], check_for_duplicates=False)
+        log_count = db.con.execute("select count() from log").fetchone()[0]
+        last_log_id = db.current_log_index()
+        self.config()["separate_log_database"] = True
+        # Getting interrupted after copying the log, but before dropping it
+        # from the main database, loses nothing.
+        drop_log_script = db._drop_log_script
+        def interrupted_drop_log_script(con, schema):
+            if schema == "main":
+                raise KeyboardInterrupt
+            return drop_log_script(con, schema)
+        db._drop_log_script = interrupted_drop_log_script
+        with raises(KeyboardInterrupt):
+            db.load(db.path())
+        del db._drop_log_script
+        path = db.path()
+        db.abandon()
+        for filename in [path, path + "-log"]:
+            con = sqlite3.connect(filename)
+            assert con.execute("select count() from log").fetchone()[0] == \
+                log_count
+            con.close()
+        db.load(path)
+        assert db.has_separate_log_database()
+        con = sqlite3.connect(db.path())
+        assert not con.execute("""select count() from sqlite_master where
+            name='log'""").fetchone()[0]
+        con.close()
+        assert db.con.execute("select count() from log").fetchone()[0] == \
+            log_count
+        # Log ids are never reused.
+        db.log_warn_about_too_many_cards(time.time())
+        assert db.current_log_index() == last_log_id + 1
+        # Reads from other threads see the log as well.
+        self.config()["write_ahead_log"] = True
+        db.release_connection()
+        assert db.allows_concurrent_reads()
+        counts = []
+        thread = threading.Thread(target=lambda: counts.append(\
+            db.read_con.execute("select count() from log").fetchone()[0]))
+        thread.start()
+        thread.join()
+        assert counts == [log_count + 1]
+        self.config()["write_ahead_log"] = False
+        db.release_connection()
+        # Plain backups keep a copy of the log database next to them.
+        backupfile = db.backup()
+        assert os.path.exists(backupfile + "-log")
+        db.con.execute("delete from log")
+        db.save()
+        db.restore(backupfile)
+        assert db.con.execute("select count() from log").fetchone()[0] == \
+            log_count + 1
+        time.sleep(1)  # Backups are named by the second.
+        # So do incremental ones, in their manifest.
+        self.config()["incremental_backups"] = True
+        manifest = db.backup()
+        db.con.execute("delete from log")
+        db.save()
+        db.restore(manifest)
+        assert db.con.execute("select count() from log").fetchone()[0] == \
+            log_count + 1
+        self.config()["incremental_backups"] = False
+        # The entire database sent to sync partners is self-contained.
+        for interested_in_old_reps in [True, False]:
+            binary_format = MnemosyneFormat(db)
+            filename = binary_format.binary_filename(True,
+                interested_in_old_reps)
+            con = sqlite3.connect(filename)
+            repetitions = con.execute("""select count() from log where
+                event_type=?""", (EventTypes.REPETITION, )).fetchone()[0]
+            assert (repetitions != 0) == interested_in_old_reps
+            assert con.execute("pragma integrity_check").fetchone()[0] == "ok"
+            con.close()
+            binary_format.clean_up()
+        # A database with its own log, e.g. received from a sync partner,
+        # replaces the separate one.
+        path = db.path()
+        shutil.copy(path, path + ".tmp")
+        db.copy_log_into(path + ".tmp")
+        con = sqlite3.connect(path + ".tmp")
+        con.execute("delete from log where _id=?", (last_log_id + 1, ))
+        con.commit()
+        con.close()
+        db.abandon()
+        os.replace(path + ".tmp", path)
+        db.load(path)
+        assert db.has_separate_log_database()
+        assert db.con.execute("select count() from log").fetchone()[0] == \
+            log_count
+        # Moving back.
+        self.config()["separate_log_database"] = False
+        db.load(path)
+        assert not db.has_separate_log_database()
+        assert db.con.execute("select count() from log").fetchone()[0] == \
+            log_count
+        db.log_warn_about_too_many_cards(time.time())
+        assert db.current_log_index() == last_log_id + 2
+
+    def test_backup_separate_log_while_writing(self):
+        import sqlite3
+        db = self.database()
+        card_type = self.card_type_with_id("1")
+        for i in range(200):
+            self.controller().create_new_cards({"f": "question %d" % i,
+                "b": "answer %d" % i * 20}, card_type, grade=-1,
+                tag_names=["default"], check_for_duplicates=False,
+                save=False)
+        self.config()["separate_log_database"] = True
+        db.load(db.path())
+        db.backup_pages_per_step = 1
+        for write_ahead_log in [False, True]:
+            self.config()["write_ahead_log"] = write_ahead_log
+            db.release_connection()
+            db.con.execute("update cards set grade=0")
+            db.save()
+            calls = []
+            def progress(remaining, total):
+                # Once the main database has been copied, another connection
+                # writes to both the cards and the log in one transaction.
+                if remaining == 0 and not calls:
+                    con = sqlite3.connect(db.path())
+                    con.execute("attach database ? as log_database",
+                        (db.log_database_path(), ))
+                    con.execute("update cards set grade=5")
+                    con.execute("""insert into log(event_type, timestamp,
+                        object_id) values(?,?,?)""",
+                        (EventTypes.REPETITION, 0, "marker"))
+                    con.commit()
+                    con.close()
+                    calls.append((remaining, total))
+            backupfile = db.backup(background=True, progress=progress)
+            assert db.wait_for_backup() == backupfile
+            assert calls
+            con = sqlite3.connect(backupfile)
+            con.execute("attach database ? as log_database",
+                (backupfile + "-log", ))
+            grades = con.execute("select distinct grade from cards").fetchall()
+            markers = con.execute("""select count() from log
+                where object_id='marker'""").fetchone()[0]
+            con.close()
+            # Either the entire transaction is in the backup, or nothing.
+            assert len(grades) == 1
+            assert (grades[0][0] == 5) == (markers == 1)
+            db.con.execute("delete from log where object_id='marker'")
+            time.sleep(1)  # Backups are named by the second.
+
+    def test_interned_log_object_ids(self):
+        import sqlite3
+        from openSM2sync.binary_formats.mnemosyne_format import \
+             MnemosyneFormat
+        db = self.database()
+        card_type = self.card_type_with_id("1")
+        cards = []
+        for i in range(10):
+            cards += self.controller().create_new_cards({"f": "question %d" \
+                % i, "b": "answer %d" % i}, card_type, grade=-1,
+                tag_names=["default"], check_for_duplicates=False)
+        for card in cards[:5]:
+            self.scheduler().grade_answer(card, 4)
+            db.update_card(card)
+        for grade in [0, 2]:
+            self.scheduler().grade_answer(cards[0], grade)
+            db.update_card(cards[0])
+        db.delete_card(cards[-1])
+        db.sync_partner_info = {}
+        log_entries = [dict(log_entry) for log_entry in db.all_log_entries()]
+        newly_learned = sorted(db.fact_ids_newly_learned_today(0, 2**40))
+        assert len(newly_learned) == 5
+        relearned = list(db.fact_ids_forgotten_and_learned_today(0, 2**40))
+        assert relearned == [cards[0].fact._id]
+        last_log_id = db.current_log_index()
+        self.config()["intern_log_object_ids"] = True
+        db.load(db.path())
+        assert db.has_interned_log()
+        assert db.con.execute("""select count() from interned_log where
+            typeof(_object_id)='text'""").fetchone()[0] == 0
+        # Sync partners and the science server still get the ids, also of
+        # deleted objects.
+        assert [dict(log_entry) for log_entry in db.all_log_entries()] == \
+            log_entries
+        self.config()["upload_science_logs"] = True
+        db.dump_to_science_log()
+        self.config()["upload_science_logs"] = False
+        with open(os.path.join(self.config().data_dir, "log.txt")) as f:
+            assert cards[-1].id in f.read()
+        assert sorted(db.fact_ids_newly_learned_today(0, 2**40)) == \
+            newly_learned
+        assert list(db.fact_ids_forgotten_and_learned_today(0, 2**40)) == \
+            relearned
+        # New log entries get interned too.
+        db.log_warn_about_too_many_cards(time.time())
+        self.scheduler().grade_answer(cards[6], 4)
+        db.update_card(cards[6])
+        assert db.current_log_index() == last_log_id + 3
+        assert db.con.execute("""select object_id from log where
+            event_type=? and _id>?""", (EventTypes.REPETITION, last_log_id)).\
+            fetchone()[0] == cards[6].id
+        assert db.average_thinking_time(cards[6]) == \
+            db.con.execute("""select thinking_time from log where
+            _id=?""", (last_log_id + 2, )).fetchone()[0]
+        db.con.execute("delete from log where _id=?", (last_log_id + 3, ))
+        log_entries = [dict(log_entry) for log_entry in db.all_log_entries()]
+        # The entire database sent to sync partners has the usual layout.
+        binary_format = MnemosyneFormat(db)
+        filename = binary_format.binary_filename(True, True)
+        con = sqlite3.connect(filename)
+        assert con.execute("""select count() from sqlite_master where
+            type='table' and name='log'""").fetchone()[0] == 1
+        assert con.execute("""select event_type from log where
+            object_id=? order by _id""", (cards[-1].id, )).fetchall() == \
+            [(EventTypes.ADDED_CARD, ), (EventTypes.DELETED_CARD, )]
+        con.close()
+        binary_format.clean_up()
+        # Also when combined with a separate log database.
+        self.config()["separate_log_database"] = True
+        db.load(db.path())
+        assert db.has_separate_log_database() and db.has_interned_log()
+        assert [dict(log_entry) for log_entry in db.all_log_entries()] == \
+            log_entries
+        # Moving back.
+        self.config()["separate_log_database"] = False
+        self.config()["intern_log_object_ids"] = False
+        db.load(db.path())
+        assert not db.has_interned_log()
+        assert [dict(log_entry) for log_entry in db.all_log_entries()] == \
+            log_entries
+        # Log ids are never reused.
+        db.log_warn_about_too_many_cards(time.time())
+        assert db.current_log_index() == last_log_id + 4
+
     def test_link_inverse_cards(self):
         fact_data = {"f": "question",
                      "b": "answer"}
@@ -733,6 +1460,29 @@ class TestDatabase(MnemosyneTest):
         assert "DUPLICATE" in card_2.tag_string()
         assert "DUPLICATE" not in card_3.tag_string()
 
+    def test_tag_all_duplicates_unique_keys(self):
+        db = self.database()
+        card_type_1 = self.card_type_with_id("1")
+        card_type_2 = self.card_type_with_id("2")
+        _card_ids = {}
+        for name, fact_data, card_type in [\
+            ("a", {"f": "a", "b": "same"}, card_type_1),
+            ("b", {"f": "b", "b": "same"}, card_type_1),
+            ("c", {"f": "a", "b": "other"}, card_type_2),
+            ("d", {"f": "d", "b": "d"}, card_type_1),
+            ("e", {"f": "e", "b": "e"}, card_type_1),
+            ("f", {"f": "d", "b": "f"}, card_type_1)]:
+            _card_ids[name] = self.controller().create_new_cards(fact_data,
+                card_type, grade=-1, tag_names=["default"],
+                check_for_duplicates=False)[0]._id
+        # Simulate a hash collision.
+        db.con.execute("""update data_hashes_for_fact set hash=? where
+            key='f'""", (db._data_hash("f", "d"), ))
+        db.tag_all_duplicates()
+        duplicates = [name for name in sorted(_card_ids) if "DUPLICATE" in \
+            db.card(_card_ids[name], is_id_internal=True).tag_string()]
+        assert duplicates == ["d", "f"]
+
     def test_is_accessible(self):
     #    from threading import Thread
     #    import time
@@ -766,6 +1516,349 @@ class TestDatabase(MnemosyneTest):
         assert card_1.id == "id"
         assert card_2.id == "id.1"
 
+    def test_upgrade_3(self):
+        self.database().con.execute("drop index i_cards_4")
+        self.database().con.execute("drop index i_cards_5")
+        self.database().con.execute(\
+            "update global_variables set value='4' where key='version'")
+        self.database().release_connection()
+        self.database().load(self.config()["last_database"])
+        indices = [cursor[0] for cursor in self.database().con.execute(\
+            "select name from sqlite_master where type='index'")]
+        assert "i_cards_4" in indices
+        assert "i_cards_5" in indices
+        assert self.database().con.execute("""select value from
+            global_variables where key='version'""").fetchone()[0] == "6"
+
+    def test_upgrade_4(self):
+        fact_data = {"f": "question",
+                     "b": "answer"}
+        card_type = self.card_type_with_id("1")
+        card = self.controller().create_new_cards(fact_data, card_type,
+            grade=-1, tag_names=["default"], check_for_duplicates=False)[0]
+        self.database().con.execute("drop table data_hashes_for_fact")
+        self.database().con.execute(\
+            "update global_variables set value='5' where key='version'")
+        self.database().release_connection()
+        self.database().load(self.config()["last_database"])
+        assert self.database().con.execute(\
+            "select count() from data_hashes_for_fact").fetchone()[0] == 2
+        assert [fact._id for fact in self.database().duplicates_for_fact(\
+            Fact({"f": "question"}), card_type)] == [card.fact._id]
+
+    def test_query_plans(self):
+        # Make sure the scheduler queries don't need to scan the entire cards
+        # table. When adding queries to the scheduler, add them here too.
+        fact_data = {"f": "question",
+                     "b": "answer"}
+        card_type = self.card_type_with_id("2")
+        self.controller().create_new_cards(fact_data, card_type,
+            grade=4, tag_names=["default"])
+        db = self.database()
+        now = int(time.time())
+        statements = []
+        con = db.con
+        execute = con.execute
+        def record(sql, *args):
+            statements.append((sql, args))
+            return execute(sql, *args)
+        con.execute = record
+        try:
+            for sort_key in ["interval", "random"]:
+                list(db.cards_due_for_ret_rep(now, sort_key=sort_key,
+                    limit=50))
+            for grade in [0, 1]:
+                list(db.cards_to_relearn(grade, sort_key="-interval"))
+                list(db.cards_new_memorising(grade))
+            for sort_key in ["", "random"]:
+                list(db.cards_unseen(sort_key=sort_key, limit=50))
+            list(db.cards_learn_ahead(now, sort_key="next_rep", limit=50))
+            db.scheduled_count(now)
+            db.non_memorised_count()
+            db.active_count()
+        finally:
+            del con.execute
+        assert len(statements) == 12
+        for sql, args in statements:
+            for cursor in con.execute("explain query plan " + sql, *args):
+                detail = cursor[-1]
+                assert not detail.startswith("SCAN") or "INDEX" in detail, \
+                    (sql, detail)
+
+    def test_statement_statistics(self):
+        import json
+        from mnemosyne.libmnemosyne.databases._statement_statistics import \
+             StatementStatistics, LATENCY_BUCKETS
+        assert StatementStatistics.normalise("""select _id from  cards
+            where _id in (1, 2, 3) and question='a''b' and grade>-1""") == \
+            "select _id from cards where _id in (...) and question=? and grade>?"
+        statistics = StatementStatistics(slow_threshold=0.5,
+            max_slow_statements=2)
+        for _id, elapsed in [(1, 0.00005), (2, 0.005), (3, 2.0)]:
+            statistics.record("select * from cards where _id=%d" % _id,
+                elapsed)
+        statistics.record("update cards set grade=?", 0.02, (1, ))
+        report = statistics.report()
+        assert report["buckets"] == list(LATENCY_BUCKETS)
+        assert len(report["statements"]) == 2
+        # Sorted by total time.
+        entry = report["statements"][0]
+        assert entry["sql"] == "select * from cards where _id=?"
+        assert entry["count"] == 3
+        assert entry["max"] == 2.0
+        assert abs(entry["total"] - 2.00505) < 1e-9
+        assert entry["histogram"] == [1, 0, 1, 0, 0, 1]
+        assert report["statements"][1]["histogram"] == [0, 0, 0, 1, 0, 0]
+        assert len(report["slow_statements"]) == 1
+        assert report["slow_statements"][0]["sql"] == \
+            "select * from cards where _id=3"
+        # The ring buffer only keeps the last ones.
+        for i in range(3):
+            statistics.record("delete from cards where _id=?", 1.0 + i, (i, ))
+        assert [entry["args"] for entry in \
+            statistics.report()["slow_statements"]] == ["(1,)", "(2,)"]
+        statistics.reset()
+        assert statistics.report()["statements"] == []
+        assert statistics.report()["slow_statements"] == []
+        # Through the database.
+        db = self.database()
+        assert db.statement_statistics() is None
+        assert db.dump_statement_statistics() is None
+        self.config()["profile_database_statements"] = True
+        self.config()["slow_statement_threshold"] = 0
+        db.release_connection()
+        card_type = self.card_type_with_id("1")
+        self.controller().create_new_cards({"f": "question", "b": "answer"},
+            card_type, grade=-1, tag_names=["default"])
+        db.con.execute("select _id from cards where id=?", ("abc", ))
+        report = db.statement_statistics()
+        assert "select _id from cards where id=?" in \
+            [entry["sql"] for entry in report["statements"]]
+        slow = [entry for entry in report["slow_statements"] if \
+            entry["sql"] == "select _id from cards where id=?"][0]
+        assert slow["plan"][0].startswith("SEARCH cards USING") and \
+            "i_cards " in slow["plan"][0]
+        filename = db.dump_statement_statistics()
+        with open(filename) as f:
+            assert json.load(f)["statements"]
+        db.reset_statement_statistics()
+        assert db.statement_statistics()["statements"] == []
+        self.config()["profile_database_statements"] = False
+        db.release_connection()
+
+    def test_search_cards(self):
+        db = self.database()
+        assert db.has_search_index()
+        card_type = self.card_type_with_id("1")
+        cards = []
+        for question, answer in [("Apple pie", "Appeltaart"),
+            ("apple tree", "Appelboom"), ("pear", "Peer"),
+            ("\u82f9\u679c\u6811", "apple tree"), ("100% sure", "Zeker"),
+            ('a "quoted" word', "x_y")]:
+            cards += self.controller().create_new_cards(\
+                {"f": question, "b": answer}, card_type, grade=-1,
+                tag_names=["fruit"])
+        def like(query):
+            return [cursor[0] for cursor in db.con.execute(\
+                """select _id from cards where question like ? or
+                answer like ? order by _id""", ("%" + query + "%", ) * 2)]
+        queries = ["apple", "APPLE TREE", "ppel", "\u679c\u6811", "pe",
+            "100%", "x_y", "p_e", '"quoted"', "fruit", "nothing"]
+        for query in queries:
+            assert db.search_cards(query) == like(query)
+        assert db.search_cards("apple") == [cards[0]._id, cards[1]._id,
+            cards[3]._id]
+        assert db.search_cards("apple", limit=1, offset=1) == [cards[1]._id]
+        # Tags are indexed as well, but not searched by default.
+        assert db.con.execute("""select count() from cards_fts where
+            cards_fts match 'tags : fruit'""").fetchone()[0] == len(cards)
+        # Editing, retagging and deleting keep the index in sync.
+        self.controller().edit_card_and_sisters(cards[2],
+            {"f": "pineapple", "b": "Ananas"}, card_type,
+            new_tag_names=["tropical"], correspondence=[])
+        assert cards[2]._id in db.search_cards("apple")
+        assert db.search_cards("pear") == []
+        tag = db.get_or_create_tag_with_name("tropical")
+        tag.name = "exotic"
+        db.update_tag(tag)
+        assert db.con.execute("""select rowid from cards_fts where
+            cards_fts match 'tags : exotic'""").fetchall() == [(cards[2]._id, )]
+        self.controller().delete_facts_and_their_cards([cards[0].fact])
+        assert db.search_cards("apple") == [cards[1]._id, cards[2]._id,
+            cards[3]._id]
+        for query in queries:
+            assert db.search_cards(query) == like(query)
+        # Fallback.
+        db._search_index_available = False
+        for query in queries:
+            assert db.search_cards(query) == like(query)
+        db._search_index_available = True
+        assert db.con.execute(\
+            "insert into cards_fts(cards_fts) values('integrity-check')")
+
+    def test_defer_pregenerated_data(self):
+        db = self.database()
+        self.config()["defer_pregenerated_data"] = True
+        card_type = self.card_type_with_id("2")
+        cards = []
+        for i in range(5):
+            cards += self.controller().create_new_cards({"f": "apple %d" % i,
+                "b": "pear %d" % i}, card_type, grade=-1, tag_names=["fruit"])
+        cards += self.controller().create_new_cards_bulk([({"f": "kiwi",
+            "b": "lime"}, card_type, ["exotic"])], grade=-1)[0]
+        def stale_count():
+            return db.con.execute("""select count() from
+                stale_pregenerated_data""").fetchone()[0]
+        assert db.has_stale_pregenerated_data()
+        assert stale_count() == len(cards)
+        # A few at a time, like the heartbeat does.
+        assert db.regenerate_pregenerated_data(limit=4) == 4
+        assert stale_count() == len(cards) - 4
+        # Searching sees all the cards.
+        assert db.search_cards("pear") == [card._id for card in cards[:10]]
+        assert not db.has_stale_pregenerated_data()
+        for card in cards:
+            assert db.con.execute(\
+                "select question, answer, tags from cards where _id=?",
+                (card._id, )).fetchone() == (card.question("plain_text"),
+                card.answer("plain_text"), card.tag_string())
+        # Editing.
+        self.controller().edit_card_and_sisters(cards[0],
+            {"f": "pineapple", "b": "ananas"}, card_type,
+            new_tag_names=["fruit"], correspondence=[])
+        assert stale_count() == 2
+        assert db.search_cards("ananas") == [cards[0]._id, cards[1]._id]
+        # Stale cards left over when closing are dealt with.
+        self.controller().edit_card_and_sisters(cards[2],
+            {"f": "banana", "b": "pear 1"}, card_type,
+            new_tag_names=["fruit"], correspondence=[])
+        db.load(db.path())
+        assert stale_count() == 0
+        db.con.execute("""insert into stale_pregenerated_data(_card_id)
+            values(?)""", (cards[2]._id, ))
+        db.con.execute("update cards set question='' where _id=?",
+            (cards[2]._id, ))
+        db.save()
+        db.abandon()
+        db.load(self.config()["last_database"])
+        assert db.has_stale_pregenerated_data()
+        assert db.search_cards("banana") == [cards[2]._id, cards[3]._id]
+        # Deleted cards.
+        self.controller().delete_facts_and_their_cards([cards[2].fact])
+        db._mark_pregenerated_data_stale([cards[2]._id])
+        assert db.regenerate_pregenerated_data() == 1
+        assert stale_count() == 0
+        # Without deferring.
+        self.config()["defer_pregenerated_data"] = False
+        self.controller().edit_card_and_sisters(cards[4],
+            {"f": "cherry", "b": "plum"}, card_type,
+            new_tag_names=["fruit"], correspondence=[])
+        assert stale_count() == 0
+        assert not db.has_stale_pregenerated_data()
+
+    def test_rebuild_search_index(self):
+        db = self.database()
+        card_type = self.card_type_with_id("1")
+        card = self.controller().create_new_cards(\
+            {"f": "question", "b": "answer"}, card_type, grade=-1,
+            tag_names=["default"])[0]
+        # Simulate a database from before the search index.
+        for name in ["cards_fts_insert", "cards_fts_delete",
+                     "cards_fts_update"]:
+            db.con.execute("drop trigger %s" % name)
+        db.con.execute("drop table cards_fts")
+        db.save()
+        db.release_connection()
+        db.load(self.config()["last_database"])
+        assert db.search_cards("quest") == [card._id]
+        # Index out of sync.
+        db.con.execute("insert into cards_fts(cards_fts) values('delete-all')")
+        assert db.search_cards("quest") == []
+        db.rebuild_search_index()
+        assert db.search_cards("quest") == [card._id]
+        assert db.search_cards("answ") == [card._id]
+
+    def test_data_codec(self):
+        from mnemosyne.libmnemosyne.utils import encode_data, decode_data, \
+             decode_data_with_version, DATA_CODEC_VERSION
+        for data in [{}, [], "", 1, -2.5, None, True, "\u82f9'\"",
+            {"a": [1, "b", None], "c": {"d": False}},
+            [("f", "Front"), ("b", "Back")],
+            (set(), {2, 3}, {("1", "1::1"), ("2", "2::1")}),
+            {1: "one", (2, 3): {"x"}}, b"\x00\xff",
+            {"__tuple__": 1, "other": 2}]:
+            text = encode_data(data)
+            assert decode_data_with_version(text) == (data,
+                DATA_CODEC_VERSION)
+            assert type(decode_data(text)) == type(data)
+            # Legacy format.
+            assert decode_data(repr(data)) == data
+        assert encode_data({3, 1, 2}) == encode_data({2, 3, 1})
+        assert decode_data_with_version("{'a': (1, 2)}") == \
+            ({"a": (1, 2)}, 0)
+        assert decode_data("(set([]), set([1]), set([]))") == \
+            (set(), {1}, set())
+        # No code gets executed.
+        with raises(ValueError):
+            decode_data("__import__('os').getcwd()")
+        with raises(ValueError):
+            decode_data("set(__import__('os').getcwd())")
+
+    def test_data_codec_migration(self):
+        from mnemosyne.libmnemosyne.utils import decode_data_with_version
+        db = self.database()
+        card_type = self.card_type_with_id("1")
+        card_1, = self.controller().create_new_cards({"f": "1", "b": "1"},
+            card_type, grade=-1, tag_names=["default"])
+        card_2, = self.controller().create_new_cards({"f": "2", "b": "2"},
+            card_type, grade=-1, tag_names=["default"])
+        card_type_2 = self.controller().clone_card_type(card_type, "my_1")
+        criterion = DefaultCriterion(self.mnemosyne.component_manager)
+        criterion.name = "saved"
+        criterion._tag_ids_active = set([db.get_or_create_tag_with_name(\
+            "default")._id])
+        db.add_criterion(criterion)
+        db.save()
+        # Simulate a database written by an older version.
+        for _card_id in [card_1._id, card_2._id]:
+            db.con.execute("update cards set extra_data=? where _id=?",
+                (repr({"x": (1, 2)}), _card_id))
+        db.con.execute("""update card_types set fact_keys_and_names=?,
+            unique_fact_keys=? where id=?""", (repr([("f", "Front"),
+            ("b", "Back")]), "['f']", card_type_2.id))
+        db.con.execute("update criteria set data=? where _id=?",
+            ("(set([]), set([%d]), set([]))" % tuple(\
+            criterion._tag_ids_active), criterion._id))
+        db.save()
+        db.unload()
+        db.load(self.config()["last_database"])
+        card_1 = db.card(card_1._id, is_id_internal=True)
+        card_2 = db.card(card_2._id, is_id_internal=True)
+        assert card_1.extra_data == {"x": (1, 2)}
+        card_type_2 = db.card_type(card_type_2.id, is_id_internal=False)
+        assert card_type_2.fact_keys_and_names == [("f", "Front"),
+            ("b", "Back")]
+        assert card_type_2.unique_fact_keys == ["f"]
+        criterion = db.criterion(criterion._id, is_id_internal=True)
+        assert criterion._tag_ids_active == \
+            set([db.get_or_create_tag_with_name("default")._id])
+        # Modified in the mean time, so should not be overwritten.
+        card_2.extra_data = {"y": 1}
+        db.update_card(card_2)
+        db.save()
+        versions = [decode_data_with_version(cursor[0])[1] for cursor in \
+            db.con.execute("""select extra_data from cards where _id=?
+            union all select fact_keys_and_names from card_types where id=?
+            union all select unique_fact_keys from card_types where id=?
+            union all select data from criteria where _id=?""",
+            (card_1._id, card_type_2.id, card_type_2.id, criterion._id))]
+        assert versions == [1, 1, 1, 1]
+        db.clear_object_caches()
+        assert db.card(card_1._id, is_id_internal=True).extra_data == \
+            {"x": (1, 2)}
+        assert db.card(card_2._id, is_id_internal=True).extra_data == \
+            {"y": 1}
+
     def test_known_recognition(self):
         card_type = self.card_type_with_id("3")
         self.controller().clone_card_type(card_type, "my_3")
@@ -378,6 +378,16 @@ class TestMnemosyne1XMLImport(MnemosyneTest):
         self.review_controller().reset()
         assert len(self.review_controller().card.tags) == 2
 
+    def test_tags_hierarchy(self):
+        global answer
+        answer = 0
+        filename = os.path.join(os.getcwd(), "tests", "files",
+                                "tag_hierarchy.xml")
+        self.xml_importer().do_import(filename, extra_tag_names="a")
+        self.review_controller().reset()
+        assert [tag.name for tag in self.review_controller().card.tags] \
+            == ["a::b"]
+
     def test_log(self):
         global answer
         answer = 0
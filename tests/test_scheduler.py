@@ -770,3 +770,276 @@ class TestScheduler(MnemosyneTest):
 
 
         
+
+    def test_in_memory_due_index(self):
+        from mnemosyne.libmnemosyne.databases import SQLite_due_index
+        numpy = SQLite_due_index.numpy
+        SQLite_due_index.numpy = None
+        try:
+            self._test_in_memory_due_index()
+        finally:
+            SQLite_due_index.numpy = numpy
+
+    def test_in_memory_due_index_numpy(self):
+        import pytest
+        from mnemosyne.libmnemosyne.databases import SQLite_due_index
+        if SQLite_due_index.numpy is None:
+            pytest.skip("numpy not installed")
+        self._test_in_memory_due_index()
+
+    def _test_in_memory_due_index(self):
+        import random
+        from mnemosyne.libmnemosyne.criteria.default_criterion import \
+             DefaultCriterion
+        rng = random.Random(0)
+        db = self.database()
+        sch = self.scheduler()
+        card_type = self.card_type_with_id("2")
+        for i in range(150):
+            fact_data = {"f": "question%d" % i,
+                         "b": "answer%d" % i}
+            self.controller().create_new_cards(fact_data, card_type,
+                grade=-1, tag_names=[rng.choice(["a", "b"])])
+        self.config()["shown_backlog_help"] = True
+        self.config()["randomise_scheduled_cards"] = False
+        self.config()["randomise_new_cards"] = False
+        self.config()["max_ret_reps_since_lapse"] = 4
+        # Load the index first, such that it needs to follow the changes.
+        self.config()["in_memory_due_index"] = True
+        assert len(db.due_index()) == 300
+
+        def queues(learn_ahead):
+            result = []
+            for stage in range(1, 6):
+                sch.stage = stage
+                sch._fact_ids_memorised = []
+                # The shuffling in stages 2 and 3 should match too.
+                random.seed(stage)
+                sch.rebuild_queue(learn_ahead)
+                result.append((sch.stage, sch._card_ids_in_queue))
+            return result
+
+        def compare():
+            for learn_ahead in [False, True]:
+                self.config()["in_memory_due_index"] = True
+                from_index = queues(learn_ahead)
+                self.config()["in_memory_due_index"] = False
+                assert queues(learn_ahead) == from_index
+            self.config()["in_memory_due_index"] = True
+            assert len(db.due_index()) == db.active_count()
+
+        now = int(time.time())
+        for repeat in range(3):
+            cards = db.cards_with_internal_ids([cursor[0] for cursor in \
+                db.con.execute("select _id from cards")])
+            # Include plenty of ties, which are broken by the _ids.
+            next_reps = [rng.choice(range(now - 50 * DAY, now + 50 * DAY,
+                DAY)) for i in range(300)]
+            intervals = [rng.choice(range(DAY, 20 * DAY, DAY)) \
+                for i in range(300)]
+            for card, next_rep, interval in zip(cards, next_reps, intervals):
+                card.grade = rng.choice([-1, 0, 1, 2, 3, 4, 5])
+                card.lapses = rng.choice([0, 0, 1, 2])
+                card.ret_reps_since_lapse = rng.randint(0, 6)
+                card.next_rep = next_rep
+                card.last_rep = next_rep - interval
+                db.update_card(card, repetition_only=True)
+            for in_hand in [1, 5, 50]:
+                self.config()["non_memorised_cards_in_hand"] = in_hand
+                compare()
+        # Criterion changes.
+        c = DefaultCriterion(self.mnemosyne.component_manager)
+        c.deactivated_card_type_fact_view_ids = \
+            set([(card_type.id, card_type.fact_views[0].id)])
+        c._tag_ids_active = set([db.get_or_create_tag_with_name("a")._id])
+        c._tag_ids_forbidden = set()
+        db.set_current_criterion(c)
+        compare()
+        # Grading and deleting.
+        for i in range(20):
+            card = sch.next_card()
+            sch.grade_answer(card, rng.choice([0, 1, 2, 5]))
+            db.update_card(card, repetition_only=True)
+        self.controller().delete_facts_and_their_cards(\
+            [card.fact for card in db.cards_with_internal_ids(range(1, 40))])
+        compare()
+
+    def test_background_queue_rebuild(self):
+        import random
+        import shutil
+        import itertools
+        from mnemosyne.libmnemosyne.criteria.default_criterion import \
+             DefaultCriterion
+        rng = random.Random(0)
+        db = self.database()
+        sch = self.scheduler()
+        card_type = self.card_type_with_id("2")
+        for i in range(500):
+            fact_data = {"f": "question%d" % i,
+                         "b": "answer%d" % i}
+            self.controller().create_new_cards(fact_data, card_type,
+                grade=-1, tag_names=[rng.choice(["a", "a", "a", "b"])],
+                save=False)
+        now = int(time.time())
+        for card in db.cards_with_internal_ids(range(1, 301)):
+            card.grade = 4
+            card.easiness = 2.5
+            card.acq_reps = 1
+            card.ret_reps = card.ret_reps_since_lapse = rng.randint(1, 5)
+            card.last_rep = now - rng.randint(10, 100) * DAY
+            card.next_rep = sch.midnight_UTC(now - rng.randint(1, 9) * DAY)
+            db.update_card(card, repetition_only=True)
+        self.config()["shown_backlog_help"] = True
+        self.config()["randomise_scheduled_cards"] = False
+        self.config()["randomise_new_cards"] = False
+        db.save()
+        path = db.path()
+        shutil.copy(path, path + ".orig")
+        snapshots_used = []
+        queue_snapshot = db.queue_snapshot
+        def counting_queue_snapshot(timestamp, start_of_day):
+            snapshot = queue_snapshot(timestamp, start_of_day)
+            snapshots_used.append(snapshot is not None)
+            return snapshot
+        db.queue_snapshot = counting_queue_snapshot
+
+        def review(background, wait, save_after_n_reps=10):
+            db.abandon()
+            for suffix in ["-wal", "-shm"]:
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            shutil.copy(path + ".orig", path)
+            self.config()["write_ahead_log"] = background
+            self.config()["background_queue_rebuild"] = background
+            self.config()["save_after_n_reps"] = save_after_n_reps
+            db.load(path)
+            random.seed(0)
+            grades = random.Random(1)
+            review_controller = self.review_controller()
+            review_controller.reset()
+            result = []
+            for i in range(1000):
+                card = review_controller.card
+                # Compare the contents of the card as well, as that could come
+                # from the data read in the background.
+                result.append((card._id, card.fact["f"], card.grade))
+                if wait:
+                    db.wait_for_queue_snapshot()
+                if i % 100 == 30:
+                    # Editing the facts of cards which could be next.
+                    for _card_id, _fact_id in itertools.chain(\
+                        db.cards_due_for_ret_rep(sch.adjusted_now(),
+                        sort_key="interval", limit=2),
+                        db.cards_new_memorising(grade=0, limit=2),
+                        db.cards_unseen(limit=2)):
+                        fact = db.fact(_fact_id, is_id_internal=True)
+                        fact["f"] += "_edited"
+                        db.update_fact(fact)
+                if i % 100 == 60:
+                    # Changing the eligibility of a card not yet in the queue.
+                    for _card_id, _fact_id in db.cards_unseen(limit=1):
+                        card = db.card(_card_id, is_id_internal=True)
+                        card.active = False
+                        db.update_card(card)
+                if i == 500:
+                    c = DefaultCriterion(self.mnemosyne.component_manager)
+                    c._tag_ids_active = \
+                        set([db.get_or_create_tag_with_name("a")._id])
+                    c._tag_ids_forbidden = set()
+                    db.set_current_criterion(c)
+                    review_controller.reset_but_try_to_keep_current_card()
+                review_controller.grade_answer(grades.choice(\
+                    [0, 1, 2, 3, 4, 5]))
+            return result
+
+        synchronous = review(background=False, wait=False)
+        assert not any(snapshots_used)
+        assert len(set(_card_id for _card_id, f, grade in synchronous)) > 400
+        del snapshots_used[:]
+        assert review(background=True, wait=True) == synchronous
+        assert snapshots_used.count(True) > 10
+        # Without waiting for the worker thread, the snapshot gets used less
+        # often, but it should not make a difference either.
+        assert review(background=True, wait=False) == synchronous
+        # The snapshot gets started while the last reviews are not saved yet.
+        del snapshots_used[:]
+        assert review(background=True, wait=True,
+            save_after_n_reps=100) == synchronous
+        assert snapshots_used.count(True) > 10
+
+    def test_grade_answers(self):
+        import random
+        import shutil
+        from openSM2sync.log_entry import EventTypes
+        rng = random.Random(0)
+        db = self.database()
+        sch = self.scheduler()
+        card_type = self.card_type_with_id("2")
+        for i in range(20):
+            fact_data = {"f": "question%d" % i,
+                         "b": "answer%d" % i}
+            self.controller().create_new_cards(fact_data, card_type,
+                grade=-1, tag_names=["default"], save=False)
+        now = int(time.time())
+        for card in db.cards_with_internal_ids(range(1, 21)):
+            card.grade = rng.choice([0, 1, 4])
+            card.easiness = 2.5
+            card.acq_reps = 1
+            card.last_rep = now - rng.randint(10, 100) * DAY
+            if card.grade >= 2:
+                card.ret_reps = card.ret_reps_since_lapse = rng.randint(1, 5)
+                card.next_rep = sch.midnight_UTC(now - rng.randint(-5, 5) * DAY)
+            else:
+                card.next_rep = card.last_rep
+            db.update_card(card, repetition_only=True)
+        db.save()
+        path = db.path()
+        shutil.copy(path, path + ".orig")
+        # Repetitions which happened over the last hours, including cards
+        # which get graded several times and sister cards.
+        repetitions = []
+        for i in range(100):
+            repetitions.append((rng.randint(1, 40), rng.randint(0, 5),
+                now - 3 * HOUR + 60 * i, rng.randint(1, 20)))
+
+        def grade(batched):
+            db.abandon()
+            shutil.copy(path + ".orig", path)
+            db.load(path)
+            index = db.current_log_index()
+            random.seed(0)
+            batch = [(db.card(_card_id, is_id_internal=True), grade,
+                timestamp, thinking_time) for _card_id, grade, timestamp,
+                thinking_time in repetitions]
+            if batched:
+                intervals = sch.grade_answers(batch)
+            else:
+                intervals = []
+                for card, grade, timestamp, thinking_time in batch:
+                    card = db.card(card._id, is_id_internal=True)
+                    intervals.append(sch.grade_answer(card, grade,
+                        timestamp=timestamp, thinking_time=thinking_time))
+                    db.update_card(card, repetition_only=True)
+            return intervals, \
+                db.con.execute("""select _id, grade, next_rep, last_rep,
+                easiness, acq_reps, ret_reps, lapses, acq_reps_since_lapse,
+                ret_reps_since_lapse from cards order by _id""").fetchall(), \
+                db.con.execute("""select timestamp, object_id, grade,
+                easiness, acq_reps, ret_reps, lapses, acq_reps_since_lapse,
+                ret_reps_since_lapse, scheduled_interval, actual_interval,
+                thinking_time, next_rep from log where _id>? and
+                event_type=?""", (index, EventTypes.REPETITION)).fetchall()
+
+        serial = grade(batched=False)
+        assert len(serial[2]) == 100
+        assert serial[2][0][0] == now - 3 * HOUR
+        assert grade(batched=True) == serial
+        # Through the review controller, the counters get updated as well.
+        review_controller = self.review_controller()
+        review_controller.reset()
+        card = review_controller.card
+        review_controller.grade_answers([(card, 5, now, 3)])
+        assert db.card(card._id, is_id_internal=True).grade == 5
+        counters = review_controller.counters()
+        review_controller.reload_counters()
+        assert review_controller.counters() == counters
@@ -135,6 +135,41 @@ class TestStatistics(MnemosyneTest):
         for i in range(1, 11):
             page.prepare_statistics(i)
 
+    def test_schedule_per_day(self):
+        import random
+        rng = random.Random(0)
+        db = self.database()
+        sch = self.scheduler()
+        card_type = self.card_type_with_id("1")
+        now = sch.adjusted_now()
+        for i in range(200):
+            fact_data = {"f": "question" + str(i), "b": "answer"}
+            card = self.controller().create_new_cards(fact_data, card_type,
+                grade=rng.choice([-1, 2, 3]), tag_names=["default"])[0]
+            card.next_rep = now + rng.randint(-5 * DAY, 50 * DAY)
+            card.ret_reps_since_lapse = rng.randint(0, 3)
+            db.update_card(card)
+        # Exactly at a day boundary.
+        card.grade = 2
+        card.ret_reps_since_lapse = 0
+        card.next_rep = now + 3 * DAY
+        db.update_card(card)
+        self.config()["max_ret_reps_since_lapse"] = 2
+        for i in range(100):
+            db.con.execute("""insert into log(event_type, timestamp,
+                object_id, acq_reps, ret_reps, lapses) values(?,?,?,?,?,?)""",
+                (rng.choice([EventTypes.LOADED_DATABASE,
+                EventTypes.SAVED_DATABASE]),
+                int(time.time()) - rng.randint(0, 40 * DAY),
+                rng.choice(["A", "B", "A.fut"]), rng.randint(0, 100),
+                -666, -666))
+        for start, stop in [(-40, 60), (-3, -1), (0, 1), (5, 8), (1, 1)]:
+            assert sch.card_counts_scheduled_n_days_from_now(start, stop) \
+                == [sch.card_count_scheduled_n_days_from_now(n) \
+                for n in range(start, stop)]
+        assert sum(sch.card_counts_scheduled_n_days_from_now(-40, 1)) > 0
+        assert sch.card_counts_scheduled_n_days_from_now(4, 5)[0] > 0
+
     def test_schedule_page_2(self):
         with raises(AttributeError):
             from mnemosyne.libmnemosyne.statistics_pages.schedule import Schedule
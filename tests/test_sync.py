@@ -16,6 +16,7 @@ from openSM2sync.log_entry import EventTypes
 
 from mnemosyne.version import version
 from mnemosyne_test import MnemosyneTest
+from mnemosyne.libmnemosyne.utils import decode_data
 
 from mnemosyne.libmnemosyne import Mnemosyne
 from mnemosyne.libmnemosyne.fact import Fact
@@ -1395,7 +1396,7 @@ class TestSync(object):
         assert card.easiness == 2.5
 
         criterion = self.client.database.criterion(id=2, is_id_internal=True)
-        assert criterion.data_to_string() == "(set(), {2}, set())"
+        assert decode_data(criterion.data_to_string()) == (set(), {2}, set())
         assert criterion.name == "Deck 1"
         assert len(list(self.client.database.criteria())) == 3
 
@@ -2598,7 +2599,7 @@ class TestSync(object):
             db = self.mnemosyne.database()
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
-            assert criterion.data_to_string() == "(set(), {2, 4}, set())"
+            assert decode_data(criterion.data_to_string()) == (set(), {2, 4}, set())
 
         self.server = MyServer()
         self.server.test_server = test_server
@@ -2642,7 +2643,7 @@ class TestSync(object):
             db = self.mnemosyne.database()
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
-            assert criterion.data_to_string() == "(set(), {2, 4}, {3})"
+            assert decode_data(criterion.data_to_string()) == (set(), {2, 4}, {3})
 
         self.server = MyServer()
         self.server.test_server = test_server
@@ -2688,7 +2689,7 @@ class TestSync(object):
             db = self.mnemosyne.database()
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
-            assert criterion.data_to_string() == "(set(), {2}, {3, 4})"
+            assert decode_data(criterion.data_to_string()) == (set(), {2}, {3, 4})
 
         self.server = MyServer()
         self.server.test_server = test_server
@@ -2735,7 +2736,7 @@ class TestSync(object):
             db = self.mnemosyne.database()
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
-            assert criterion.data_to_string() == "(set(), {2}, set())"
+            assert decode_data(criterion.data_to_string()) == (set(), {2}, set())
 
         self.server = MyServer()
         self.server.test_server = test_server
@@ -2779,7 +2780,7 @@ class TestSync(object):
             db = self.mnemosyne.database()
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
-            assert criterion.data_to_string() == "(set(), {2}, set())"
+            assert decode_data(criterion.data_to_string()) == (set(), {2}, set())
 
         self.server = MyServer()
         self.server.test_server = test_server
@@ -2821,7 +2822,7 @@ class TestSync(object):
             db = self.mnemosyne.database()
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
-            assert criterion.data_to_string() == "({('1::1 cloned', '1::1 cloned.1')}, {2}, set())"
+            assert decode_data(criterion.data_to_string()) == ({('1::1 cloned', '1::1 cloned.1')}, {2}, set())
 
         self.server = MyServer()
         self.server.test_server = test_server
@@ -2888,7 +2889,7 @@ class TestSync(object):
             db = self.mnemosyne.database()
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
-            assert criterion.data_to_string() == "({('5', '5.1')}, {3}, {4})"
+            assert decode_data(criterion.data_to_string()) == ({('5', '5.1')}, {3}, {4})
 
         self.server = MyServer()
         self.server.test_server = test_server
@@ -2942,7 +2943,7 @@ class TestSync(object):
             criterion = db.criterion(self.criterion_id,
                 is_id_internal=False)
             print (criterion.data_to_string())
-            assert criterion.data_to_string() == "({('5', '5.1')}, {3}, set())"
+            assert decode_data(criterion.data_to_string()) == ({('5', '5.1')}, {3}, set())
 
         self.server = MyServer()
         self.server.test_server = test_server